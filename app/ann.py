@@ -0,0 +1,362 @@
+"""
+Approximate nearest-neighbour (IVF) index for row indices, with optional
+float16 / int8 vector storage.
+
+Benchmark recall@k against exact search:
+    python -m app.ann --table TABLE_NAME [--k 10] [--queries 200] [--nprobe 8]
+    python -m app.ann --synthetic 100000 --dim 1024
+"""
+
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import config
+from .quantize import QuantizedVectors
+
+logger = logging.getLogger(__name__)
+
+ANN_INDEX_FILE = "ann_index.npz"
+# Full-precision copy of quantized vectors, memory-mapped for rerank/exact search
+ANN_FULL_VECTORS_FILE = "ann_vectors_f32.npy"
+# Size and recall figures, written on save so status reports need not load the index
+ANN_STATS_FILE = "ann_stats.json"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class IVFIndex:
+    """
+    Inverted-file index: k-means coarse quantizer + cosine scoring in probed lists.
+    Vectors are scored from `store` (float32/float16/int8); quantized indices
+    rerank the best candidates against the memory-mapped float32 copy.
+    With nlist=1 the index is an exact (optionally quantized) flat index.
+    """
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: Optional[int] = None,
+                 dtype: Optional[str] = None, rerank: Optional[int] = None):
+        self.nlist = nlist or config.ANN_NLIST
+        self.nprobe = nprobe or config.ANN_NPROBE
+        self.dtype = dtype or config.ROW_VECTOR_DTYPE
+        self.rerank = config.ROW_VECTOR_RERANK if rerank is None else rerank
+        self.ids: List[str] = []
+        self.store = QuantizedVectors(self.dtype)
+        # float32 vectors; an alias of store.data for float32 indices, a memmap after load otherwise
+        self.full = np.zeros((0, 0), dtype=np.float32)
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        # Row order grouped by list, rebuilt lazily after appends
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        # recall@k measured after the last build/quantization (appends keep it)
+        self.recall: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ─── Build / update ─────────────────────────────────────────────────────
+    def build(self, ids: Sequence[str], vectors: np.ndarray, n_iter: int = 10, seed: int = 0) -> None:
+        """Train centroids with spherical k-means and assign every vector."""
+        vectors = _normalize(vectors)
+        n = len(ids)
+        nlist = self.nlist if self.nlist > 0 else int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample; 256 points per list is plenty for a coarse quantizer
+        sample = vectors
+        if n > nlist * 256:
+            sample = vectors[rng.choice(n, nlist * 256, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            # Re-seed empty lists with random points so no list is wasted
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        self.ids = list(ids)
+        self._set_vectors(vectors)
+        self.centroids = centroids
+        self.nlist = nlist
+        self.assignments = self._assign(vectors)
+        self._order = None
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """Append vectors to their nearest existing list (centroids are not retrained)."""
+        if not len(ids):
+            return
+        vectors = _normalize(vectors)
+        if not len(self.centroids):
+            self.build(ids, vectors)
+            return
+        self.ids.extend(ids)
+        full = np.vstack([np.asarray(self.full, dtype=np.float32), vectors])
+        if self.dtype == "float32":
+            self.store.data = full
+        else:
+            self.store.append(vectors)
+        self.full = full
+        self.assignments = np.concatenate([self.assignments, self._assign(vectors)])
+        self._order = None
+
+    def _set_vectors(self, vectors: np.ndarray) -> None:
+        self.recall = {}
+        self.store = QuantizedVectors.from_float32(vectors, self.dtype)
+        self.full = self.store.data if self.dtype == "float32" else vectors
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        # Chunked to bound the (chunk x nlist) score matrix
+        for start in range(0, len(vectors), 8192):
+            chunk = vectors[start:start + 8192]
+            out[start:start + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return out
+
+    def _lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind="stable")
+            counts = np.bincount(self.assignments, minlength=self.nlist)
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self._order, self._offsets
+
+    # ─── Search ─────────────────────────────────────────────────────────────
+    def _candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        order, offsets = self._lists()
+        probes = np.argsort(-(self.centroids @ query))[:nprobe]
+        return np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes])
+
+    def search(self, query: Sequence[float], top_k: int, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return up to top_k (id, cosine score) pairs, best first."""
+        if not len(self.ids):
+            return []
+        q = _normalize(np.asarray(query, dtype=np.float32))
+        cand = self._candidates(q, min(nprobe or self.nprobe, self.nlist))
+        scores = self.store.scores(q, cand)
+        if self.dtype != "float32" and self.rerank > 0:
+            # Keep the best quantized candidates, then rescore them at full precision
+            keep = top_k * self.rerank
+            if len(scores) > keep:
+                part = np.argpartition(scores, -keep)[-keep:]
+                cand = cand[part]
+            cand = np.sort(cand)
+            scores = np.asarray(self.full[cand], dtype=np.float32) @ q
+        return self._top_k(cand, scores, top_k)
+
+    def exact_search(self, query: Sequence[float], top_k: int) -> List[Tuple[str, float]]:
+        """Brute-force reference search over every vector."""
+        if not len(self.ids):
+            return []
+        q = _normalize(np.asarray(query, dtype=np.float32))
+        return self._top_k(np.arange(len(self.ids)), np.asarray(self.full @ q, dtype=np.float32), top_k)
+
+    def _exact_rows(self, queries: np.ndarray, top_k: int) -> np.ndarray:
+        """Row numbers of the exact top_k of each query, from one chunked pass over the vectors."""
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self.ids), 65536):
+            chunk = np.asarray(self.full[start:start + 65536], dtype=np.float32)
+            chunk_rows = np.broadcast_to(np.arange(start, start + len(chunk)), (len(queries), len(chunk)))
+            rows = np.concatenate([best_rows, chunk_rows], axis=1)
+            scores = np.concatenate([best_scores, queries @ chunk.T], axis=1)
+            if scores.shape[1] > top_k:
+                part = np.argpartition(scores, -top_k, axis=1)[:, -top_k:]
+                rows, scores = np.take_along_axis(rows, part, 1), np.take_along_axis(scores, part, 1)
+            best_rows, best_scores = rows, scores
+        return best_rows
+
+    def measure_recall(self, k: int = 10, n_queries: int = 50, seed: int = 0) -> Dict[str, float]:
+        """
+        recall@k of search against exact float32 search, for queries near stored
+        vectors. Exact results come from a single pass over the vectors; run at
+        save time after a build, never for status reports.
+        """
+        if not len(self.ids):
+            return {}
+        rng = np.random.default_rng(seed)
+        picks = np.sort(rng.choice(len(self.ids), min(n_queries, len(self.ids)), replace=False))
+        base = np.asarray(self.full[picks], dtype=np.float32)
+        queries = _normalize(base + rng.normal(scale=0.02, size=base.shape).astype(np.float32))
+        exact = self._exact_rows(queries, k)
+        hits = [
+            len({self.ids[r] for r in rows} & {i for i, _ in self.search(q, k)}) / min(k, len(self.ids))
+            for q, rows in zip(queries, exact)
+        ]
+        self.recall = {f"recall@{k}": float(np.mean(hits)), "recall_vectors": len(self.ids)}
+        return self.recall
+
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        if len(scores) > top_k:
+            part = np.argpartition(scores, -top_k)[-top_k:]
+            rows, scores = rows[part], scores[part]
+        best = np.argsort(-scores, kind="stable")
+        return [(self.ids[rows[i]], float(scores[i])) for i in best]
+
+    def prefetch(self) -> int:
+        """
+        Fault in every page of the searchable (possibly quantized) vectors and
+        build the list order, so the first searches do not pay for it. The
+        float32 rerank memmap is left to page in lazily for the few candidate
+        rows it reads. Returns the bytes touched.
+        """
+        self._lists()
+        flat = np.asarray(self.store.data).reshape(-1).view(np.uint8)
+        int(flat[::4096].sum())
+        return int(flat.nbytes)
+
+    # ─── Persistence ────────────────────────────────────────────────────────
+    @property
+    def memory_bytes(self) -> int:
+        """Resident size of the searchable data (the float32 memmap is not counted)."""
+        return int(self.store.nbytes + self.centroids.nbytes + self.assignments.nbytes)
+
+    def save(self, persist_dir: str) -> None:
+        if not self.recall:
+            self.measure_recall()
+        out = Path(persist_dir) / ANN_INDEX_FILE
+        full_out = Path(persist_dir) / ANN_FULL_VECTORS_FILE
+        if self.dtype != "float32":
+            tmp_full = full_out.with_name("ann_vectors_f32.tmp.npy")
+            np.save(tmp_full, np.asarray(self.full, dtype=np.float32))
+            # Release the memmap of the file being replaced before swapping it in
+            self.full = np.array(self.full, dtype=np.float32)
+            tmp_full.replace(full_out)
+        else:
+            full_out.unlink(missing_ok=True)
+        tmp = out.with_name("ann_index.tmp.npz")
+        arrays = dict(
+            ids=np.asarray(self.ids, dtype=str),
+            data=self.store.data,
+            centroids=self.centroids,
+            assignments=self.assignments,
+            params=np.asarray([self.nlist, self.nprobe, self.rerank], dtype=np.int64),
+            dtype=np.asarray(self.dtype),
+        )
+        if self.store.scales is not None:
+            arrays["scales"] = self.store.scales
+        np.savez(tmp, **arrays)
+        tmp.replace(out)
+        stats_out = Path(persist_dir) / ANN_STATS_FILE
+        stats_out.with_suffix(".tmp").write_text(json.dumps(self.stats()), encoding="utf-8")
+        stats_out.with_suffix(".tmp").replace(stats_out)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "IVFIndex":
+        with np.load(Path(persist_dir) / ANN_INDEX_FILE) as data:
+            params = [int(x) for x in data["params"]]
+            dtype = str(data["dtype"]) if "dtype" in data else "float32"
+            rerank = params[2] if len(params) > 2 else None
+            idx = cls(nlist=params[0], nprobe=params[1], dtype=dtype, rerank=rerank)
+            idx.ids = data["ids"].tolist()
+            idx.store.data = data["data"] if "data" in data else data["vectors"]
+            idx.store.scales = data["scales"] if "scales" in data else None
+            idx.centroids = data["centroids"]
+            idx.assignments = data["assignments"]
+        if dtype == "float32":
+            idx.full = idx.store.data
+        else:
+            idx.full = np.load(Path(persist_dir) / ANN_FULL_VECTORS_FILE, mmap_mode="r")
+        saved = cls.read_stats(persist_dir) or {}
+        idx.recall = {k: v for k, v in saved.items() if k.startswith("recall")}
+        return idx
+
+    def stats(self) -> Dict[str, float]:
+        """Size, memory footprint and the measured recall, for status reports."""
+        return {
+            "vectors": len(self.ids),
+            "dtype": self.dtype,
+            "nlist": self.nlist,
+            "memory_bytes": self.memory_bytes,
+            "float32_bytes": int(len(self.ids) * self.full.shape[1] * 4) if len(self.ids) else 0,
+            **self.recall,
+        }
+
+    @staticmethod
+    def read_stats(persist_dir: str) -> Optional[Dict[str, float]]:
+        """The figures saved with the index, without loading it (None for indices saved before they existed)."""
+        try:
+            return json.loads((Path(persist_dir) / ANN_STATS_FILE).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return (Path(persist_dir) / ANN_INDEX_FILE).exists()
+
+    @staticmethod
+    def remove(persist_dir: str) -> None:
+        """Delete a saved index with its full-precision vectors and stats."""
+        for name in (ANN_INDEX_FILE, ANN_FULL_VECTORS_FILE, ANN_STATS_FILE):
+            (Path(persist_dir) / name).unlink(missing_ok=True)
+
+
+def recall_at_k(index: IVFIndex, queries: np.ndarray, k: int, nprobe: Optional[int] = None) -> Dict[str, float]:
+    """Mean recall@k of the IVF search against exact search, plus mean latencies."""
+    recalls, ann_ms, exact_ms = [], [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        exact = {i for i, _ in index.exact_search(q, k)}
+        t1 = time.perf_counter()
+        approx = {i for i, _ in index.search(q, k, nprobe=nprobe)}
+        t2 = time.perf_counter()
+        recalls.append(len(exact & approx) / max(1, len(exact)))
+        exact_ms.append((t1 - t0) * 1000)
+        ann_ms.append((t2 - t1) * 1000)
+    return {
+        "recall": float(np.mean(recalls)),
+        "ann_ms": float(np.mean(ann_ms)),
+        "exact_ms": float(np.mean(exact_ms)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall@k against exact search")
+    parser.add_argument("--table", type=str, help="Benchmark the persisted ANN index of this table")
+    parser.add_argument("--synthetic", type=int, help="Benchmark on N synthetic clustered vectors instead")
+    parser.add_argument("--dim", type=int, default=1024, help="Dimension for --synthetic")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="*", help="nprobe values to sweep")
+    parser.add_argument("--dtype", type=str, help="Storage dtype for --synthetic (float32, float16, int8)")
+    args = parser.parse_args()
+    logging.basicConfig(level=config.LOG_LEVEL)
+    rng = np.random.default_rng(0)
+
+    if args.table:
+        index = IVFIndex.load(str(Path(config.TABLE_INDEX_DIR) / args.table))
+    elif args.synthetic:
+        centers = rng.normal(size=(max(1, args.synthetic // 500), args.dim))
+        vecs = centers[rng.integers(len(centers), size=args.synthetic)]
+        vecs += rng.normal(scale=0.3, size=vecs.shape)
+        index = IVFIndex(dtype=args.dtype)
+        t0 = time.perf_counter()
+        index.build([str(i) for i in range(args.synthetic)], vecs)
+        print(f"Built IVF (nlist={index.nlist}) over {len(index)} vectors in {time.perf_counter() - t0:.1f}s")
+    else:
+        parser.error("one of --table or --synthetic is required")
+
+    # Queries: stored vectors with noise, so they are near but not identical to a row
+    picks = rng.choice(len(index), min(args.queries, len(index)), replace=False)
+    base = np.asarray(index.full[np.sort(picks)], dtype=np.float32)
+    queries = base + rng.normal(scale=0.02, size=base.shape)
+    print(f"dtype={index.dtype} memory={index.memory_bytes / 2**20:.1f} MiB")
+    for nprobe in args.nprobe or [index.nprobe]:
+        r = recall_at_k(index, queries.astype(np.float32), args.k, nprobe=nprobe)
+        print(f"nprobe={nprobe:<4} recall@{args.k}={r['recall']:.3f}  "
+              f"ann={r['ann_ms']:.2f}ms  exact={r['exact_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import logging
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import config
+from .metrics import metrics
+from .prompts import (
+    ANSWER_EMPTY_TEMPLATE,
+    ANSWER_SERIES_LINE_TEMPLATE,
+    ANSWER_SERIES_TEMPLATE,
+    ANSWER_SINGLE_VALUE_PERIOD_TEMPLATE,
+    ANSWER_SINGLE_VALUE_TEMPLATE,
+)
+from .rows import row_serializer
+
+logger = logging.getLogger(__name__)
+
+_PERIOD_NAMES = {"period", "year", "yr", "date", "month", "quarter", "он", "огноо"}
+_PERIOD_HINTS = ("он", "огноо", "хугацаа", "year", "period", "date")
+_PERIOD_VALUE_RE = re.compile(r"^(19|20)\d{2}(\s*[-/.]?\s*(\d{1,2}|[IV]+|Q[1-4]))*\b")
+_FROM_RE = re.compile(r'\b(?:from|join)\s+(?:"?\w+"?\.)?"?(\w+)"?', re.IGNORECASE)
+
+
+class AnswerFormatter:
+    """
+    Renders simple SQL results (empty, one value, a short period series)
+    straight from Mongolian templates so no synthesis LLM call is needed.
+    """
+
+    def format(self, sql_query: str, sql_results, table_infos: Sequence[Dict]) -> Optional[str]:
+        """Return the answer text, or None if the result needs LLM synthesis."""
+        policy = config.SYNTHESIS_BYPASS
+        if policy == "off":
+            return None
+        try:
+            parsed = self._result_table(sql_results)
+            if parsed is None:
+                return None
+            col_keys, rows = parsed
+            if not rows:
+                return self._count("empty", ANSWER_EMPTY_TEMPLATE)
+
+            descriptions = self._column_descriptions(sql_query, table_infos)
+            roles = self._column_roles(col_keys, rows, descriptions)
+            if roles is None:
+                return None
+            period_idx, value_idx, label_idxs = roles
+            # The label must be the same on every row
+            labels = {tuple(self._text(r[i]) for i in label_idxs) for r in rows}
+            if len(labels) != 1:
+                return None
+            label = ", ".join(t for t in labels.pop() if t) or self._describe(col_keys[value_idx], descriptions)
+
+            if len(rows) == 1:
+                value = self._number(rows[0][value_idx])
+                if period_idx is None:
+                    return self._count("single", ANSWER_SINGLE_VALUE_TEMPLATE.format(label=label, value=value))
+                return self._count("single", ANSWER_SINGLE_VALUE_PERIOD_TEMPLATE.format(
+                    period=self._text(rows[0][period_idx]), label=label, value=value))
+
+            if policy != "all" or period_idx is None or len(rows) > config.SYNTHESIS_BYPASS_MAX_ROWS:
+                return None
+            periods = [self._text(r[period_idx]) for r in rows]
+            if len(set(periods)) != len(periods):
+                return None
+            lines = "\n".join(
+                ANSWER_SERIES_LINE_TEMPLATE.format(period=p, value=self._number(r[value_idx]))
+                for p, r in zip(periods, rows)
+            )
+            return self._count("series", ANSWER_SERIES_TEMPLATE.format(label=label, lines=lines))
+        except Exception as e:
+            logger.error(f"Error formatting answer directly: {e}")
+            return None
+
+    @staticmethod
+    def _count(shape: str, answer: str) -> str:
+        metrics.incr(f"synthesis.bypass.{shape}")
+        metrics.incr("synthesis.bypass")
+        return answer
+
+    @staticmethod
+    def _result_table(sql_results) -> Optional[Tuple[List[str], List[Sequence[Any]]]]:
+        """(col_keys, rows) from SQLRetriever nodes; None when the SQL errored."""
+        if not sql_results:
+            return None
+        metadata = sql_results[0].node.metadata
+        if "result" not in metadata or "col_keys" not in metadata:
+            return None
+        return list(metadata["col_keys"]), list(metadata["result"])
+
+    @staticmethod
+    def _column_descriptions(sql_query: str, table_infos: Sequence[Dict]) -> Dict[str, str]:
+        tables = {m.group(1).lower() for m in _FROM_RE.finditer(sql_query)}
+        descriptions: Dict[str, str] = {}
+        for info in table_infos:
+            if info["original_table_name"].lower() in tables:
+                descriptions.update(info.get("column_descriptions", {}))
+        return descriptions
+
+    def _column_roles(self, col_keys: List[str], rows, descriptions: Dict[str, str]):
+        """(period index, value index, label indices) or None for shapes we do not template."""
+        period_idx, values, labels = None, [], []
+        for i, col in enumerate(col_keys):
+            sample = next((r[i] for r in rows if r[i] is not None), None)
+            desc = descriptions.get(col, "").lower()
+            named = col.lower() in _PERIOD_NAMES or any(h in col.lower() for h in ("period", "year"))
+            described = any(re.search(rf"\b{h}\b", desc) for h in _PERIOD_HINTS) and self._looks_like_period(sample)
+            if period_idx is None and (named or described):
+                period_idx = i
+            elif isinstance(sample, (int, float, Decimal)) and not isinstance(sample, bool):
+                values.append(i)
+            elif isinstance(sample, str) or sample is None:
+                labels.append(i)
+            else:
+                return None
+        # Codes are identifiers, not the value being asked about
+        if len(values) > 1:
+            values = [i for i in values if not col_keys[i].lower().startswith("code")]
+        if len(values) != 1:
+            return None
+        # Prefer Mongolian descriptors over their English counterparts
+        names = {col_keys[i].lower() for i in labels}
+        labels = [i for i in labels if "_eng" not in col_keys[i].lower()
+                  or col_keys[i].lower().replace("_eng", "_mn") not in names]
+        return period_idx, values[0], labels
+
+    @staticmethod
+    def _looks_like_period(value: Any) -> bool:
+        if isinstance(value, (datetime, date)):
+            return True
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            return False
+        return bool(_PERIOD_VALUE_RE.match(str(value).strip()))
+
+    @staticmethod
+    def _describe(col: str, descriptions: Dict[str, str]) -> str:
+        """Short label for a value column from its generated description."""
+        desc = descriptions.get(col, "").strip()
+        if not desc:
+            return col
+        return re.split(r"[.;(]", desc, maxsplit=1)[0].strip() or col
+
+    @staticmethod
+    def _text(value: Any) -> str:
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return row_serializer.format_value(value) or ""
+
+    @staticmethod
+    def _number(value: Any) -> str:
+        txt = row_serializer.format_value(value) or ""
+        if isinstance(value, str) or not re.fullmatch(r"-?\d+(\.\d+)?", txt):
+            return txt
+        sign, txt = ("-", txt[1:]) if txt.startswith("-") else ("", txt)
+        whole, _, frac = txt.partition(".")
+        whole = f"{int(whole):,}"
+        return sign + whole + (f".{frac}" if frac else "")
+
+
+answer_formatter = AnswerFormatter()
@@ -0,0 +1,129 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .config import config
+from .context_budget import TableContext
+from .metrics import metrics
+from .query_embedding import query_embeddings
+from .sql_validator import SQLValidationError
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def parse_questions(lines: Iterable[str]) -> List[Dict]:
+    """
+    Read batch input: one question per line, either a JSON string or an object
+    with "question" (or "message") and an optional "id".
+    """
+    items = []
+    for n, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            data = line
+        if isinstance(data, str):
+            data = {"question": data}
+        if not isinstance(data, dict):
+            raise ValueError(f"Line {n}: expected a JSON object or string")
+        question = (data.get("question") or data.get("message") or "").strip()
+        if not question:
+            raise ValueError(f"Line {n}: missing question")
+        items.append({"id": data.get("id", len(items)), "question": question})
+    return items
+
+
+class BatchRunner:
+    """
+    Answers many questions at once: embeds them in batched calls, retrieves
+    tables once per question, groups questions by table set so schema context
+    is built once per table, and runs the LLM stages with bounded concurrency.
+    """
+
+    def __init__(self, pipeline, concurrency: Optional[int] = None):
+        self.pipeline = pipeline
+        self.concurrency = concurrency or config.BATCH_CONCURRENCY
+
+    def run(self, items: List[Dict]) -> Iterator[Dict]:
+        """Yield one result dict per item, in completion order."""
+        if len(items) > config.BATCH_MAX_QUESTIONS:
+            raise ValueError(f"Batch has {len(items)} questions, limit is {config.BATCH_MAX_QUESTIONS}")
+        if not items:
+            return
+        self.pipeline.auto_refresh_if_needed()
+        batch_start = time.perf_counter()
+
+        start = time.perf_counter()
+        embeddings = self.pipeline.embed_questions([it["question"] for it in items])
+        embed_s = (time.perf_counter() - start) / len(items)
+
+        # Table retrieval is cheap once the embeddings exist; group by the retrieved table set
+        groups: Dict[tuple, List[Dict]] = {}
+        for index, item in enumerate(items):
+            start = time.perf_counter()
+            try:
+                with query_embeddings.request_scope({item["question"]: embeddings[item["question"]]}):
+                    tables = self.pipeline._retrieve_tables(item["question"])
+            except Exception as e:
+                # One question's failure is its own error result, as in _answer_one
+                logger.error(f"Batch question {item['id']!r} failed: {e}")
+                metrics.incr("batch.error")
+                retrieval_s = time.perf_counter() - start
+                yield {"index": index, "id": item["id"], "question": item["question"], "status": "error",
+                       "error": str(e), "timings": {"embed_s": round(embed_s, 4), "retrieval_s": round(retrieval_s, 4),
+                                                    "total_s": round(embed_s + retrieval_s, 4)}}
+                continue
+            work = dict(item, index=index, tables=tables,
+                        timings={"embed_s": round(embed_s, 4), "retrieval_s": round(time.perf_counter() - start, 4)})
+            groups.setdefault(tuple(sorted(t.table_name for t in tables)), []).append(work)
+        logger.info(f"Batch of {len(items)} questions in {len(groups)} table groups")
+
+        # Submitting group by group keeps prompts with the same schema prefix close together
+        table_contexts: Dict[str, TableContext] = {}
+        ordered = [work for group in groups.values() for work in group]
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch")
+        try:
+            futures = [pool.submit(self._answer_one, work, embeddings, table_contexts) for work in ordered]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # A client that disconnects closes this generator: drop the questions not started yet
+            # and let the in-flight ones finish in the background instead of waiting for them here
+            pool.shutdown(wait=False, cancel_futures=True)
+        metrics.observe("batch.total", time.perf_counter() - batch_start)
+
+    def _answer_one(self, work: Dict, embeddings: Dict, table_contexts: Dict[str, TableContext]) -> Dict:
+        question = work["question"]
+        timings = work["timings"]
+        result = {"index": work["index"], "id": work["id"], "question": question}
+        start = time.perf_counter()
+        try:
+            with tracer.trace(question=question) as trace, \
+                    query_embeddings.request_scope({question: embeddings[question]}):
+                result["request_id"] = trace.request_id
+                answer = self.pipeline.answer(question, work["tables"], table_contexts, timings)
+            result.update(status="success", response=answer["response"],
+                          sql_query=answer["sql_query"], tables=answer["tables"],
+                          truncated=answer.get("truncated", False))
+            metrics.incr("batch.success")
+        except SQLValidationError as e:
+            result.update(status="error", error_type="invalid_sql", error=str(e), sql_query=e.sql)
+            metrics.incr("batch.error")
+        except Exception as e:
+            logger.error(f"Batch question {work['id']!r} failed: {e}")
+            result.update(status="error", error=str(e))
+            metrics.incr("batch.error")
+        timings["total_s"] = round(time.perf_counter() - start + timings["embed_s"] + timings["retrieval_s"], 4)
+        result["timings"] = timings
+        return result
+
+
+def to_jsonl(results: Iterable[Dict]) -> Iterator[str]:
+    for result in results:
+        yield json.dumps(result, ensure_ascii=False) + "\n"
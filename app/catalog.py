@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+_ID_COLUMNS = ("id", "ID", "Id")
+
+# Tables, columns and key constraints of the current schema in one round trip
+_CATALOG_SQL = text(
+    """
+    SELECT
+      (SELECT json_agg(t) FROM (
+         SELECT c.relname AS table_name,
+                GREATEST(c.reltuples, 0)::bigint AS row_estimate,
+                obj_description(c.oid, 'pg_class') AS comment
+         FROM pg_catalog.pg_class c
+         JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+      ) t) AS tables,
+      (SELECT json_agg(t ORDER BY t.table_name, t.ordinal_position) FROM (
+         SELECT col.table_name, col.column_name, col.data_type, col.ordinal_position,
+                col.is_nullable = 'YES' AS nullable,
+                col_description(format('%I.%I', col.table_schema, col.table_name)::regclass,
+                                col.ordinal_position) AS comment
+         FROM information_schema.columns col
+         WHERE col.table_schema = current_schema()
+      ) t) AS columns,
+      (SELECT json_agg(t) FROM (
+         SELECT con.contype AS kind, cl.relname AS table_name,
+                ARRAY(SELECT a.attname FROM unnest(con.conkey) WITH ORDINALITY k(attnum, ord)
+                      JOIN pg_catalog.pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                      ORDER BY k.ord) AS columns,
+                ref.relname AS referred_table,
+                ARRAY(SELECT a.attname FROM unnest(con.confkey) WITH ORDINALITY k(attnum, ord)
+                      JOIN pg_catalog.pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+                      ORDER BY k.ord) AS referred_columns
+         FROM pg_catalog.pg_constraint con
+         JOIN pg_catalog.pg_class cl ON cl.oid = con.conrelid
+         JOIN pg_catalog.pg_namespace n ON n.oid = cl.relnamespace
+         LEFT JOIN pg_catalog.pg_class ref ON ref.oid = con.confrelid
+         WHERE n.nspname = current_schema() AND con.contype IN ('p', 'f')
+      ) t) AS constraints
+    """
+)
+
+
+class TableCatalog:
+    """Structure of one table as recorded in a catalog snapshot."""
+
+    def __init__(self, name: str, row_estimate: int = 0, comment: Optional[str] = None):
+        self.name = name
+        self.row_estimate = row_estimate
+        self.comment = comment
+        self.columns: List[Dict] = []  # {"name", "type", "nullable", "comment"}
+        self.primary_key: List[str] = []
+        self.foreign_keys: List[Dict] = []  # {"constrained_columns", "referred_table", "referred_columns"}
+
+    @property
+    def column_names(self) -> List[str]:
+        return [c["name"] for c in self.columns]
+
+    @property
+    def fingerprint(self) -> str:
+        """Hash of the column names and types (changes when the table's structure does)."""
+        text_ = "\n".join(f"{c['name']} ({c['type']})" for c in self.columns)
+        return hashlib.sha256(text_.encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def id_column(self) -> Optional[str]:
+        """Column used to track new rows ('id', 'ID' or 'Id'), if any."""
+        return next((name for name in self.column_names if name in _ID_COLUMNS), None)
+
+
+class CatalogSnapshot:
+    """
+    Tables, columns, types, primary keys, estimated row counts and foreign keys
+    of the current schema, loaded with one set-based query. `version` changes
+    whenever the structure does (row estimates are not part of it).
+    """
+
+    def __init__(self, tables: Dict[str, TableCatalog]):
+        self.tables = tables
+        self.loaded_at = time.monotonic()
+        structure = {
+            name: [t.columns, t.primary_key, t.foreign_keys] for name, t in sorted(tables.items())
+        }
+        self.version = hashlib.sha256(
+            json.dumps(structure, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, conn: Connection) -> "CatalogSnapshot":
+        start = time.perf_counter()
+        row = conn.execute(_CATALOG_SQL).one()
+        snapshot = cls.from_rows(row.tables or [], row.columns or [], row.constraints or [])
+        logger.info(f"Loaded catalog of {len(snapshot.tables)} tables in {time.perf_counter() - start:.2f}s "
+                    f"(version {snapshot.version})")
+        return snapshot
+
+    @classmethod
+    def from_rows(cls, tables: List[Dict], columns: List[Dict], constraints: List[Dict]) -> "CatalogSnapshot":
+        by_name = {t["table_name"]: TableCatalog(t["table_name"], t["row_estimate"] or 0, t["comment"]) for t in tables}
+        for c in columns:
+            table = by_name.get(c["table_name"])
+            if table is not None:
+                table.columns.append({
+                    "name": c["column_name"], "type": c["data_type"],
+                    "nullable": c["nullable"], "comment": c["comment"],
+                })
+        for con in constraints:
+            table = by_name.get(con["table_name"])
+            if table is None:
+                continue
+            if con["kind"] == "p":
+                table.primary_key = list(con["columns"])
+            else:
+                table.foreign_keys.append({
+                    "constrained_columns": list(con["columns"]),
+                    "referred_table": con["referred_table"],
+                    "referred_columns": list(con["referred_columns"]),
+                })
+        return cls(by_name)
+
+    def table_names(self) -> List[str]:
+        return sorted(self.tables)
+
+    def get(self, table_name: str) -> Optional[TableCatalog]:
+        return self.tables.get(table_name)
@@ -20,6 +20,29 @@ class Config:
             f"postgresql+psycopg2://{self.DB_USER}:" 
             f"{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
         )
+
+    # Connection pools: "interactive" (chat SQL), "batch" (indexing scans, row
+    # counts) and "export" (row downloads, which fail fast with 503 when all are
+    # busy). Each may point at a read replica; empty URL = the primary above.
+    DB_INTERACTIVE_URL: str = os.getenv("DB_INTERACTIVE_URL", "")
+    DB_INTERACTIVE_POOL_SIZE: int = int(os.getenv("DB_INTERACTIVE_POOL_SIZE", "5"))
+    DB_INTERACTIVE_MAX_OVERFLOW: int = int(os.getenv("DB_INTERACTIVE_MAX_OVERFLOW", "5"))
+    DB_INTERACTIVE_POOL_TIMEOUT: float = float(os.getenv("DB_INTERACTIVE_POOL_TIMEOUT", "10"))
+    DB_BATCH_URL: str = os.getenv("DB_BATCH_URL", "")
+    DB_BATCH_POOL_SIZE: int = int(os.getenv("DB_BATCH_POOL_SIZE", "2"))
+    DB_BATCH_MAX_OVERFLOW: int = int(os.getenv("DB_BATCH_MAX_OVERFLOW", "0"))
+    DB_BATCH_POOL_TIMEOUT: float = float(os.getenv("DB_BATCH_POOL_TIMEOUT", "300"))
+    DB_EXPORT_URL: str = os.getenv("DB_EXPORT_URL", "")
+    DB_EXPORT_POOL_SIZE: int = int(os.getenv("DB_EXPORT_POOL_SIZE", "2"))
+    DB_EXPORT_MAX_OVERFLOW: int = int(os.getenv("DB_EXPORT_MAX_OVERFLOW", "0"))
+    DB_EXPORT_POOL_TIMEOUT: float = float(os.getenv("DB_EXPORT_POOL_TIMEOUT", "2"))
+    # Streaming reads: rows per server-side cursor fetch and per keyset page
+    DB_FETCH_SIZE: int = int(os.getenv("DB_FETCH_SIZE", "2000"))
+    DB_PAGE_SIZE: int = int(os.getenv("DB_PAGE_SIZE", "50000"))
+    # Rows kept from a generated SQL query's result (0 = no limit)
+    SQL_MAX_RESULT_ROWS: int = int(os.getenv("SQL_MAX_RESULT_ROWS", "1000"))
+    # Seconds a schema catalog snapshot is reused before it is reloaded
+    CATALOG_TTL_S: float = float(os.getenv("CATALOG_TTL_S", "300"))
     
     # ─── LLM BACKEND SELECTION ────────────────────────────────────────────────    
     # "ollama" or "openai"
@@ -30,6 +53,8 @@ class Config:
     OLLAMA_EMBED_MODEL: str = os.getenv("OLLAMA_EMBED_MODEL", "mxbai-embed-large:latest")
     OLLAMA_REQUEST_TIMEOUT: float = float(os.getenv("OLLAMA_REQUEST_TIMEOUT", "600.0"))
     OLLAMA_HOST: str = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    # How long Ollama keeps the model loaded between requests
+    OLLAMA_KEEP_ALIVE: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
     # ─── OpenAI Configuration ────────────────────────────────────────────────
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
@@ -38,10 +63,69 @@ class Config:
     OPENAI_EMBED_MODEL: str = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
     OPENAI_REQUEST_TIMEOUT: float = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "300.0"))
     
+    # ─── Embedding Backend ───────────────────────────────────────────────────
+    # "" (same as LLM_BACKEND), "ollama", "openai", "local" (in-process ONNX model
+    # on the CPU) or "hash" (deterministic, no model; for tests). Vectors of
+    # different backends are not comparable: rebuild indices after switching
+    # (python -m app.update_index --force-full).
+    EMBED_BACKEND: str = os.getenv("EMBED_BACKEND", "").lower()
+    # Directory with model.onnx and tokenizer.json (e.g. an ONNX export of the Ollama embedding model)
+    LOCAL_EMBED_MODEL_DIR: str = os.getenv("LOCAL_EMBED_MODEL_DIR", "models/embed")
+    LOCAL_EMBED_BATCH_SIZE: int = int(os.getenv("LOCAL_EMBED_BATCH_SIZE", "32"))
+    LOCAL_EMBED_MAX_LENGTH: int = int(os.getenv("LOCAL_EMBED_MAX_LENGTH", "512"))
+    # "cls" (BERT-style retrieval models such as mxbai-embed-large) or "mean"
+    LOCAL_EMBED_POOLING: str = os.getenv("LOCAL_EMBED_POOLING", "cls").lower()
+    # Prefix for questions (not rows), if the model was trained with one
+    LOCAL_EMBED_QUERY_INSTRUCTION: str = os.getenv("LOCAL_EMBED_QUERY_INSTRUCTION", "")
+    # Batches embedded concurrently, and onnxruntime threads per batch (0 = all cores)
+    LOCAL_EMBED_WORKERS: int = int(os.getenv("LOCAL_EMBED_WORKERS", "2"))
+    LOCAL_EMBED_THREADS: int = int(os.getenv("LOCAL_EMBED_THREADS", "0"))
+    HASH_EMBED_DIM: int = int(os.getenv("HASH_EMBED_DIM", "384"))
+
+    # LLM startup check: "background" (default), "sync" (block until the model answers) or "off"
+    LLM_HEALTHCHECK: str = os.getenv("LLM_HEALTHCHECK", "background").lower()
+
+    # ─── LLM Client Pool ─────────────────────────────────────────────────────
+    # Concurrent in-flight generations and pooled keep-alive HTTP connections
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    LLM_POOL_SIZE: int = int(os.getenv("LLM_POOL_SIZE", "16"))
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120.0"))
+    # Per-call timeout for query-time calls (index builds keep the backend timeout)
+    LLM_CALL_TIMEOUT: float = float(os.getenv("LLM_CALL_TIMEOUT", "120.0"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_RETRY_BACKOFF: float = float(os.getenv("LLM_RETRY_BACKOFF", "1.0"))
+
+    # Sampling temperature for both backends (unset = backend default)
+    LLM_TEMPERATURE: Optional[float] = (
+        float(os.environ["LLM_TEMPERATURE"]) if os.getenv("LLM_TEMPERATURE") else None
+    )
+
+    # ─── LLM Completion Cache ────────────────────────────────────────────────
+    # Disk cache of completions; only used when LLM_TEMPERATURE=0
+    LLM_CACHE: bool = os.getenv("LLM_CACHE", "False").lower() in ("true", "1", "yes")
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "")  # empty = <TABLE_INDEX_DIR>/llm_cache.sqlite
+    LLM_CACHE_MAX_MB: float = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+
     # ─── Application Configuration ───────────────────────────────────────────
     DEBUG: bool = os.getenv("DEBUG", "False").lower() in ("true", "1", "yes")
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # ─── Request Tracing ─────────────────────────────────────────────────────
+    # Structured per-request traces (stage inputs/outputs/timings), kept for
+    # lookup at /api/admin/traces/<request_id> and written as JSON lines
+    TRACE_ENABLED: bool = os.getenv("TRACE_ENABLED", "True").lower() in ("true", "1", "yes")
+    # Fraction of requests traced; failed requests and "X-Trace: 1" requests are always kept
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+    TRACE_MAX_PAYLOAD_CHARS: int = int(os.getenv("TRACE_MAX_PAYLOAD_CHARS", "2000"))
+    TRACE_MAX_EVENTS: int = int(os.getenv("TRACE_MAX_EVENTS", "50"))
+    TRACE_BUFFER_SIZE: int = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+    TRACE_QUEUE_SIZE: int = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+    TRACE_LOG_PATH: str = os.getenv("TRACE_LOG_PATH", "")  # empty = stderr
+    # Required in the X-Admin-Token header of admin endpoints; without it they answer 404
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+    # Development only: serve admin endpoints without a token when ADMIN_TOKEN is unset
+    ADMIN_OPEN: bool = os.getenv("ADMIN_OPEN", "False").lower() in ("true", "1", "yes")
+
     # ─── Storage Configuration ───────────────────────────────────────────────
     TABLE_INFO_DIR: str = os.getenv("TABLE_INFO_DIR", "PostgreSQL_TableInfo")
     TABLE_INDEX_DIR: str = os.getenv("TABLE_INDEX_DIR", "table_index_dir")
@@ -54,8 +138,121 @@ class Config:
     MAX_TABLE_RETRIEVAL: int = int(os.getenv("MAX_TABLE_RETRIEVAL", "3"))
     MAX_ROW_RETRIEVAL: int = int(os.getenv("MAX_ROW_RETRIEVAL", "2"))
     MAX_ROWS_PER_TABLE: int = int(os.getenv("MAX_ROWS_PER_TABLE", "500"))
-    
-    def __init__(self):
+    # Cross-request LRU of question embeddings (0 disables)
+    QUERY_EMBED_CACHE_SIZE: int = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "256"))
+    # Example-row retrieval: "dense", "lexical" (BM25 only) or "hybrid" (RRF of both)
+    ROW_RETRIEVAL_MODE: str = os.getenv("ROW_RETRIEVAL_MODE", "hybrid").lower()
+    ROW_FUSION_CANDIDATES: int = int(os.getenv("ROW_FUSION_CANDIDATES", "10"))
+
+    # ─── Text2SQL Context Budget ─────────────────────────────────────────────
+    # Token budget for the schema context in the text2sql prompt (0 disables trimming)
+    TEXT2SQL_CONTEXT_TOKENS: int = int(os.getenv("TEXT2SQL_CONTEXT_TOKENS", "1500"))
+    # Columns always kept when unrelated columns are pruned from the context
+    CONTEXT_KEEP_COLUMNS: str = os.getenv(
+        "CONTEXT_KEEP_COLUMNS", "period,code,code1,dtval_co,scr_mn,scr_mn1,scr_eng,scr_eng1"
+    )
+    # Example row values are cut to this many characters once trimming starts
+    CONTEXT_ROW_VALUE_CHARS: int = int(os.getenv("CONTEXT_ROW_VALUE_CHARS", "60"))
+    # Hugging Face tokenizer matching the Ollama model (empty = tiktoken estimate,
+    # calibrated by the prompt token counts the backend reports)
+    CONTEXT_TOKENIZER: str = os.getenv("CONTEXT_TOKENIZER", "")
+
+    # ─── ANN Row Index Configuration ─────────────────────────────────────────
+    # Tables with at least this many rows get an IVF index (0 disables)
+    ANN_MIN_ROWS: int = int(os.getenv("ANN_MIN_ROWS", "20000"))
+    ANN_NLIST: int = int(os.getenv("ANN_NLIST", "0"))  # 0 = 4 * sqrt(rows)
+    ANN_NPROBE: int = int(os.getenv("ANN_NPROBE", "8"))
+    # Vector storage chosen at index build time: "float32", "float16" or "int8".
+    # Non-float32 tables keep their embeddings only in the ANN files.
+    ROW_VECTOR_DTYPE: str = os.getenv("ROW_VECTOR_DTYPE", "float32").lower()
+    # Quantized search reranks top_k * ROW_VECTOR_RERANK candidates in float32 (0 disables)
+    ROW_VECTOR_RERANK: int = int(os.getenv("ROW_VECTOR_RERANK", "4"))
+
+    # ─── Sharded Row Indices ─────────────────────────────────────────────────
+    # Tables whose row index is split across shard worker processes (python -m app.shards)
+    ROW_SHARDED_TABLES: str = os.getenv("ROW_SHARDED_TABLES", "")
+    ROW_SHARDS: int = int(os.getenv("ROW_SHARDS", "4"))
+    # Workers listen on ROW_SHARD_HOST, one port per (table, shard) from ROW_SHARD_BASE_PORT
+    ROW_SHARD_HOST: str = os.getenv("ROW_SHARD_HOST", "127.0.0.1")
+    ROW_SHARD_BASE_PORT: int = int(os.getenv("ROW_SHARD_BASE_PORT", "7700"))
+    # Per-shard query timeout; slower shards are left out of the merged result
+    ROW_SHARD_TIMEOUT: float = float(os.getenv("ROW_SHARD_TIMEOUT", "2.0"))
+    # Incremental updates add a segment per shard; past this many a shard's segments are merged into one
+    ROW_SHARD_MAX_SEGMENTS: int = int(os.getenv("ROW_SHARD_MAX_SEGMENTS", "8"))
+
+    # ─── Row Document Configuration ─────────────────────────────────────────
+    # Comma-separated columns to keep in the embedded row text (empty = all).
+    # Columns missing from a table are ignored; if none match, all are kept.
+    ROW_TEXT_COLUMNS: str = os.getenv("ROW_TEXT_COLUMNS", "")
+    ROW_TEXT_MAX_VALUE_CHARS: int = int(os.getenv("ROW_TEXT_MAX_VALUE_CHARS", "200"))
+
+    # ─── SQL Template Cache ──────────────────────────────────────────────────
+    # Reuse SQL from earlier questions of the same shape instead of calling text2sql
+    SQL_TEMPLATE_CACHE: bool = os.getenv("SQL_TEMPLATE_CACHE", "True").lower() in ("true", "1", "yes")
+    SQL_TEMPLATE_MAX: int = int(os.getenv("SQL_TEMPLATE_MAX", "500"))
+    # 1.0 = exact pattern matches only. Below 1.0, number-only templates also match
+    # questions that differ only in stopwords or punctuation, never in content words
+    SQL_TEMPLATE_MIN_SIMILARITY: float = float(os.getenv("SQL_TEMPLATE_MIN_SIMILARITY", "1.0"))
+
+    # ─── Request Coalescing ──────────────────────────────────────────────────
+    # Identical (normalized) standalone questions arriving while one is being
+    # answered wait for it and share its answer instead of running again
+    SINGLE_FLIGHT: bool = os.getenv("SINGLE_FLIGHT", "True").lower() in ("true", "1", "yes")
+
+    # ─── Answer Synthesis ────────────────────────────────────────────────────
+    # Template answers instead of the synthesis LLM call: "off", "simple"
+    # (empty result or a single value) or "all" (also short period series)
+    SYNTHESIS_BYPASS: str = os.getenv("SYNTHESIS_BYPASS", "all").lower()
+    SYNTHESIS_BYPASS_MAX_ROWS: int = int(os.getenv("SYNTHESIS_BYPASS_MAX_ROWS", "12"))
+
+    # ─── Batch Questions ─────────────────────────────────────────────────────
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    BATCH_MAX_QUESTIONS: int = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
+    # ─── Chat Sessions ───────────────────────────────────────────────────────
+    SESSION_MAX: int = int(os.getenv("SESSION_MAX", "1000"))
+    SESSION_TTL_S: float = float(os.getenv("SESSION_TTL_S", "1800"))
+    # Questions this short (in words) are follow-ups if they add only literals or stay on the session's tables
+    SESSION_FOLLOWUP_MAX_WORDS: int = int(os.getenv("SESSION_FOLLOWUP_MAX_WORDS", "4"))
+
+    # ─── Data Export ─────────────────────────────────────────────────────────
+    # Rows per export download; larger results are fetched page by page with ?offset=
+    EXPORT_PAGE_ROWS: int = int(os.getenv("EXPORT_PAGE_ROWS", "100000"))
+    # Generated queries kept for download, and for how long (seconds)
+    EXPORT_MAX: int = int(os.getenv("EXPORT_MAX", "1000"))
+    EXPORT_TTL_S: float = float(os.getenv("EXPORT_TTL_S", "3600"))
+
+    # ─── Warm-up & Readiness ─────────────────────────────────────────────────
+    # Before /ready reports ready: load the models, open database connections,
+    # pre-touch index memory and replay the most asked recent chat questions
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "True").lower() in ("true", "1", "yes")
+    WARMUP_REPLAY_QUESTIONS: int = int(os.getenv("WARMUP_REPLAY_QUESTIONS", "20"))
+    # Only questions asked within this many days are replayed
+    WARMUP_REPLAY_DAYS: float = float(os.getenv("WARMUP_REPLAY_DAYS", "7"))
+    # Replay stops after this many seconds of warm-up; the service reports ready regardless
+    WARMUP_TIMEOUT_S: float = float(os.getenv("WARMUP_TIMEOUT_S", "300"))
+    # Re-pin the models this often so an idle service keeps them loaded (0 = off)
+    WARMUP_KEEPALIVE_INTERVAL_S: float = float(os.getenv("WARMUP_KEEPALIVE_INTERVAL_S", "240"))
+    # Distinct questions kept in the replay log (least recently asked are dropped)
+    QUESTION_LOG_MAX: int = int(os.getenv("QUESTION_LOG_MAX", "2000"))
+
+    # ─── Load Testing ────────────────────────────────────────────────────────
+    # "stub" serves a simulated pipeline (no model or database calls, see
+    # app/loadtest.py) so the web layer can be load-tested on its own
+    PIPELINE_BACKEND: str = os.getenv("PIPELINE_BACKEND", "full").lower()
+    # Simulated latency of each stub LLM call (text2sql, synthesis) and SQL query, ± STUB_JITTER
+    STUB_LLM_MS: float = float(os.getenv("STUB_LLM_MS", "800"))
+    STUB_DB_MS: float = float(os.getenv("STUB_DB_MS", "50"))
+    STUB_JITTER: float = float(os.getenv("STUB_JITTER", "0.2"))
+
+    # ─── SQL Validation ──────────────────────────────────────────────────────
+    # Check generated SQL against the schema catalog before running it
+    SQL_VALIDATION: bool = os.getenv("SQL_VALIDATION", "True").lower() in ("true", "1", "yes")
+    # LLM repair attempts for SQL that fails validation (0 = fail immediately)
+    SQL_REPAIR_ATTEMPTS: int = int(os.getenv("SQL_REPAIR_ATTEMPTS", "1"))
+
+    def ensure_dirs(self) -> None:
+        """Create the storage directories (called by the code that writes to them)."""
         Path(self.TABLE_INFO_DIR).mkdir(exist_ok=True)
         Path(self.TABLE_INDEX_DIR).mkdir(exist_ok=True)
     
@@ -67,6 +264,38 @@ class Config:
             raise ValueError("LLM_BACKEND must be either 'ollama' or 'openai'")
         if self.LLM_BACKEND == "openai" and not self.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY must be set when LLM_BACKEND=openai")
+        if self.EMBED_BACKEND not in ("", "ollama", "openai", "local", "hash"):
+            raise ValueError("EMBED_BACKEND must be empty, 'ollama', 'openai', 'local' or 'hash'")
+        if self.EMBED_BACKEND == "openai" and not self.OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY must be set when EMBED_BACKEND=openai")
+        if self.ROW_RETRIEVAL_MODE not in ("dense", "lexical", "hybrid"):
+            raise ValueError("ROW_RETRIEVAL_MODE must be 'dense', 'lexical' or 'hybrid'")
+        if self.ROW_VECTOR_DTYPE not in ("float32", "float16", "int8"):
+            raise ValueError("ROW_VECTOR_DTYPE must be 'float32', 'float16' or 'int8'")
+        if self.SYNTHESIS_BYPASS not in ("off", "simple", "all"):
+            raise ValueError("SYNTHESIS_BYPASS must be 'off', 'simple' or 'all'")
+        if self.LLM_HEALTHCHECK not in ("off", "sync", "background"):
+            raise ValueError("LLM_HEALTHCHECK must be 'off', 'sync' or 'background'")
+        if self.LLM_MAX_CONCURRENCY < 1:
+            raise ValueError("LLM_MAX_CONCURRENCY must be at least 1")
+        if not 0.0 <= self.TRACE_SAMPLE_RATE <= 1.0:
+            raise ValueError("TRACE_SAMPLE_RATE must be between 0 and 1")
+        if self.TEXT2SQL_CONTEXT_TOKENS < 0:
+            raise ValueError("TEXT2SQL_CONTEXT_TOKENS must be 0 (no limit) or positive")
+        if self.ROW_SHARDS < 1:
+            raise ValueError("ROW_SHARDS must be at least 1")
+        if self.ROW_SHARD_MAX_SEGMENTS < 1:
+            raise ValueError("ROW_SHARD_MAX_SEGMENTS must be at least 1")
+        if self.EXPORT_PAGE_ROWS < 1:
+            raise ValueError("EXPORT_PAGE_ROWS must be at least 1")
+        if self.WARMUP_REPLAY_QUESTIONS < 0:
+            raise ValueError("WARMUP_REPLAY_QUESTIONS must be 0 (no replay) or positive")
+        if self.WARMUP_TIMEOUT_S <= 0:
+            raise ValueError("WARMUP_TIMEOUT_S must be positive")
+        if self.PIPELINE_BACKEND not in ("full", "stub"):
+            raise ValueError("PIPELINE_BACKEND must be 'full' or 'stub'")
+        if not 0.0 <= self.STUB_JITTER <= 1.0:
+            raise ValueError("STUB_JITTER must be between 0 and 1")
         return True
 
 config = Config()
@@ -0,0 +1,141 @@
+import logging
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import config
+from .lexical import tokenize
+from .metrics import metrics
+from .prompts import EXAMPLE_ROWS_GUIDANCE
+from .tokens import token_counter
+
+logger = logging.getLogger(__name__)
+
+class TableContext:
+    """Question-independent pieces of one table's text2sql context."""
+
+    def __init__(self, name: str, columns: List[Tuple[str, str]], description: str = "",
+                 column_descriptions: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.columns = columns  # (column name, SQL type)
+        self.description = description
+        self.column_descriptions = column_descriptions or {}
+        self.rows: List[str] = []  # question-specific example rows ("col=val | col=val")
+
+
+class ContextAssembler:
+    """
+    Builds the schema string for the text2sql prompt within a token budget.
+    Reductions are applied in order until the context fits:
+    shorter example rows, one-sentence column descriptions, no descriptions for
+    columns unrelated to the question, unrelated columns dropped, no example
+    rows, and finally the lowest-ranked tables dropped.
+    """
+
+    def __init__(self, budget: Optional[int] = None):
+        self.budget = budget if budget is not None else config.TEXT2SQL_CONTEXT_TOKENS
+        self.keep_columns = {c.strip().lower() for c in config.CONTEXT_KEEP_COLUMNS.split(",") if c.strip()}
+
+    def assemble(self, question: str, tables: List[TableContext]) -> str:
+        relevant = {t.name: self._relevant_columns(question, t) for t in tables}
+        levels = [
+            {},
+            {"rows": 1, "row_chars": config.CONTEXT_ROW_VALUE_CHARS},
+            {"rows": 1, "row_chars": config.CONTEXT_ROW_VALUE_CHARS, "short_desc": True},
+            {"rows": 1, "row_chars": config.CONTEXT_ROW_VALUE_CHARS, "short_desc": True, "prune_desc": True},
+            {"rows": 1, "row_chars": config.CONTEXT_ROW_VALUE_CHARS, "short_desc": True, "prune_desc": True,
+             "prune_columns": True},
+            {"rows": 0, "short_desc": True, "prune_desc": True, "prune_columns": True},
+        ]
+        text, tokens = "", 0
+        for level, opts in enumerate(levels):
+            text = self._render(tables, relevant, **opts)
+            tokens = token_counter.count(text)
+            if self.budget <= 0 or tokens <= self.budget:
+                break
+        else:
+            # Still too long: drop the lowest-ranked tables, keeping at least one
+            kept = list(tables)
+            while len(kept) > 1 and tokens > self.budget:
+                kept.pop()
+                text = self._render(kept, relevant, **levels[-1])
+                tokens = token_counter.count(text)
+            level = len(levels) + (len(tables) - len(kept))
+            if tokens > self.budget:
+                logger.warning(f"text2sql context is {tokens} tokens, over the {self.budget} token budget")
+
+        metrics.record("text2sql.context_tokens", tokens)
+        if level:
+            metrics.incr("text2sql.context_reduced")
+            logger.info(f"text2sql context reduced to {tokens} tokens (level {level}, budget {self.budget})")
+        return text
+
+    def _relevant_columns(self, question: str, table: TableContext) -> Set[str]:
+        """Columns sharing a word with the question, plus the always-kept ones."""
+        q_tokens = set(tokenize(question))
+        keep = set()
+        for name, _ in table.columns:
+            if name.lower() in self.keep_columns:
+                keep.add(name)
+                continue
+            words = set(tokenize(name + " " + table.column_descriptions.get(name, "")))
+            if words & q_tokens:
+                keep.add(name)
+        return keep
+
+    @staticmethod
+    def _first_sentence(text: str) -> str:
+        return re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+
+    @staticmethod
+    def _shrink_row(row: str, columns: Optional[Set[str]], max_chars: Optional[int]) -> str:
+        parts = []
+        for part in row.split(" | "):
+            name, sep, value = part.partition("=")
+            if columns is not None and sep and name not in columns:
+                continue
+            if max_chars and len(value) > max_chars:
+                value = value[:max_chars] + "…"
+            parts.append(name + sep + value)
+        return " | ".join(parts)
+
+    def _render(self, tables: List[TableContext], relevant: Dict[str, Set[str]], rows: Optional[int] = None,
+                row_chars: Optional[int] = None, short_desc: bool = False, prune_desc: bool = False,
+                prune_columns: bool = False) -> str:
+        parts = []
+        any_rows = False
+        for t in tables:
+            keep = relevant[t.name]
+            columns = [(c, typ) for c, typ in t.columns if not prune_columns or c in keep] or t.columns
+            info = f"Table '{t.name}' has columns: " + ", ".join(f"{c} ({typ})" for c, typ in columns) + "."
+            if prune_columns and len(columns) < len(t.columns):
+                info += f" ({len(t.columns) - len(columns)} more columns not shown)"
+            if t.description:
+                info += f"\n\nTable Description: {t.description}"
+
+            names = {c for c, _ in columns}
+            descriptions = [
+                (c, self._first_sentence(d) if short_desc else d)
+                for c, d in t.column_descriptions.items()
+                if c in names and (not prune_desc or c in keep)
+            ]
+            if descriptions:
+                info += "\n\nDetailed Column Descriptions:"
+                for c, d in descriptions:
+                    info += f"\n- {c}: {d}"
+
+            examples = t.rows if rows is None else t.rows[:rows]
+            if examples:
+                any_rows = True
+                info += "\n\nRelevant Example Rows (Note: Many records require multiple column conditions):"
+                for i, row in enumerate(examples):
+                    row = self._shrink_row(row, names if prune_columns else None, row_chars)
+                    info += f"\nExample {i+1}: {row}"
+            parts.append(info)
+
+        text = "\n\n" + "=" * 50 + "\n\n".join(parts)
+        if any_rows:
+            text += "\n\n" + EXAMPLE_ROWS_GUIDANCE
+        return text
+
+
+context_assembler = ContextAssembler()
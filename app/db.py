@@ -1,33 +1,101 @@
 import psycopg2
-import pandas as pd
-from sqlalchemy import create_engine, MetaData, inspect, text
+from sqlalchemy import create_engine, exc as sa_exc, text
 from sqlalchemy.engine import Engine
-from typing import List, Dict, Optional, Tuple
+from sqlalchemy.pool import QueuePool
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+import contextvars
 import logging
+import threading
+import time
 from contextlib import contextmanager
  
+from .catalog import CatalogSnapshot
 from .config import config
+from .lazy import LazyService
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+WORKLOADS = ("interactive", "batch", "export")
+
+# Which connection pool the current caller uses; indexing code runs under workload("batch")
+_workload: contextvars.ContextVar[str] = contextvars.ContextVar("db_workload", default="interactive")
+
+
+@contextmanager
+def workload(name: str):
+    """Route database access in this block (and this thread/task) to the named pool."""
+    if name not in WORKLOADS:
+        raise ValueError(f"Unknown database workload {name!r}, expected one of {WORKLOADS}")
+    token = _workload.set(name)
+    try:
+        yield
+    finally:
+        _workload.reset(token)
+
+
+class _InstrumentedQueuePool(QueuePool):
+    """QueuePool that exports checkout wait, timeouts and connections in use per workload."""
+    workload = "interactive"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            metrics.incr(f"db_pool.{self.workload}.timeout")
+            raise
+        finally:
+            metrics.observe(f"db_pool.{self.workload}.checkout", time.perf_counter() - start)
+            metrics.record(f"db_pool.{self.workload}.in_use", self.checkedout())
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.workload = self.workload
+        return pool
+
+
+class RowBatch:
+    """
+    A chunk of streamed rows stored column by column (one tuple per column),
+    so no per-row dict is built. `last_key` is the keyset position to resume after.
+    """
+
+    def __init__(self, columns: List[str], rows: List[Tuple], last_key: Any = None):
+        self.columns = columns
+        self.data: List[Tuple] = list(zip(*rows)) if rows else [() for _ in columns]
+        self.last_key = last_key
+
+    def __len__(self) -> int:
+        return len(self.data[0]) if self.data else 0
+
+    def column(self, name: str) -> Tuple:
+        return self.data[self.columns.index(name)]
+
+    def rows(self) -> Iterator[Tuple]:
+        return zip(*self.data)
+
+
 class DatabaseManager:
     """Database connection and management class"""
     
     def __init__(self):
-        self.engine: Optional[Engine] = None
+        self._engines: Dict[str, Engine] = {}
+        self._engines_lock = threading.Lock()
+        self._catalog: Optional[CatalogSnapshot] = None
+        self._catalog_lock = threading.Lock()
         self._connect()
     
     def _connect(self) -> None:
-        """Create SQLAlchemy engine for PostgreSQL"""
+        """Create the interactive engine for PostgreSQL and check that it connects"""
         try:
-            self.engine = create_engine(
-                config.DATABASE_URL,
-                pool_pre_ping=True,
-                pool_recycle=3600
-            )
+            engine = self.get_engine("interactive")
             
             # Test connection
-            with self.engine.connect() as conn:
+            with engine.connect() as conn:
                 result = conn.execute(text("SELECT version();"))
                 version = result.fetchone()[0]
                 logger.info(f"Connected to PostgreSQL: {version}")
@@ -35,13 +103,75 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Error creating database engine: {e}")
             raise
+
+    def _pool_settings(self, name: str) -> Dict:
+        if name == "batch":
+            return dict(url=config.DB_BATCH_URL or config.DATABASE_URL, pool_size=config.DB_BATCH_POOL_SIZE,
+                        max_overflow=config.DB_BATCH_MAX_OVERFLOW, pool_timeout=config.DB_BATCH_POOL_TIMEOUT)
+        if name == "export":
+            return dict(url=config.DB_EXPORT_URL or config.DATABASE_URL, pool_size=config.DB_EXPORT_POOL_SIZE,
+                        max_overflow=config.DB_EXPORT_MAX_OVERFLOW, pool_timeout=config.DB_EXPORT_POOL_TIMEOUT)
+        return dict(url=config.DB_INTERACTIVE_URL or config.DATABASE_URL, pool_size=config.DB_INTERACTIVE_POOL_SIZE,
+                    max_overflow=config.DB_INTERACTIVE_MAX_OVERFLOW, pool_timeout=config.DB_INTERACTIVE_POOL_TIMEOUT)
+
+    def get_engine(self, name: Optional[str] = None) -> Engine:
+        """Engine of the named pool (default: the caller's workload), created on first use"""
+        name = name or _workload.get()
+        engine = self._engines.get(name)
+        if engine is not None:
+            return engine
+        with self._engines_lock:
+            if name not in self._engines:
+                settings = self._pool_settings(name)
+                engine = create_engine(
+                    settings.pop("url"),
+                    poolclass=_InstrumentedQueuePool,
+                    pool_pre_ping=True,
+                    pool_recycle=3600,
+                    **settings
+                )
+                engine.pool.workload = name
+                self._engines[name] = engine
+                logger.info(f"Created '{name}' connection pool (size={settings['pool_size']}, "
+                            f"overflow={settings['max_overflow']}, timeout={settings['pool_timeout']}s)")
+            return self._engines[name]
+
+    @property
+    def engine(self) -> Engine:
+        """Engine for the caller's workload"""
+        return self.get_engine()
+
+    def pool_stats(self) -> Dict[str, Dict]:
+        """Connections in use and saturation of each pool created so far"""
+        stats = {}
+        for name, engine in list(self._engines.items()):
+            pool = engine.pool
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            stats[name] = {
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'overflow': max(pool.overflow(), 0),
+                'capacity': capacity,
+                'saturation': round(pool.checkedout() / capacity, 3) if capacity else 0.0,
+            }
+        return stats
     
+    def warm_pool(self, name: str = "interactive") -> int:
+        """Open the pool's base connections up front so early requests skip the connect handshake"""
+        engine = self.get_engine(name)
+        connections = []
+        try:
+            for _ in range(engine.pool.size()):
+                connections.append(engine.connect())
+                connections[-1].execute(text("SELECT 1"))
+        finally:
+            for connection in connections:
+                connection.close()
+        return len(connections)
+
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections"""
-        if not self.engine:
-            raise RuntimeError("Database engine not initialized")
-        
+        """Context manager for database connections from the caller's workload pool"""
         connection = self.engine.connect()
         try:
             yield connection
@@ -58,38 +188,72 @@ class DatabaseManager:
             logger.error(f"Database connection test failed: {e}")
             return False
     
+    def get_catalog(self, refresh: bool = False) -> CatalogSnapshot:
+        """
+        Shared snapshot of tables, columns, keys and row estimates. Reloaded after
+        CATALOG_TTL_S seconds, on `refresh`, or after invalidate_catalog().
+        """
+        snapshot = self._catalog
+        if not refresh and snapshot is not None and time.monotonic() - snapshot.loaded_at < config.CATALOG_TTL_S:
+            return snapshot
+        with self._catalog_lock:
+            snapshot = self._catalog
+            if refresh or snapshot is None or time.monotonic() - snapshot.loaded_at >= config.CATALOG_TTL_S:
+                with self.get_connection() as conn:
+                    fresh = CatalogSnapshot.load(conn)
+                if snapshot is not None and fresh.version != snapshot.version:
+                    logger.info(f"Database schema changed (catalog {snapshot.version} -> {fresh.version})")
+                self._catalog = snapshot = fresh
+            return snapshot
+
+    def invalidate_catalog(self) -> None:
+        """Force the next get_catalog() to reload (e.g. after a schema change)."""
+        self._catalog = None
+
     def get_table_names(self) -> List[str]:
         """Get list of table names in the database"""
         try:
-            inspector = inspect(self.engine)
-            return inspector.get_table_names()
+            return self.get_catalog().table_names()
         except Exception as e:
             logger.error(f"Error getting table names: {e}")
             return []
     
     def get_table_info(self, table_name: str) -> Dict:
-        """Get detailed information about a table"""
+        """Get detailed information about a table (row_count is the planner's estimate)"""
         try:
-            inspector = inspect(self.engine)
-            columns = inspector.get_columns(table_name)
-            
-            # Get row count
-            with self.get_connection() as conn:
-                result = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"'))
-                row_count = result.fetchone()[0]
-            
+            table = self.get_catalog().get(table_name)
+            if table is None:
+                raise ValueError(f"Table {table_name} not found")
             return {
                 'table_name': table_name,
-                'columns': [f"{col['name']} ({col['type']})" for col in columns],
-                'column_names': [col['name'] for col in columns],
-                'row_count': row_count
+                'columns': [f"{col['name']} ({col['type']})" for col in table.columns],
+                'column_names': table.column_names,
+                'row_count': table.row_estimate
             }
         except Exception as e:
             logger.error(f"Error getting table info for {table_name}: {e}")
             return {}
-    
-    def load_table_data(self, table_name: str, limit: int = 1000) -> Optional[pd.DataFrame]:
+
+    def get_table_fingerprints(self) -> Dict[str, Dict]:
+        """
+        Columns, estimated row count and a schema fingerprint for every table in
+        the current schema, from the catalog snapshot (no table data is read).
+        """
+        catalog = self.get_catalog()
+        return {
+            name: dict(self.get_table_info(name), fingerprint=catalog.get(name).fingerprint)
+            for name in catalog.table_names()
+        }
+
+    def get_id_column(self, table_name: str) -> Optional[str]:
+        """The 'id'/'ID'/'Id' column used for incremental indexing, if the table has one."""
+        table = self.get_catalog().get(table_name)
+        return table.id_column if table is not None else None
+
+    def load_table_data(self, table_name: str, limit: int = 1000) -> Optional["pd.DataFrame"]:
         """Load data from a table"""
+        import pandas as pd
+
         try:
             query = f'SELECT * FROM "{table_name}" LIMIT {limit}'
             df = pd.read_sql(query, self.engine)
@@ -99,34 +263,25 @@ class DatabaseManager:
             logger.error(f"Error loading data from table {table_name}: {e}")
             return None
     
-    def load_all_tables(self, limit: int = 1000) -> Tuple[List[pd.DataFrame], List[Dict]]:
-        """Load data from all tables"""
-        table_names = self.get_table_names()
-        dfs = []
-        table_info_list = []
-        
-        for table_name in table_names:
-            df = self.load_table_data(table_name, limit)
-            if df is not None:
-                dfs.append(df)
-                table_info = self.get_table_info(table_name)
-                table_info_list.append(table_info)
-        
-        return dfs, table_info_list
-    
-    def execute_query(self, query: str) -> List[Dict]:
-        """Execute a SQL query and return results"""
-        try:
-            with self.get_connection() as conn:
-                result = conn.execute(text(query))
-                columns = result.keys()
-                rows = result.fetchall()
-                
-                return [dict(zip(columns, row)) for row in rows]
-        except Exception as e:
-            logger.error(f"Error executing query: {e}")
-            logger.error(f"Query: {query}")
-            raise
+    def iter_query_batches(self, query: str, params: Optional[Dict] = None,
+                           fetch_size: Optional[int] = None) -> Iterator[RowBatch]:
+        """
+        Stream a query's result through a server-side cursor as column-batched
+        chunks of `fetch_size` rows. Always yields at least one (possibly empty)
+        batch so callers see the column names. The connection is held until
+        the iterator is exhausted or closed.
+        """
+        fetch_size = fetch_size or config.DB_FETCH_SIZE
+        with self.get_connection() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=fetch_size) \
+                .execute(text(query), params or {})
+            columns = list(result.keys())
+            empty = True
+            for part in result.partitions(fetch_size):
+                empty = False
+                yield RowBatch(columns, part)
+            if empty:
+                yield RowBatch(columns, [])
     
     def get_sample_data(self, table_name: str, num_rows: int = 5) -> str:
         """Get sample data from a table as string"""
@@ -142,63 +297,62 @@ class DatabaseManager:
     # -------------------------------------------------------------------------
     # Incremental indexing support methods
     # -------------------------------------------------------------------------
-    def get_new_rows_since_id(
+    def iter_row_batches(
         self,
         table_name: str,
-        last_id: int,
-        id_column: Optional[str] = None,
-        limit: Optional[int] = None
-    ) -> List[Dict]:
+        key_column: Optional[str] = None,
+        after: Any = None,
+        limit: Optional[int] = None,
+        fetch_size: Optional[int] = None,
+    ) -> Iterator[RowBatch]:
         """
-        Fetch new rows from `table_name` where id_column > last_id.
-        Auto-detects id column if not provided (looks for 'id','ID','Id').
-        Returns list of dicts.
+        Stream a table in key order as column-batched chunks of `fetch_size` rows.
+        Pages of DB_PAGE_SIZE rows are read with keyset pagination on
+        `key_column` (default: the table's id column, else `ctid`) through a
+        server-side cursor, so no OFFSET rescans and no full materialization.
+        Rows with key > `after` are returned, at most `limit` in total.
         """
-        with self.get_connection() as conn:
-            # Auto-detect id column if needed
-            if id_column is None:
-                cols = conn.execute(text(
-                    """
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_name = :table
-                      AND column_name IN ('id','ID','Id')
-                    ORDER BY ordinal_position
-                    """
-                ), {"table": table_name}).fetchall()
-                if not cols:
-                    raise ValueError(f"No ID column found for table {table_name}")
-                id_column = cols[0][0]
-
-            # Build and execute query
-            sql = f'SELECT * FROM "{table_name}" WHERE "{id_column}" > :last_id ORDER BY "{id_column}"'
-            if limit:
-                sql += f' LIMIT {limit}'
-
-            result = conn.execute(text(sql), {"last_id": last_id})
-            # Convert rows to dicts via RowMapping
-            rows = result.mappings().all()
-            return [dict(r) for r in rows]
-
-    def get_new_rows_by_offset(
-        self,
-        table_name: str,
-        offset: int,
-        limit: Optional[int] = None
-    ) -> List[Dict]:
-        """
-        Fetch rows from `table_name` starting at `offset`.
-        Returns list of dicts.
-        """
-        with self.get_connection() as conn:
-            sql = f'SELECT * FROM "{table_name}" OFFSET :offset'
-            if limit:
-                sql += f' LIMIT {limit}'
+        fetch_size = fetch_size or config.DB_FETCH_SIZE
+        key_column = key_column or self.get_id_column(table_name) or "ctid"
+        use_ctid = key_column == "ctid"
+        if use_ctid:
+            # ctid is not a regular column: select it first and strip it from the batch
+            select, key_expr = f'SELECT ctid::text AS "__ctid", * FROM "{table_name}"', "ctid"
+            bound = "ctid > CAST(:after AS tid)"
+        else:
+            select, key_expr = f'SELECT * FROM "{table_name}"', f'"{key_column}"'
+            bound = f'"{key_column}" > :after'
 
-            result = conn.execute(text(sql), {"offset": offset})
-            # Use RowMapping to get dict-like rows
-            rows = result.mappings().all()
-            return [dict(r) for r in rows]
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page = config.DB_PAGE_SIZE if remaining is None else min(config.DB_PAGE_SIZE, remaining)
+            where = f" WHERE {bound}" if after is not None else ""
+            sql = text(f"{select}{where} ORDER BY {key_expr} LIMIT {page}")
+            page_rows = 0
+            with self.get_connection() as conn:
+                result = conn.execution_options(stream_results=True, max_row_buffer=fetch_size) \
+                    .execute(sql, {"after": after} if after is not None else {})
+                columns = list(result.keys())
+                key_idx = 0 if use_ctid else columns.index(key_column)
+                if use_ctid:
+                    columns = columns[1:]
+                for part in result.partitions(fetch_size):
+                    after = part[-1][key_idx]
+                    page_rows += len(part)
+                    yield RowBatch(columns, [row[1:] for row in part] if use_ctid else part, after)
+            if remaining is not None:
+                remaining -= page_rows
+            if page_rows < page:
+                break
+
+    def get_ctid_at_offset(self, table_name: str, offset: int) -> Optional[str]:
+        """Physical position (ctid) of the row at `offset` in scan order, for resuming keyset scans."""
+        with self.get_connection() as conn:
+            return conn.execute(
+                text(f'SELECT ctid::text AS position FROM "{table_name}" ORDER BY ctid OFFSET :offset LIMIT 1'),
+                {"offset": offset}
+            ).scalar()
 
 
-db_manager = DatabaseManager()
+# Connects on first use, not at import
+db_manager = LazyService(DatabaseManager, "db_manager")
@@ -0,0 +1,240 @@
+"""
+In-process embedding models, selected with EMBED_BACKEND:
+
+- "local": an ONNX export of a sentence-embedding model run on the CPU with
+  onnxruntime, with real batched inference and batches spread over a small
+  thread pool (no HTTP round trip per text).
+- "hash": deterministic feature-hashing vectors with no model at all, for
+  tests and offline runs.
+
+Benchmark row-indexing embedding throughput of the backends:
+    python -m app.embeddings --table TABLE_NAME [--rows 2000] [--backends ollama local hash]
+    python -m app.embeddings --synthetic 2000
+"""
+
+import argparse
+import hashlib
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class LocalOnnxEmbedding(BaseEmbedding):
+    """
+    Sentence embeddings from an ONNX model directory (model.onnx + tokenizer.json)
+    on the CPU. Texts are sorted by length so each batch needs little padding,
+    and batches run concurrently on one shared InferenceSession.
+    """
+
+    model_dir: str = Field(description="Directory with model.onnx and tokenizer.json")
+    max_length: int = Field(default=512, description="Tokens per text (longer texts are truncated)")
+    pooling: str = Field(default="cls", description="'cls' or 'mean' pooling of the last hidden state")
+    query_instruction: Optional[str] = Field(default=None, description="Prefix added to questions")
+    workers: int = Field(default=2, description="Batches run concurrently")
+
+    _session = PrivateAttr()
+    _tokenizer = PrivateAttr()
+    _input_names = PrivateAttr()
+    _executor = PrivateAttr()
+
+    def __init__(self, model_dir: str, threads: int = 0, **kwargs):
+        super().__init__(model_dir=model_dir, model_name=f"local:{Path(model_dir).name}", **kwargs)
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if self.pooling not in ("cls", "mean"):
+            raise ValueError(f"Unknown pooling {self.pooling!r}, expected 'cls' or 'mean'")
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(
+            str(Path(model_dir) / "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(str(Path(model_dir) / "tokenizer.json"))
+        self._tokenizer.enable_truncation(self.max_length)
+        self._tokenizer.enable_padding()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+        logger.info(f"Loaded local embedding model from {model_dir} "
+                    f"(batch={self.embed_batch_size}, workers={self.workers}, threads={threads or 'auto'})")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalOnnxEmbedding"
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self._session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return _l2_normalize(pooled.astype(np.float32))
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        size = self.embed_batch_size
+        chunks = [[texts[i] for i in order[start:start + size]] for start in range(0, len(order), size)]
+        vectors = np.concatenate(list(self._executor.map(self._embed_batch, chunks)))
+        out: List[List[float]] = [None] * len(texts)
+        for pos, i in enumerate(order):
+            out[i] = vectors[pos].tolist()
+        return out
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([f"{self.query_instruction}{query}" if self.query_instruction else query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Deterministic embeddings from signed feature hashing of word tokens and
+    character trigrams. Identical across processes and platforms; texts that
+    share words or spellings land close together. No model or network needed.
+    """
+
+    dim: int = Field(default=384, description="Vector dimension")
+
+    def __init__(self, dim: int = 384, **kwargs):
+        super().__init__(dim=dim, model_name=f"hash:{dim}", **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        grams = [f"#{t[i:i + 3]}" for t in tokens for i in range(max(1, len(t) - 2))]
+        return tokens + grams
+
+    def _vector(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            h = int.from_bytes(digest, "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        return _l2_normalize(vec).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(t) for t in texts]
+
+
+def build_embed_model(backend: str) -> BaseEmbedding:
+    """In-process embedding model for EMBED_BACKEND "local" or "hash"."""
+    if backend == "local":
+        return LocalOnnxEmbedding(
+            config.LOCAL_EMBED_MODEL_DIR,
+            threads=config.LOCAL_EMBED_THREADS,
+            max_length=config.LOCAL_EMBED_MAX_LENGTH,
+            pooling=config.LOCAL_EMBED_POOLING,
+            query_instruction=config.LOCAL_EMBED_QUERY_INSTRUCTION or None,
+            workers=config.LOCAL_EMBED_WORKERS,
+            embed_batch_size=config.LOCAL_EMBED_BATCH_SIZE,
+        )
+    if backend == "hash":
+        return HashEmbedding(config.HASH_EMBED_DIM, embed_batch_size=config.LOCAL_EMBED_BATCH_SIZE)
+    raise ValueError(f"No in-process embedding backend {backend!r}")
+
+
+def _benchmark_texts(args) -> List[str]:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        return [
+            f"period={2000 + i % 25} | code={i % 97} | scr_mn=Үзүүлэлт {i % 13} | dtval_co={rng.random() * 1e6:.2f}"
+            for i in range(args.synthetic)
+        ]
+    from .db import db_manager, workload
+    from .rows import row_serializer
+    from llama_index.core.schema import MetadataMode
+
+    id_column = db_manager.get_id_column(args.table)
+    with workload("batch"):
+        return [
+            node.get_content(metadata_mode=MetadataMode.EMBED)
+            for batch in db_manager.iter_row_batches(args.table, limit=args.rows)
+            for node in row_serializer.batch_to_nodes(args.table, batch, id_column)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row embedding throughput of the embedding backends")
+    parser.add_argument("--table", type=str, help="Embed rows of this table, serialized as for the row index")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows to read with --table")
+    parser.add_argument("--synthetic", type=int, help="Embed N synthetic row texts instead")
+    parser.add_argument("--backends", nargs="*", default=["ollama", "local", "hash"])
+    args = parser.parse_args()
+    logging.basicConfig(level=config.LOG_LEVEL)
+    if not args.table and not args.synthetic:
+        parser.error("one of --table or --synthetic is required")
+
+    texts = _benchmark_texts(args)
+    print(f"{len(texts)} texts, mean {np.mean([len(t) for t in texts]):.0f} chars")
+    for backend in args.backends:
+        try:
+            if backend == "ollama":
+                from llama_index.embeddings.ollama import OllamaEmbedding
+                model = OllamaEmbedding(model_name=config.OLLAMA_EMBED_MODEL, base_url=config.OLLAMA_HOST)
+            else:
+                model = build_embed_model(backend)
+            model.get_text_embedding_batch(texts[:8])  # warm-up (model load, first allocation)
+            start = time.perf_counter()
+            vectors = model.get_text_embedding_batch(texts)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"{backend:<8} unavailable: {type(e).__name__}: {e}")
+            continue
+        print(f"{backend:<8} {len(texts) / elapsed:9.1f} texts/s  ({elapsed:.2f}s, dim={len(vectors[0])}, "
+              f"batch={model.embed_batch_size})")
+
+
+if __name__ == "__main__":
+    main()
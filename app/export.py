@@ -0,0 +1,277 @@
+import csv
+import io
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from .config import config
+from .db import RowBatch, db_manager, workload
+from .metrics import metrics
+from .sql_validator import scan
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+class ExportStore:
+    """Thread-safe LRU of validated SQL queries available for download, with expiry."""
+
+    def __init__(self, max_exports: Optional[int] = None, ttl_s: Optional[float] = None):
+        self.max_exports = max_exports or config.EXPORT_MAX
+        self.ttl_s = ttl_s or config.EXPORT_TTL_S
+        self._exports: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, sql_query: str, question: str = "") -> str:
+        export_id = uuid.uuid4().hex
+        with self._lock:
+            self._exports[export_id] = {"sql_query": sql_query, "question": question, "created_at": time.monotonic()}
+            while len(self._exports) > self.max_exports:
+                self._exports.popitem(last=False)
+        return export_id
+
+    def get(self, export_id: str) -> Optional[Dict]:
+        with self._lock:
+            export = self._exports.get(export_id)
+            if export is not None and time.monotonic() - export["created_at"] > self.ttl_s:
+                self._exports.pop(export_id)
+                return None
+            return export
+
+
+# Words that end a top-level select list, and the clauses that may follow ORDER BY
+_SELECT_LIST_END = {"from", "into", "where", "group", "having", "window", "order", "limit", "offset",
+                    "fetch", "for", "union", "intersect", "except"}
+_AFTER_ORDER_BY = {"limit", "offset", "fetch", "for"}
+
+
+def _order_by(sql: str) -> Optional[Tuple[int, Optional[int]]]:
+    """
+    Where the top-level ORDER BY list of `sql` ends and how many columns the
+    query outputs (None for SELECT *), or None without a top-level ORDER BY.
+    """
+    depth, prev = 0, None
+    in_select = seen_select = False
+    columns, star = 1, False
+    order_end: Optional[int] = None
+    ordered = False
+    for kind, value, pos in scan(sql):
+        if value in ("(", ")"):
+            depth += 1 if value == "(" else -1
+            prev = value
+            continue
+        if depth:
+            continue
+        word = value.lower() if kind == "ident" else None
+        if word == "select" and not seen_select:
+            seen_select = in_select = True
+        elif in_select and word in _SELECT_LIST_END:
+            in_select = False
+        elif in_select and value == ",":
+            columns += 1
+        elif in_select and value == "*" and prev in ("select", "distinct", "all", ",", "."):
+            star = True
+        if word == "by" and prev == "order":
+            ordered, order_end = True, None
+        elif ordered and order_end is None and word in _AFTER_ORDER_BY:
+            order_end = pos
+        prev = word or value
+    if not ordered:
+        return None
+    return (len(sql) if order_end is None else order_end), (None if star or not seen_select else columns)
+
+
+def paginate(sql_query: str, offset: int, limit: int) -> str:
+    """
+    Wrap a query so one page of its result is read (one extra row tells whether more follow).
+    OFFSET pages only line up if every run returns the rows in the same order,
+    so the query gets a total one: its own ORDER BY with every output column
+    appended as a tie-breaker, or without one, the text of the whole row. Under
+    an ORDER BY with SELECT * the columns are unknown, so rows tied on the sort
+    keys may still trade places between pages; rows added or changed between
+    page requests shift the later pages regardless.
+    """
+    inner = sql_query.strip().rstrip(";")
+    page = f"LIMIT {int(limit) + 1} OFFSET {int(offset)}"
+    order = _order_by(inner)
+    if order is None:
+        return f"SELECT * FROM ({inner}) AS export_page ORDER BY export_page::text {page}"
+    end, columns = order
+    if columns:
+        tiebreak = ", ".join(str(i) for i in range(1, columns + 1))
+        inner = f"{inner[:end].rstrip()}, {tiebreak} {inner[end:]}".rstrip()
+    return f"SELECT * FROM ({inner}) AS export_page {page}"
+
+
+def open_page(sql_query: str, offset: int, limit: int) -> Iterator[RowBatch]:
+    """
+    Start streaming one page of a query's rows. The first batch is read here,
+    so SQL errors (and sqlalchemy's TimeoutError when every export connection
+    is busy) surface before a response starts. The connection comes from the
+    export pool so downloads hold neither interactive nor indexing connections,
+    and is released when the returned iterator is exhausted or closed.
+    """
+    batches = db_manager.iter_query_batches(paginate(sql_query, offset, limit))
+    with workload("export"):
+        first = next(batches)
+    return _closing(first, batches)
+
+
+def _closing(first: RowBatch, batches: Iterator[RowBatch]) -> Iterator[RowBatch]:
+    # A client that disconnects closes this generator; close the cursor's with it
+    try:
+        yield first
+        yield from batches
+    finally:
+        batches.close()
+
+
+def _limited(batches: Iterable[RowBatch], limit: int, page: Dict) -> Iterator[RowBatch]:
+    """Pass batches through up to `limit` rows; sets page["more"] if the extra row was read."""
+    remaining = limit
+    for batch in batches:
+        if len(batch) > remaining:
+            page["more"] = True
+            batch = RowBatch(batch.columns, list(batch.rows())[:remaining])
+        remaining -= len(batch)
+        page["rows"] = page.get("rows", 0) + len(batch)
+        yield batch
+        if page.get("more"):
+            break
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def to_csv(batches: Iterable[RowBatch]) -> Iterator[str]:
+    """CSV with a header row; starts with a BOM so Excel reads Cyrillic text as UTF-8."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    header = False
+    for batch in batches:
+        if not header:
+            buf.write("\ufeff")
+            writer.writerow(batch.columns)
+            header = True
+        writer.writerows(batch.rows())
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def to_json(batches: Iterable[RowBatch], page: Dict) -> Iterator[str]:
+    """{"columns": [...], "rows": [[...], ...], "offset": n, "next_offset": n | null}, written incrementally."""
+    first_row = True
+    columns = None
+    for batch in batches:
+        if columns is None:
+            columns = batch.columns
+            yield '{"columns": ' + json.dumps(columns, ensure_ascii=False) + ', "rows": ['
+        for row in batch.rows():
+            yield ("" if first_row else ",\n") + json.dumps(row, ensure_ascii=False, default=_json_value)
+            first_row = False
+    if columns is None:
+        yield '{"columns": [], "rows": ['
+    offset = page.get("offset", 0)
+    next_offset = offset + page.get("rows", 0) if page.get("more") else None
+    yield f'], "offset": {offset}, "next_offset": {json.dumps(next_offset)}}}\n'
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back in chunks."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _parquet_type(pa, array):
+    # Columns that are all NULL in the first batch are stored as text; NUMERIC
+    # values vary in precision per row, so they are stored as doubles (as in JSON)
+    if pa.types.is_null(array.type):
+        return pa.string()
+    if pa.types.is_decimal(array.type):
+        return pa.float64()
+    return array.type
+
+
+def to_parquet(batches: Iterable[RowBatch]) -> Iterator[bytes]:
+    """Parquet with one row group per batch, typed from the first batch (needs pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = schema = None
+    for batch in batches:
+        if writer is None:
+            schema = pa.schema([
+                pa.field(name, _parquet_type(pa, pa.array(list(values))))
+                for name, values in zip(batch.columns, batch.data)
+            ])
+            writer = pq.ParquetWriter(sink, schema)
+        arrays = []
+        for values, field in zip(batch.data, schema):
+            if pa.types.is_floating(field.type):
+                values = [None if v is None else float(v) for v in values]
+            arrays.append(pa.array(list(values), type=field.type))
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def render(fmt: str, batches: Iterable[RowBatch], offset: int = 0, limit: Optional[int] = None) -> Iterator:
+    """Serialize one page of streamed batches (from a `paginate`d query) in `fmt`."""
+    page = {"offset": offset}
+    batches = _limited(batches, limit or config.EXPORT_PAGE_ROWS, page)
+    metrics.incr(f"export.{fmt}")
+    if fmt == "csv":
+        return to_csv(batches)
+    if fmt == "json":
+        return to_json(batches, page)
+    if fmt == "parquet":
+        return to_parquet(batches)
+    raise ValueError(f"Unknown export format {fmt!r}, expected one of {tuple(FORMATS)}")
+
+
+export_store = ExportStore()
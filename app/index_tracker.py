@@ -0,0 +1,93 @@
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import text
+
+from .ann import IVFIndex
+from .config import config
+from .db import db_manager
+
+logger = logging.getLogger(__name__)
+
+class IndexTracker:
+    """Track which database rows have been indexed"""
+    def __init__(self, tracker_file: str = None):
+        if tracker_file is None:
+            tracker_file = Path(config.TABLE_INDEX_DIR) / "index_tracker.json"
+        self.tracker_file = Path(tracker_file)
+        self.load_tracker()
+
+    def load_tracker(self):
+        try:
+            with open(self.tracker_file, 'r', encoding='utf-8') as f:
+                self.tracked = json.load(f)
+        except FileNotFoundError:
+            self.tracked = {}
+
+    def save_tracker(self):
+        self.tracker_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.tracker_file, 'w', encoding='utf-8') as f:
+            json.dump(self.tracked, f, indent=2, ensure_ascii=False)
+
+    def get_last_indexed_id(self, table_name: str) -> int:
+        return self.tracked.get(table_name, {}).get('last_id', 0)
+
+    def get_last_indexed_count(self, table_name: str) -> int:
+        return self.tracked.get(table_name, {}).get('last_count', 0)
+
+    def get_last_indexed_ctid(self, table_name: str) -> Optional[str]:
+        """Scan position of the last indexed row for tables without an id column."""
+        return self.tracked.get(table_name, {}).get('last_ctid')
+
+    def update_last_indexed(self, table_name: str, last_id: int = None, last_count: int = None,
+                            last_ctid: str = None):
+        if table_name not in self.tracked:
+            self.tracked[table_name] = {}
+        if last_id is not None:
+            self.tracked[table_name]['last_id'] = last_id
+        if last_ctid is not None:
+            self.tracked[table_name]['last_ctid'] = last_ctid
+        if last_count is not None:
+            self.tracked[table_name]['last_count'] = last_count
+        self.tracked[table_name]['last_update'] = datetime.now().isoformat()
+        self.save_tracker()
+
+
+def get_index_status(index_tracker: IndexTracker, table_names: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+    """
+    Indexing status per table from the tracker, row counts and on-disk indices.
+    Needs only the database, not the LLM or the loaded pipeline.
+    """
+    status = {}
+    if table_names is None:
+        table_names = db_manager.get_table_names()
+
+    for table_name in table_names:
+        try:
+            with db_manager.get_connection() as conn:
+                current_count = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).scalar()
+
+            last_count = index_tracker.get_last_indexed_count(table_name)
+            last_id = index_tracker.get_last_indexed_id(table_name)
+
+            idx_path = Path(config.TABLE_INDEX_DIR) / table_name
+            index_exists = idx_path.exists()
+
+            status[table_name] = {
+                'current_db_count': current_count,
+                'last_indexed_count': last_count,
+                'last_indexed_id': last_id,
+                'index_exists': index_exists,
+                'needs_update': current_count > last_count,
+                'pending_rows': max(0, current_count - last_count)
+            }
+            vectors = IVFIndex.read_stats(str(idx_path))
+            if vectors:
+                status[table_name]['vectors'] = vectors
+        except Exception as e:
+            status[table_name] = {'error': str(e)}
+
+    return status
@@ -0,0 +1,139 @@
+import json
+import logging
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILE = "lexical_index.json"
+
+# Numbers keep their decimal part ("123.4"); words keep underscores ("scr_mn").
+# \w is Unicode-aware, so Mongolian Cyrillic (incl. ө, ү) is tokenized as letters.
+_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)?|[^\W_]+(?:_[^\W_]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase Cyrillic/Latin-aware tokenizer; compound codes also yield their parts."""
+    tokens = []
+    for tok in _TOKEN_RE.findall(text.casefold().replace("ё", "е")):
+        tok = tok.replace(",", ".")
+        tokens.append(tok)
+        if "_" in tok:
+            tokens.extend(tok.split("_"))
+    return tokens
+
+
+class BM25Index:
+    """In-memory inverted index over row texts with Okapi BM25 scoring."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_len: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.total_len = 0
+        # Per-term numpy views of the postings, rebuilt lazily after appends
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._doc_len_arr = np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def add(self, doc_id: str, text: str) -> None:
+        """Append one document; existing postings are untouched."""
+        doc_idx = len(self.doc_ids)
+        counts = Counter(tokenize(text))
+        self.doc_ids.append(doc_id)
+        length = sum(counts.values())
+        self.doc_len.append(length)
+        self.total_len += length
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_idx] = tf
+            self._arrays.pop(term, None)
+
+    def add_many(self, docs: Iterable[Tuple[str, str]]) -> None:
+        for doc_id, text in docs:
+            self.add(doc_id, text)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Return up to top_k (doc_id, score) pairs, best first."""
+        n_docs = len(self.doc_ids)
+        if not n_docs or top_k <= 0:
+            return []
+        self.prefetch()
+        avg_len = self.total_len / n_docs or 1.0
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            arrays = self._term_arrays(term)
+            if arrays is None:
+                continue
+            doc_idx, tf = arrays
+            df = len(doc_idx)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_len_arr[doc_idx] / avg_len)
+            scores[doc_idx] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(scores[hits], -top_k)[-top_k:]]
+        best = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.doc_ids[i], float(scores[i])) for i in best]
+
+    def prefetch(self) -> None:
+        """Build the document-length array that the first search would otherwise build."""
+        if len(self._doc_len_arr) != len(self.doc_ids):
+            self._doc_len_arr = np.asarray(self.doc_len, dtype=np.float32)
+
+    def _term_arrays(self, term: str):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings.get(term)
+            if not posting:
+                return None
+            arrays = (
+                np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float32, count=len(posting)),
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def save(self, persist_dir: str) -> None:
+        out = Path(persist_dir) / LEXICAL_INDEX_FILE
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "doc_len": self.doc_len,
+            "postings": {t: [[i, tf] for i, tf in p.items()] for t, p in self.postings.items()},
+        }
+        tmp = out.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(out)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "BM25Index":
+        data = json.loads((Path(persist_dir) / LEXICAL_INDEX_FILE).read_text(encoding="utf-8"))
+        idx = cls(k1=data.get("k1", 1.2), b=data.get("b", 0.75))
+        idx.doc_ids = data["doc_ids"]
+        idx.doc_len = data["doc_len"]
+        idx.total_len = sum(idx.doc_len)
+        idx.postings = {t: {i: tf for i, tf in p} for t, p in data["postings"].items()}
+        return idx
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return (Path(persist_dir) / LEXICAL_INDEX_FILE).exists()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuse several ranked id lists; ids ranked high in any list come first."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -1,59 +1,116 @@
+import asyncio
 import logging
+import random
+import threading
+from typing import AsyncIterator, Iterator, List, Optional, Sequence
+
+import httpx
+from llama_index.core.llms import ChatMessage, ChatResponse, MessageRole
 from llama_index.core.settings import Settings
 from .config import config
+from .lazy import LazyService
+from .llm_cache import wrap_with_cache
 
 logger = logging.getLogger(__name__)
 
+_RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+_END = object()
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Transient transport/server errors worth another attempt."""
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TransportError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status in _RETRYABLE_STATUS:
+        return True
+    # openai.APIConnectionError / APITimeoutError carry no status code
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
 class LLMManager:
-    """Language Model Manager supporting Ollama or OpenAI based on config."""
+    """Language Model Manager supporting Ollama or OpenAI based on config.
+
+    All calls made through `complete`/`chat` and their async and streaming
+    variants share one background event loop with pooled keep-alive HTTP
+    clients, bounded concurrency, retries with backoff and per-call timeouts.
+    """
 
     def __init__(self):
         self.llm = None
         self.embed_model = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
         self._initialize_models()
 
+    def _http_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=config.LLM_POOL_SIZE,
+            max_keepalive_connections=config.LLM_POOL_SIZE,
+            keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+        )
+
     def _initialize_models(self) -> None:
-        """Initialize either Ollama or OpenAI clients per config."""
+        """Initialize either Ollama or OpenAI clients per config, and the EMBED_BACKEND embedding model."""
         try:
+            # Only pass a temperature when configured; otherwise keep the backend default
+            generation_kwargs = {}
+            if config.LLM_TEMPERATURE is not None:
+                generation_kwargs["temperature"] = config.LLM_TEMPERATURE
+
             if config.LLM_BACKEND == "openai":
                 # ─── OpenAI Setup ───────────────────────────────────────────
                 from llama_index.llms.openai import OpenAI
-                from llama_index.embeddings.openai import OpenAIEmbedding
 
-                logger.info("Initializing OpenAI LLM & Embedding")
+                logger.info("Initializing OpenAI LLM")
                 self.llm = OpenAI(
                     api_key=config.OPENAI_API_KEY,
                     model=config.OPENAI_COMPLETION_MODEL,
                     request_timeout=config.OPENAI_REQUEST_TIMEOUT,
-                )
-                self.embed_model = OpenAIEmbedding(
-                    api_key=config.OPENAI_API_KEY,
-                    model=config.OPENAI_EMBED_MODEL,
-                    request_timeout=config.OPENAI_REQUEST_TIMEOUT,
+                    # retries are handled by LLMManager
+                    max_retries=0,
+                    http_client=httpx.Client(limits=self._http_limits()),
+                    async_http_client=httpx.AsyncClient(limits=self._http_limits()),
+                    **generation_kwargs,
                 )
 
             else:
                 # ─── Ollama Setup ────────────────────────────────────────────
                 from llama_index.llms.ollama import Ollama
-                from llama_index.embeddings.ollama import OllamaEmbedding
+                from ollama import AsyncClient, Client
 
-                logger.info("Initializing Ollama LLM & Embedding")
+                logger.info("Initializing Ollama LLM")
                 self.llm = Ollama(
                     model=config.OLLAMA_LLM_MODEL,
                     request_timeout=config.OLLAMA_REQUEST_TIMEOUT,
                     base_url=config.OLLAMA_HOST,
-                )
-                self.embed_model = OllamaEmbedding(
-                    model_name=config.OLLAMA_EMBED_MODEL,
-                    base_url=config.OLLAMA_HOST,
+                    keep_alive=config.OLLAMA_KEEP_ALIVE,
+                    client=Client(host=config.OLLAMA_HOST, timeout=config.OLLAMA_REQUEST_TIMEOUT,
+                                  limits=self._http_limits()),
+                    async_client=AsyncClient(host=config.OLLAMA_HOST, timeout=config.OLLAMA_REQUEST_TIMEOUT,
+                                             limits=self._http_limits()),
+                    **generation_kwargs,
                 )
 
+            # Embeddings default to the LLM backend but can run in-process ("local"/"hash")
+            self.embed_model = self._build_embed_model(config.EMBED_BACKEND or config.LLM_BACKEND)
+
+            # Opt-in disk cache of deterministic completions
+            self.llm = wrap_with_cache(self.llm)
+
             # Register globally for llama_index
             Settings.llm = self.llm
             Settings.embed_model = self.embed_model
 
-            # Quick sanity check
-            self._test_connection()
+            # Sanity check: "sync" blocks until the model answers, "background" only logs
+            if config.LLM_HEALTHCHECK == "sync":
+                self._test_connection()
+            elif config.LLM_HEALTHCHECK == "background":
+                threading.Thread(target=self.is_available, name="llm-healthcheck", daemon=True).start()
 
             logger.info("✅ LLM & Embedding initialized successfully")
 
@@ -61,16 +118,59 @@ class LLMManager:
             logger.error(f"❌ Error initializing LLM backends: {e}")
             raise
 
+    def _build_embed_model(self, backend: str):
+        """Embedding model for "ollama", "openai", "local" (ONNX on CPU) or "hash" (deterministic)."""
+        logger.info(f"Initializing {backend} embedding model")
+        if backend == "openai":
+            from llama_index.embeddings.openai import OpenAIEmbedding
+            return OpenAIEmbedding(
+                api_key=config.OPENAI_API_KEY,
+                model=config.OPENAI_EMBED_MODEL,
+                request_timeout=config.OPENAI_REQUEST_TIMEOUT,
+            )
+        if backend == "ollama":
+            from llama_index.embeddings.ollama import OllamaEmbedding
+            return OllamaEmbedding(
+                model_name=config.OLLAMA_EMBED_MODEL,
+                base_url=config.OLLAMA_HOST,
+            )
+        from .embeddings import build_embed_model
+        return build_embed_model(backend)
+
     def _test_connection(self) -> None:
         """Simple sanity-check call to ensure LLM is responsive."""
         try:
-            # both Ollama and OpenAI share `.complete()` signature
-            resp = self.llm.complete("Hello, are you there?")
+            # Past the completion cache, which would answer this fixed prompt for a dead backend
+            resp = self.complete("Hello, are you there?", retries=0, cache=False)
             logger.debug(f"LLM healthcheck response: {resp}")
         except Exception as e:
             logger.error(f"LLM healthcheck failed: {e}")
             raise
 
+    def keep_warm(self) -> List[str]:
+        """
+        Load the models, or keep them loaded. Ollama models are pinned in memory
+        for OLLAMA_KEEP_ALIVE (embedding requests otherwise use the server default),
+        in-process embedding models run once. Returns the models touched.
+        """
+        embed_backend = config.EMBED_BACKEND or config.LLM_BACKEND
+        touched = []
+        if "ollama" in (config.LLM_BACKEND, embed_backend):
+            from ollama import Client
+
+            client = Client(host=config.OLLAMA_HOST, timeout=config.OLLAMA_REQUEST_TIMEOUT)
+            if config.LLM_BACKEND == "ollama":
+                # An empty prompt only loads the model
+                client.generate(model=config.OLLAMA_LLM_MODEL, prompt="", keep_alive=config.OLLAMA_KEEP_ALIVE)
+                touched.append(config.OLLAMA_LLM_MODEL)
+            if embed_backend == "ollama":
+                client.embed(model=config.OLLAMA_EMBED_MODEL, input="warm-up", keep_alive=config.OLLAMA_KEEP_ALIVE)
+                touched.append(config.OLLAMA_EMBED_MODEL)
+        if embed_backend in ("local", "hash"):
+            self.embed_model.get_query_embedding("warm-up")
+            touched.append(self.embed_model.model_name)
+        return touched
+
     def get_llm(self):
         """Return the raw LLM instance for llama_index pipelines."""
         return self.llm
@@ -79,14 +179,123 @@ class LLMManager:
         """Return the embedding model instance."""
         return self.embed_model
 
-    def complete(self, prompt: str) -> str:
-        """Convenience wrapper around the LLM’s complete() method."""
+    # ─── Background event loop ──────────────────────────────────────────────
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Start (once) the event loop that owns the async HTTP client pool."""
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name="llm-io", daemon=True)
+                    thread.start()
+                    self._semaphore = asyncio.Semaphore(config.LLM_MAX_CONCURRENCY)
+                    self._loop_thread = thread
+                    self._loop = loop
+        return self._loop
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+    async def _run_on_loop(self, coro):
+        """Await `coro` on the LLM loop from any other event loop."""
+        return await asyncio.wrap_future(self._submit(coro))
+
+    async def _backoff(self, attempt: int) -> None:
+        delay = config.LLM_RETRY_BACKOFF * (2 ** attempt)
+        await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    # ─── Core calls (run on the LLM loop) ───────────────────────────────────
+    async def _achat(self, messages: Sequence[ChatMessage], timeout: float, retries: int,
+                     cache: bool = True) -> ChatResponse:
+        llm = self.llm if cache else getattr(self.llm, "inner", self.llm)
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    return await asyncio.wait_for(llm.achat(messages), timeout)
+            except Exception as e:
+                if attempt >= retries or not _is_retryable(e):
+                    raise
+                logger.warning(f"LLM call failed ({type(e).__name__}: {e}), retry {attempt + 1}/{retries}")
+                await self._backoff(attempt)
+                attempt += 1
+
+    async def _astream_chat(self, messages: Sequence[ChatMessage], timeout: float, retries: int) -> AsyncIterator[str]:
+        """Yield text deltas; retries only happen before the first delta. `timeout` bounds each chunk."""
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self._semaphore:
+                    gen = await asyncio.wait_for(self.llm.astream_chat(messages), timeout)
+                    try:
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(gen.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                return
+                            if chunk.delta:
+                                started = True
+                                yield chunk.delta
+                    finally:
+                        await gen.aclose()
+            except Exception as e:
+                if started or attempt >= retries or not _is_retryable(e):
+                    raise
+                logger.warning(f"LLM stream failed ({type(e).__name__}: {e}), retry {attempt + 1}/{retries}")
+                await self._backoff(attempt)
+                attempt += 1
+
+    @staticmethod
+    async def _anext(agen):
         try:
-            return str(self.llm.complete(prompt))
+            return await agen.__anext__()
+        except StopAsyncIteration:
+            return _END
+
+    @staticmethod
+    def _messages(prompt: str) -> List[ChatMessage]:
+        return [ChatMessage(role=MessageRole.USER, content=prompt)]
+
+    def _call_args(self, timeout: Optional[float], retries: Optional[int]):
+        return (
+            timeout if timeout is not None else config.LLM_CALL_TIMEOUT,
+            retries if retries is not None else config.LLM_MAX_RETRIES,
+        )
+
+    # ─── Public API ─────────────────────────────────────────────────────────
+    def chat(self, messages: Sequence[ChatMessage], timeout: Optional[float] = None,
+             retries: Optional[int] = None, cache: bool = True) -> ChatResponse:
+        """Thread-safe blocking chat call through the pooled client (`cache=False` skips LLM_CACHE)."""
+        try:
+            return self._submit(self._achat(messages, *self._call_args(timeout, retries), cache)).result()
         except Exception as e:
-            logger.error(f"Error during LLM.complete(): {e}")
+            logger.error(f"Error during LLM.chat(): {type(e).__name__}: {e}")
             raise
 
+    async def achat(self, messages: Sequence[ChatMessage], timeout: Optional[float] = None,
+                    retries: Optional[int] = None) -> ChatResponse:
+        """Async chat call; safe to await from any event loop."""
+        return await self._run_on_loop(self._achat(messages, *self._call_args(timeout, retries)))
+
+    def complete(self, prompt: str, timeout: Optional[float] = None, retries: Optional[int] = None,
+                 cache: bool = True) -> str:
+        """Convenience wrapper returning the completion text."""
+        return self.chat(self._messages(prompt), timeout, retries, cache).message.content or ""
+
+    def stream_complete(self, prompt: str, timeout: Optional[float] = None,
+                        retries: Optional[int] = None) -> Iterator[str]:
+        """Yield completion text deltas as they arrive."""
+        agen = self._astream_chat(self._messages(prompt), *self._call_args(timeout, retries))
+        try:
+            while True:
+                delta = self._submit(self._anext(agen)).result()
+                if delta is _END:
+                    return
+                yield delta
+        finally:
+            self._submit(agen.aclose()).result()
+
     def is_available(self) -> bool:
         """Return True if LLM is reachable and responsive."""
         try:
@@ -95,4 +304,5 @@ class LLMManager:
         except:
             return False
 
-llm_manager = LLMManager()
+# Built on first use, not at import
+llm_manager = LazyService(LLMManager, "llm_manager")
@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+    MessageRole,
+)
+
+from .config import config
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# LLM attributes that change the generated text
+_GENERATION_PARAMS = (
+    "temperature", "top_p", "max_tokens", "context_window", "json_mode",
+    "additional_kwargs", "seed", "system_prompt",
+)
+
+
+class CompletionCache:
+    """SQLite store of prompt-hash -> completion text with LRU eviction by total size."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions(last_used)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE completions SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, text: str) -> None:
+        size = len(text.encode("utf-8")) + len(key)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, text, size, created, last_used, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (key, text, size, now, now),
+            )
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is at 90% of its limit."""
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM completions ORDER BY last_used"
+        ).fetchall():
+            if self._total <= target:
+                break
+            self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self._total -= size
+            evicted += 1
+        metrics.incr("llm_cache.evicted", evicted)
+        logger.info(f"LLM cache evicted {evicted} entries ({self._total / 2**20:.1f} MiB left)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        return {"entries": count, "bytes": self._total, "max_bytes": self.max_bytes}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+            self._total = 0
+
+
+class CachedLLM(CustomLLM):
+    """
+    Wraps a llama_index LLM and serves repeated chat/complete calls from a
+    CompletionCache. Streaming calls and calls with extra kwargs (tools,
+    formats) always go to the wrapped LLM.
+    """
+
+    _llm: Any = PrivateAttr()
+    _cache: CompletionCache = PrivateAttr()
+    _key_base: Dict[str, Any] = PrivateAttr()
+
+    def __init__(self, llm: Any, cache: CompletionCache, **kwargs: Any):
+        super().__init__(callback_manager=llm.callback_manager, **kwargs)
+        self._llm = llm
+        self._cache = cache
+        params = {}
+        for name in _GENERATION_PARAMS:
+            value = getattr(llm, name, None)
+            if value is not None:
+                params[name] = value
+        self._key_base = {
+            "backend": config.LLM_BACKEND,
+            "model": llm.metadata.model_name,
+            "params": params,
+        }
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "cached_llm"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._llm.metadata
+
+    @property
+    def inner(self) -> Any:
+        return self._llm
+
+    @property
+    def cache(self) -> CompletionCache:
+        return self._cache
+
+    def _key(self, kind: str, payload: Any) -> str:
+        data = dict(self._key_base, kind=kind, payload=payload)
+        raw = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _chat_payload(messages: Sequence[ChatMessage]):
+        return [[m.role.value, m.content] for m in messages]
+
+    def _lookup(self, key: str) -> Optional[str]:
+        text = self._cache.get(key)
+        metrics.incr("llm_cache.hit" if text is not None else "llm_cache.miss")
+        return text
+
+    def _store(self, key: str, text: str) -> None:
+        try:
+            self._cache.put(key, text)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    # The async calls run on the LLM event loop, so SQLite I/O goes to the default
+    # executor: lookups are awaited, writes are not waited for
+    async def _alookup(self, key: str) -> Optional[str]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._lookup, key)
+
+    def _astore(self, key: str, text: str) -> None:
+        asyncio.get_running_loop().run_in_executor(None, self._store, key, text)
+
+    # ─── Chat ────────────────────────────────────────────────────────────────
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        if kwargs:
+            return self._llm.chat(messages, **kwargs)
+        key = self._key("chat", self._chat_payload(messages))
+        text = self._lookup(key)
+        if text is not None:
+            return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text))
+        response = self._llm.chat(messages)
+        self._cache.put(key, response.message.content or "")
+        return response
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        if kwargs:
+            return await self._llm.achat(messages, **kwargs)
+        key = self._key("chat", self._chat_payload(messages))
+        text = await self._alookup(key)
+        if text is not None:
+            return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text))
+        response = await self._llm.achat(messages)
+        self._astore(key, response.message.content or "")
+        return response
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        return self._llm.stream_chat(messages, **kwargs)
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        return await self._llm.astream_chat(messages, **kwargs)
+
+    # ─── Completion ─────────────────────────────────────────────────────────
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if kwargs:
+            return self._llm.complete(prompt, formatted=formatted, **kwargs)
+        key = self._key("complete", [prompt, formatted])
+        text = self._lookup(key)
+        if text is not None:
+            return CompletionResponse(text=text)
+        response = self._llm.complete(prompt, formatted=formatted)
+        self._cache.put(key, response.text)
+        return response
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if kwargs:
+            return await self._llm.acomplete(prompt, formatted=formatted, **kwargs)
+        key = self._key("complete", [prompt, formatted])
+        text = await self._alookup(key)
+        if text is not None:
+            return CompletionResponse(text=text)
+        response = await self._llm.acomplete(prompt, formatted=formatted)
+        self._astore(key, response.text)
+        return response
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        return self._llm.stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        return await self._llm.astream_complete(prompt, formatted=formatted, **kwargs)
+
+
+def wrap_with_cache(llm: Any) -> Any:
+    """Return `llm` wrapped in a CachedLLM when LLM_CACHE is on and generation is deterministic."""
+    if not config.LLM_CACHE:
+        return llm
+    temperature = getattr(llm, "temperature", None)
+    if temperature is None or temperature > 0:
+        logger.warning(f"LLM_CACHE is on but temperature is {temperature}; set LLM_TEMPERATURE=0 to cache completions")
+        return llm
+    path = config.LLM_CACHE_PATH or str(Path(config.TABLE_INDEX_DIR) / "llm_cache.sqlite")
+    cache = CompletionCache(path, int(config.LLM_CACHE_MAX_MB * 2**20))
+    logger.info(f"LLM completion cache enabled at {path} ({cache.stats()['entries']} entries)")
+    return CachedLLM(llm, cache)
@@ -0,0 +1,469 @@
+"""
+HTTP load generator for the chat API, plus the stub pipeline that a server
+runs with PIPELINE_BACKEND=stub (simulated LLM/database latencies, no model
+or database calls) to load-test the web layer on its own.
+
+Drive a running server with a request mix, closed-loop (fixed concurrency) or
+open-loop (Poisson arrivals at --rate), and write the results as JSON:
+    python -m app.loadtest --url http://127.0.0.1:5000 --concurrency 8 --duration 60
+    python -m app.loadtest --rate 5 --concurrency 32 --mix chat=8,data=1,batch=1 --out release.json
+    python -m app.loadtest --serve-stub --concurrency 16 --requests 500 --compare release.json
+
+Reports throughput, p50/p95/p99 latency, time to first byte of the response
+body (first streamed line for batch requests), time to first token of chat
+answers (sent with "stream": true, so the first NDJSON line carries the first
+synthesized delta), and error and 429 rates per request kind.
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from .config import config
+from .sessions import session_store
+from .singleflight import SingleFlight
+from .sql_templates import normalize_question
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("chat", "data", "batch")
+
+# Used when neither --questions nor the warm-up question log supplies any
+DEFAULT_QUESTIONS = [
+    "2023 онд Монгол улсын хүн амын тоо хэд байсан бэ?",
+    "Улаанбаатар хотын ажилгүйдлийн түвшин 2022 онд хэд байсан бэ?",
+    "Сүүлийн 5 жилийн инфляцийн түвшинг харуул",
+    "Аймгаар малын тоо 2021 онд",
+    "2020 оны өрхийн дундаж орлого",
+    "Экспортын нийт дүн 2019-2023 онуудад",
+    "How many households were there in 2020?",
+    "Average monthly wage by sector in 2022",
+]
+
+
+# ─── Stub pipeline ──────────────────────────────────────────────────────────
+class StubPipeline:
+    """
+    Stand-in for ChatbotPipeline served with PIPELINE_BACKEND=stub. Each stage
+    sleeps for its configured latency (with jitter) instead of calling a model
+    or the database; LLM stages share LLM_MAX_CONCURRENCY slots as they do in
+    LLMManager. Sessions and request coalescing work as in the real pipeline.
+    """
+
+    # Batch runs get these instead of model embeddings
+    EMBEDDING = [0.0] * 8
+
+    def __init__(self):
+        self.ann_index_dict = {}
+        self.lexical_index_dict = {}
+        self.shard_index_dict = {}
+        self._llm_slots = threading.BoundedSemaphore(config.LLM_MAX_CONCURRENCY)
+        self._answers_in_flight = SingleFlight("answer")
+        logger.info(f"Stub pipeline: LLM {config.STUB_LLM_MS}ms, DB {config.STUB_DB_MS}ms, "
+                    f"jitter ±{config.STUB_JITTER:.0%}")
+
+    @staticmethod
+    def _sleep(ms: float) -> None:
+        time.sleep(max(0.0, ms / 1000 * random.uniform(1 - config.STUB_JITTER, 1 + config.STUB_JITTER)))
+
+    def _llm(self) -> None:
+        with self._llm_slots:
+            self._sleep(config.STUB_LLM_MS)
+
+    def _stream_llm(self, text: str, on_delta: Callable[[str], None]) -> None:
+        """Stream `text` word by word: half the LLM latency to the first token, the rest spread over the words."""
+        words = text.split(" ")
+        with self._llm_slots:
+            self._sleep(config.STUB_LLM_MS / 2)
+            for i, word in enumerate(words):
+                if i:
+                    self._sleep(config.STUB_LLM_MS / 2 / len(words))
+                on_delta(word if i == 0 else f" {word}")
+
+    def auto_refresh_if_needed(self) -> bool:
+        return False
+
+    def embed_questions(self, questions: List[str]) -> Dict[str, List[float]]:
+        return {q: self.EMBEDDING for q in questions}
+
+    def _retrieve_tables(self, query_str: str) -> List:
+        return [SimpleNamespace(table_name="stub_table")]
+
+    def answer(self, query_str: str, table_schema_objs: Optional[List] = None, table_contexts: Optional[Dict] = None,
+               timings: Optional[Dict[str, float]] = None, schema: Optional[str] = None,
+               use_templates: bool = True, data_only: bool = False,
+               on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        timings = timings if timings is not None else {}
+
+        def timed(stage, fn, *args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timings[f"{stage}_s"] = round(time.perf_counter() - start, 4)
+
+        if table_schema_objs is None:
+            table_schema_objs = timed("retrieval", self._retrieve_tables, query_str)
+        sql_query = "SELECT 1 AS stub"
+        response = f"Stub answer to: {query_str}"
+        timed("text2sql", self._llm)
+        if not data_only:
+            timed("sql", self._sleep, config.STUB_DB_MS)
+            if on_delta is not None:
+                timed("synthesis", self._stream_llm, response, on_delta)
+            else:
+                timed("synthesis", self._llm)
+        return {
+            "response": response,
+            "sql_query": sql_query,
+            "tables": [t.table_name for t in table_schema_objs],
+            "table_schema_objs": table_schema_objs,
+            "schema": schema or "",
+        }
+
+    def run_session_query(self, query_str: str, session_id: Optional[str] = None, data_only: bool = False,
+                          on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        session = session_store.get(session_id)
+        with session.lock:
+            followup = session.is_followup(query_str, self._retrieve_tables)
+            if followup:
+                result = self.answer(query_str, session.tables, data_only=data_only, on_delta=on_delta)
+                coalesced = False
+            else:
+                result, coalesced = self._answers_in_flight.do(
+                    (normalize_question(query_str), data_only),
+                    lambda: self.answer(query_str, data_only=data_only, on_delta=on_delta),
+                )
+            session.remember(query_str, result["sql_query"], result["table_schema_objs"], result["schema"])
+        return {
+            "response": result["response"],
+            "sql_query": result["sql_query"],
+            "tables": result["tables"],
+            "session_id": session.session_id,
+            "followup": followup,
+            "coalesced": coalesced,
+        }
+
+
+# ─── Load generator ─────────────────────────────────────────────────────────
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'chat=8,batch=1' -> {"chat": 8.0, "batch": 1.0}"""
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown request kind {kind!r}, expected one of {KINDS}")
+        mix[kind] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The request mix needs a positive weight")
+    return mix
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _latency_stats(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    stats = {f"p{q}_ms": percentile(values, q) for q in (50, 95, 99)}
+    stats["max_ms"] = values[-1] if values else None
+    stats["mean_ms"] = sum(values) / len(values) if values else None
+    return {k: None if v is None else round(v * 1000, 2) for k, v in stats.items()}
+
+
+def summarize(samples: List[Dict], elapsed_s: float) -> Dict:
+    """Throughput, latency and error figures of one kind (or all) of the samples."""
+    ok = [s for s in samples if s["ok"]]
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "throughput_rps": round(len(ok) / elapsed_s, 3) if elapsed_s else 0.0,
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "rate_429": round(sum(s["status"] == 429 for s in samples) / len(samples), 4) if samples else 0.0,
+        "coalesced": sum(s["coalesced"] for s in samples),
+        "latency": _latency_stats([s["latency_s"] for s in ok]),
+        "ttfb": _latency_stats([s["ttfb_s"] for s in ok if s["ttfb_s"] is not None]),
+        "ttft": _latency_stats([s["ttft_s"] for s in ok if s["ttft_s"] is not None]),
+        "errors": _top_errors(samples),
+    }
+
+
+def _top_errors(samples: List[Dict], n: int = 5) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for s in samples:
+        if not s["ok"]:
+            counts[s["error"]] = counts.get(s["error"], 0) + 1
+    return dict(sorted(counts.items(), key=lambda kv: -kv[1])[:n])
+
+
+class LoadGenerator:
+    """
+    Sends a weighted mix of chat, data-mode and batch requests to one server.
+    Closed loop: `concurrency` clients each send their next request as soon as
+    the last one finishes. Open loop (`rate`): requests arrive as a Poisson
+    process and latency is measured from the scheduled arrival, so time spent
+    queued behind `concurrency` in-flight requests counts (no coordinated omission).
+    """
+
+    def __init__(self, url: str, questions: List[str], mix: Dict[str, float], concurrency: int,
+                 rate: Optional[float] = None, batch_size: int = 10, timeout: float = 120.0,
+                 fetch_exports: bool = False, seed: Optional[int] = None):
+        self.url = url.rstrip("/")
+        self.questions = questions
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.concurrency = concurrency
+        self.rate = rate
+        self.batch_size = batch_size
+        self.fetch_exports = fetch_exports
+        self.random = random.Random(seed)
+        self.client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self.samples: List[Dict] = []
+        self._lock = threading.Lock()
+
+    # ─── Requests ───────────────────────────────────────────────────────────
+    def _send(self, method: str, path: str, sample: Dict, first_token: bool = False, **kwargs) -> bytes:
+        """
+        Stream one response, recording its status and the time to its first body
+        byte (and with `first_token`, to its first complete NDJSON line); returns the body.
+        """
+        with self.client.stream(method, f"{self.url}{path}", **kwargs) as response:
+            sample["status"] = response.status_code
+            chunks = []
+            for chunk in response.iter_bytes():
+                elapsed = time.perf_counter() - sample["start"]
+                if sample["ttfb_s"] is None:
+                    sample["ttfb_s"] = elapsed
+                if first_token and sample["ttft_s"] is None and b"\n" in chunk:
+                    sample["ttft_s"] = elapsed
+                chunks.append(chunk)
+        body = b"".join(chunks)
+        sample["bytes"] += len(body)
+        return body
+
+    def _chat(self, sample: Dict, mode: str) -> None:
+        # Answers are streamed so the first line marks the first token; data mode has no tokens to stream
+        stream = mode == "answer"
+        body = {"message": self.random.choice(self.questions), "session_id": uuid.uuid4().hex, "mode": mode,
+                "stream": stream}
+        response = self._send("POST", "/api/chat", sample, first_token=stream, json=body)
+        if sample["status"] != 200:
+            return
+        data = json.loads(response.splitlines()[-1] if stream else response)
+        if data.get("status") != "success":
+            sample["error"] = f"app:{data.get('error_type') or 'error'}"
+            return
+        sample["coalesced"] = bool(data.get("coalesced"))
+        export = data.get("export")
+        if mode == "data" and self.fetch_exports and export:
+            self._send("GET", export["csv"], sample)
+
+    def _batch(self, sample: Dict) -> None:
+        questions = [self.random.choice(self.questions) for _ in range(self.batch_size)]
+        response = self._send("POST", "/api/chat/batch", sample, json={"questions": questions})
+        if sample["status"] == 200:
+            results = [json.loads(line) for line in response.splitlines() if line.strip()]
+            failed = sum(r.get("status") != "success" for r in results)
+            if failed or len(results) != len(questions):
+                sample["error"] = f"app:batch {failed} failed, {len(results)}/{len(questions)} answered"
+
+    def request(self, kind: str, scheduled: Optional[float] = None) -> Dict:
+        start = time.perf_counter()
+        sample = {"kind": kind, "start": scheduled or start, "status": None, "ttfb_s": None, "ttft_s": None,
+                  "bytes": 0, "error": None, "coalesced": False}
+        try:
+            if kind == "batch":
+                self._batch(sample)
+            else:
+                self._chat(sample, "data" if kind == "data" else "answer")
+        except httpx.HTTPError as e:
+            sample["error"] = f"http:{type(e).__name__}"
+        sample["latency_s"] = time.perf_counter() - sample["start"]
+        if sample["error"] is None and sample["status"] is not None and sample["status"] >= 400:
+            sample["error"] = f"status:{sample['status']}"
+        sample["ok"] = sample["error"] is None
+        with self._lock:
+            self.samples.append(sample)
+        return sample
+
+    def _pick(self) -> str:
+        return self.random.choices(self.kinds, self.weights)[0]
+
+    # ─── Runs ───────────────────────────────────────────────────────────────
+    def run(self, duration: Optional[float] = None, requests: Optional[int] = None) -> Dict:
+        """Run until `duration` seconds pass or `requests` were sent, whichever comes first."""
+        if duration is None and requests is None:
+            raise ValueError("a duration or a request count is required")
+        deadline = time.perf_counter() + duration if duration else float("inf")
+        budget = requests if requests is not None else float("inf")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load") as pool:
+            if self.rate:
+                self._open_loop(pool, deadline, budget)
+            else:
+                counter = iter(range(int(budget) if budget != float("inf") else 1 << 62))
+
+                def client():
+                    while time.perf_counter() < deadline:
+                        with self._lock:
+                            if next(counter, None) is None:
+                                return
+                        self.request(self._pick())
+
+                for _ in range(self.concurrency):
+                    pool.submit(client)
+        elapsed = time.perf_counter() - started
+        self.client.close()
+        return self.report(elapsed)
+
+    def _open_loop(self, pool: ThreadPoolExecutor, deadline: float, budget: float) -> None:
+        sent = 0
+        arrival = time.perf_counter()
+        while sent < budget:
+            arrival += self.random.expovariate(self.rate)
+            if arrival >= deadline:
+                break
+            time.sleep(max(0.0, arrival - time.perf_counter()))
+            pool.submit(self.request, self._pick(), arrival)
+            sent += 1
+
+    def report(self, elapsed_s: float) -> Dict:
+        by_kind = {kind: summarize([s for s in self.samples if s["kind"] == kind], elapsed_s) for kind in self.kinds}
+        return {
+            "url": self.url,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "mix": dict(zip(self.kinds, self.weights)),
+            "duration_s": round(elapsed_s, 3),
+            "overall": summarize(self.samples, elapsed_s),
+            "by_kind": by_kind,
+        }
+
+
+# ─── Reporting ──────────────────────────────────────────────────────────────
+def _ms(value: Optional[float]) -> str:
+    return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+
+
+def print_report(report: Dict) -> None:
+    print(f"{report['url']}  concurrency={report['concurrency']} rate={report['rate'] or 'closed-loop'} "
+          f"duration={report['duration_s']}s")
+    print(f"{'kind':<8} {'reqs':>6} {'rps':>8} {'err%':>6} {'429%':>6} {'shared':>6} "
+          f"{'p50':>9} {'p95':>9} {'p99':>9} {'ttfb50':>9} {'ttfb99':>9} {'ttft50':>9} {'ttft99':>9}  (ms)")
+    rows = dict(report["by_kind"], all=report["overall"])
+    for kind, s in rows.items():
+        lat, ttfb, ttft = s["latency"], s["ttfb"], s["ttft"]
+        print(f"{kind:<8} {s['requests']:>6} {s['throughput_rps']:>8.2f} {s['error_rate'] * 100:>6.1f} "
+              f"{s['rate_429'] * 100:>6.1f} {s['coalesced']:>6} {_ms(lat['p50_ms'])} {_ms(lat['p95_ms'])} {_ms(lat['p99_ms'])} "
+              f"{_ms(ttfb['p50_ms'])} {_ms(ttfb['p99_ms'])} {_ms(ttft['p50_ms'])} {_ms(ttft['p99_ms'])}")
+    for kind, s in rows.items():
+        for error, count in s["errors"].items():
+            print(f"  {kind}: {count} x {error}")
+
+
+def print_comparison(report: Dict, baseline: Dict) -> None:
+    """Change of the overall figures against an earlier run's JSON."""
+    now, then = report["overall"], baseline["overall"]
+    print(f"vs {baseline.get('label') or 'baseline'}:")
+    pairs = [("throughput_rps", now["throughput_rps"], then["throughput_rps"]),
+             ("error_rate", now["error_rate"], then["error_rate"])]
+    pairs += [(f"latency {k}", now["latency"][k], then["latency"][k]) for k in ("p50_ms", "p95_ms", "p99_ms")]
+    pairs += [(f"{m} {k}", now[m][k], then.get(m, {}).get(k)) for m in ("ttfb", "ttft") for k in ("p50_ms", "p99_ms")]
+    for name, new, old in pairs:
+        if new is None or old is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {name:<18} {old:>10.3f} -> {new:>10.3f}  ({change})")
+
+
+def load_questions(path: Optional[str]) -> List[str]:
+    if path:
+        from .batch import parse_questions
+        return [item["question"] for item in parse_questions(Path(path).read_text(encoding="utf-8").splitlines())]
+    from .warmup import question_log
+    return question_log.top(100) or DEFAULT_QUESTIONS
+
+
+def serve_stub(port: int = 0) -> str:
+    """Start the web app with the stub pipeline in this process; returns its base URL."""
+    from werkzeug.serving import make_server
+
+    # This process only serves the stub, so nothing may reach a model, including the LLM startup check
+    config.PIPELINE_BACKEND = "stub"
+    config.LLM_HEALTHCHECK = "off"
+    from .web_app import app
+
+    # One access-log line per request would drown the report
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    for _ in range(100):
+        if httpx.get(f"{url}/ready").status_code == 200:
+            break
+        time.sleep(0.1)
+    return url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat API")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:5000", help="Server to test")
+    parser.add_argument("--serve-stub", action="store_true",
+                        help="Serve the app with the stub pipeline in this process and test that instead of --url")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients (closed loop) or in-flight cap (--rate)")
+    parser.add_argument("--rate", type=float, help="Open-loop arrivals per second (Poisson)")
+    parser.add_argument("--duration", type=float, help="Seconds to run (default 60 unless --requests)")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--mix", type=str, default="chat=1", help="Weighted request kinds, e.g. chat=8,data=1,batch=1")
+    parser.add_argument("--batch-size", type=int, default=10, help="Questions per batch request")
+    parser.add_argument("--questions", type=str, help="Question file (one per line or JSONL); default: question log")
+    parser.add_argument("--fetch-exports", action="store_true", help="Also download the CSV of data-mode answers")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, help="Seed for question and request-kind choice")
+    parser.add_argument("--label", type=str, help="Name of this run (e.g. the release) stored in the JSON")
+    parser.add_argument("--out", type=str, help="Write the results as JSON to this file")
+    parser.add_argument("--compare", type=str, help="JSON of an earlier run to compare against")
+    args = parser.parse_args()
+    logging.basicConfig(level=config.LOG_LEVEL)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    url = serve_stub() if args.serve_stub else args.url
+    generator = LoadGenerator(url, load_questions(args.questions), mix, args.concurrency, rate=args.rate,
+                              batch_size=args.batch_size, timeout=args.timeout,
+                              fetch_exports=args.fetch_exports, seed=args.seed)
+    duration = args.duration if args.duration or args.requests else 60.0
+    report = generator.run(duration=duration, requests=args.requests)
+    report["label"] = args.label
+    report["stub"] = args.serve_stub
+    report["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    print_report(report)
+    if args.compare:
+        print_comparison(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,40 @@
+import argparse
 import logging
 import sys
 from .pipeline import ChatbotPipeline
 from .config import config
+from .sql_validator import SQLValidationError
+from .batch import BatchRunner, parse_questions, to_jsonl
 
 logger = logging.getLogger(__name__)
  
+def run_batch(pipeline: ChatbotPipeline, path: str, output: str = None, concurrency: int = None) -> None:
+    """Answer every question in a JSONL file, writing JSONL results as they complete."""
+    with open(path, encoding="utf-8") as f:
+        items = parse_questions(f)
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    try:
+        for line in to_jsonl(BatchRunner(pipeline, concurrency).run(items)):
+            out.write(line)
+            out.flush()
+    finally:
+        if output:
+            out.close()
+
 def main():
+    parser = argparse.ArgumentParser(description='Chatbot CLI')
+    parser.add_argument('--batch', type=str, help='JSONL file of questions to answer in one run')
+    parser.add_argument('--output', type=str, help='Write batch results to this JSONL file (default: stdout)')
+    parser.add_argument('--concurrency', type=int, help='Questions processed in parallel in batch mode')
+    args = parser.parse_args()
+
     logging.basicConfig(level=config.LOG_LEVEL)
     pipeline = ChatbotPipeline()
+    if args.batch:
+        run_batch(pipeline, args.batch, args.output, args.concurrency)
+        return
     print("Chatbot CLI. Type 'exit' or 'quit' to stop.")
+    session_id = None
     while True:
         try:
             question = input("You: ")
@@ -19,8 +45,12 @@ def main():
             print("Goodbye!")
             break
         try:
-            result = pipeline.query_pipeline.run(input = question)
-            print(f"Bot: {result}")
+            result = pipeline.run_session_query(question, session_id)
+            session_id = result['session_id']
+            print(f"Bot: {result['response']}")
+        except SQLValidationError as e:
+            logger.warning(f"Rejected invalid SQL: {e.sql}")
+            print(f"Error: could not build a valid SQL query ({e})")
         except Exception as e:
             logger.error(f"Error processing question: {e}")
             print(f"Error: {e}")
@@ -0,0 +1,76 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class Metrics:
+    """Thread-safe in-process counters and timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._values: Dict[str, Dict[str, float]] = {}
+        self.started_at = time.time()
+
+    def incr(self, name: str, n: int = 1) -> int:
+        with self._lock:
+            value = self._counters.get(name, 0) + n
+            self._counters[name] = value
+            return value
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            t = self._timings.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            t["count"] += 1
+            t["total_s"] += seconds
+            t["max_s"] = max(t["max_s"], seconds)
+
+    def record(self, name: str, value: float) -> None:
+        """Track count/total/max/last of a non-time quantity (e.g. prompt tokens)."""
+        with self._lock:
+            v = self._values.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+            v["count"] += 1
+            v["total"] += value
+            v["max"] = max(v["max"], value)
+            v["last"] = value
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def rate(self, hit: str, miss: str) -> float:
+        """Share of `hit` among `hit` + `miss` counts."""
+        with self._lock:
+            hits = self._counters.get(hit, 0)
+            total = hits + self._counters.get(miss, 0)
+        return hits / total if total else 0.0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            timings = {
+                k: dict(v, avg_s=v["total_s"] / v["count"] if v["count"] else 0.0)
+                for k, v in self._timings.items()
+            }
+            values = {
+                k: dict(v, avg=v["total"] / v["count"] if v["count"] else 0.0)
+                for k, v in self._values.items()
+            }
+            return {
+                "uptime_s": time.time() - self.started_at,
+                "counters": dict(self._counters),
+                "timings": timings,
+                "values": values,
+            }
+
+
+metrics = Metrics()
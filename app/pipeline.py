@@ -1,26 +1,42 @@
 import json
 import os
 import re
+import time
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 import logging
-from datetime import datetime
 
-from llama_index.core import SQLDatabase, VectorStoreIndex, load_index_from_storage, Document
+from llama_index.core import VectorStoreIndex, load_index_from_storage
 from llama_index.core.objects import SQLTableNodeMapping, ObjectIndex, SQLTableSchema
 from llama_index.core.retrievers import SQLRetriever
-from llama_index.core.query_pipeline import QueryPipeline as QP, InputComponent, FnComponent
 from llama_index.core.program import LLMTextCompletionProgram
 from llama_index.core.bridge.pydantic import BaseModel, Field
 from llama_index.core.schema import TextNode
 from llama_index.core.storage import StorageContext
-from llama_index.core.llms import ChatResponse
+from llama_index.core.llms import ChatMessage, ChatResponse, MessageRole
+import numpy as np
 from sqlalchemy import text
     
 from .config import config
-from .db import db_manager
+from .db import db_manager, workload
 from .llm import llm_manager
 from .prompts import prompt_manager
+from .rows import row_serializer
+from .query_embedding import query_embeddings
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .ann import IVFIndex
+from .shards import ShardBuilder, ShardedRowIndex, sharded_tables
+from .singleflight import SingleFlight
+from .sql_templates import normalize_question, sql_templates
+from .index_tracker import IndexTracker, get_index_status
+from .sql_validator import SchemaCatalog, SQLValidationError, SQLValidator
+from .metrics import metrics
+from .answer_formatter import answer_formatter
+from .sessions import session_store
+from .sql_database import CatalogSQLDatabase
+from .context_budget import TableContext, context_assembler
+from .tokens import token_counter
+from .tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -30,58 +46,36 @@ class TableInfo(BaseModel):
     table_summary: str = Field(..., description="short, concise summary/caption of the table")
     column_descriptions: dict = Field(..., description="dictionary of column_name: description")
 
-class IndexTracker:
-    """Track which database rows have been indexed"""
-    def __init__(self, tracker_file: str = None):
-        if tracker_file is None:
-            tracker_file = Path(config.TABLE_INDEX_DIR) / "index_tracker.json"
-        self.tracker_file = Path(tracker_file)
-        self.tracker_file.parent.mkdir(parents=True, exist_ok=True)
-        self.load_tracker()
-
-    def load_tracker(self):
-        try:
-            with open(self.tracker_file, 'r', encoding='utf-8') as f:
-                self.tracked = json.load(f)
-        except FileNotFoundError:
-            self.tracked = {}
-
-    def save_tracker(self):
-        with open(self.tracker_file, 'w', encoding='utf-8') as f:
-            json.dump(self.tracked, f, indent=2, ensure_ascii=False)
-
-    def get_last_indexed_id(self, table_name: str) -> int:
-        return self.tracked.get(table_name, {}).get('last_id', 0)
-
-    def get_last_indexed_count(self, table_name: str) -> int:
-        return self.tracked.get(table_name, {}).get('last_count', 0)
-
-    def update_last_indexed(self, table_name: str, last_id: int = None, last_count: int = None):
-        if table_name not in self.tracked:
-            self.tracked[table_name] = {}
-        if last_id is not None:
-            self.tracked[table_name]['last_id'] = last_id
-        if last_count is not None:
-            self.tracked[table_name]['last_count'] = last_count
-        self.tracked[table_name]['last_update'] = datetime.now().isoformat()
-        self.save_tracker()
-
 class ChatbotPipeline:
     """Main chatbot pipeline for text-to-SQL and response generation"""
     def __init__(self):
         self.sql_database = None
-        self.query_pipeline = None
+        self.table_retriever = None
+        self.sql_validator = None
+        self._validator_catalog_version = None
+        self.sql_retriever = None
         self.table_infos = []
         self.vector_index_dict = {}
+        self.lexical_index_dict = {}
+        self.ann_index_dict = {}
+        # Row indices served by shard worker processes (ROW_SHARDED_TABLES)
+        self.shard_index_dict: Dict[str, ShardedRowIndex] = {}
+        # Identical questions asked at the same time share one run
+        self._answers_in_flight = SingleFlight("answer")
         self.index_tracker = IndexTracker()
         self._initialize()
 
     def _initialize(self):
         logger.info("Initializing chatbot pipeline...")
-        self.sql_database = SQLDatabase(db_manager.engine)
-        self._generate_table_summaries()
-        self._create_vector_indices()
-        self._setup_query_pipeline() 
+        config.ensure_dirs()
+        # Registers the LLM and embedding model in llama_index Settings
+        llm_manager.get()
+        self.sql_database = CatalogSQLDatabase(db_manager.get_engine("interactive"), db_manager.get_catalog)
+        # Sample rows and full-table scans use the batch pool, never the chat pool
+        with workload("batch"):
+            self._generate_table_summaries()
+            self._create_vector_indices()
+        self._setup_query_components()
         logger.info("✅ Chatbot pipeline initialized successfully")
 
     def is_first_run(self) -> bool:
@@ -89,8 +83,9 @@ class ChatbotPipeline:
 
     def incremental_update(self) -> int:
         total_new_docs = 0
-        for table_name in self.sql_database.get_usable_table_names():
-            total_new_docs += self._update_table_index(table_name)
+        with workload("batch"):
+            for table_name in self.sql_database.get_usable_table_names():
+                total_new_docs += self._update_table_index(table_name)
         logger.info(f"✅ Incremental update complete. Added {total_new_docs} new documents")
         return total_new_docs
 
@@ -102,162 +97,273 @@ class ChatbotPipeline:
                 last_count = self.index_tracker.get_last_indexed_count(table_name)
                 last_id    = self.index_tracker.get_last_indexed_id(table_name)
                 logger.debug(f"[DEBUG] {table_name}: current_count={current_count}, last_count={last_count}, last_id={last_id}")
-                cols = conn.execute(text(
-                    """
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_name = :tbl AND column_name IN ('id','ID','Id')
-                    ORDER BY ordinal_position
-                    """), {"tbl": table_name}).fetchall()
-            id_col = cols[0][0] if cols else None
+            id_col = db_manager.get_id_column(table_name)
             last_id = self.index_tracker.get_last_indexed_id(table_name)
             last_count = self.index_tracker.get_last_indexed_count(table_name)
             if current_count <= last_count:
                 return 0
+            if table_name in sharded_tables():
+                return self._update_sharded_table_index(table_name, id_col, last_id, last_count, current_count)
             idx_path = Path(config.TABLE_INDEX_DIR) / table_name
             if not idx_path.exists():
                 return self._create_full_table_index(table_name)
             idx = load_index_from_storage(StorageContext.from_defaults(persist_dir=str(idx_path)), index_id="vector_index")
-            if id_col:
-                new_rows = db_manager.get_new_rows_since_id(table_name, last_id, id_column=id_col, limit=config.MAX_ROWS_PER_TABLE)
-            else:
-                new_rows = db_manager.get_new_rows_by_offset(table_name, offset=last_count, limit=config.MAX_ROWS_PER_TABLE)
-            
-            logger.debug(f"[DEBUG] {table_name}: fetched {len(new_rows)} new rows -> {new_rows}")
-            if not new_rows:
+            if self._ann_index_lost(table_name, idx):
+                # Appending would leave an ANN index of the new rows only
+                return self._create_full_table_index(table_name)
+            last_ctid = self.index_tracker.get_last_indexed_ctid(table_name)
+            if not id_col and last_ctid is None and last_count > 0:
+                # Indexed before ctid positions were tracked: locate the last indexed row once
+                last_ctid = db_manager.get_ctid_at_offset(table_name, last_count - 1)
+            # Keyset scan from the last indexed id (or ctid for tables without one)
+            nodes, last_key = [], None
+            for batch in db_manager.iter_row_batches(table_name, id_col or "ctid", after=last_id if id_col else last_ctid,
+                                                     limit=config.MAX_ROWS_PER_TABLE):
+                nodes.extend(row_serializer.batch_to_nodes(table_name, batch, id_column=id_col))
+                last_key = batch.last_key
+
+            logger.debug(f"[DEBUG] {table_name}: fetched {len(nodes)} new rows")
+            if not nodes:
                 return 0
-            for row in new_rows:
-                idx.insert(Document(text=str(row)))
+            lex = self._load_lexical_index(table_name, idx)
+            idx.insert_nodes(nodes)
+            self._update_ann_index(table_name, idx, [n.node_id for n in nodes])
             idx.storage_context.persist(str(idx_path))
             self.vector_index_dict[table_name] = idx
-            self.index_tracker.update_last_indexed(table_name, last_count=current_count)
-            if id_col:
-                max_id = max(row[id_col] for row in new_rows)
-                self.index_tracker.update_last_indexed(table_name, last_id=max_id)
-            return len(new_rows)
+            lex.add_many((n.node_id, n.get_content()) for n in nodes)
+            lex.save(str(idx_path))
+            self.index_tracker.update_last_indexed(
+                table_name,
+                last_id=last_key if id_col else None,
+                last_count=current_count,
+                last_ctid=None if id_col else last_key,
+            )
+            return len(nodes)
         except Exception as e:
             logger.error(f"Error updating index for {table_name}: {e}")
             return 0
 
+    def _update_sharded_table_index(self, table_name: str, id_col: Optional[str], last_id, last_count: int,
+                                    current_count: int) -> int:
+        """Append new rows to a sharded table's partitions (the workers reload them)."""
+        builder = ShardBuilder(table_name)
+        if not builder.exists():
+            return self._create_full_table_index(table_name)
+        after = last_id if id_col else self.index_tracker.get_last_indexed_ctid(table_name)
+        if not id_col and after is None and last_count > 0:
+            after = db_manager.get_ctid_at_offset(table_name, last_count - 1)
+        added, last_key = builder.update(after, limit=config.MAX_ROWS_PER_TABLE)
+        if added:
+            self.index_tracker.update_last_indexed(
+                table_name,
+                last_id=last_key if id_col else None,
+                last_count=current_count,
+                last_ctid=None if id_col else last_key,
+            )
+        return added
+
     def _create_full_table_index(self, table_name: str) -> int:
         """Create a full index for a table (used when index doesn't exist)"""
+        if table_name in sharded_tables():
+            return self._create_sharded_table_index(table_name)
         try:
             idx_path = Path(config.TABLE_INDEX_DIR) / table_name
-            with db_manager.get_connection() as conn:
-                # Fetch all rows
-                result = conn.execute(text(f'SELECT * FROM "{table_name}"'))
-                rows = result.mappings().all()
-                total_count = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).scalar()
-                # Detect ID column
-                cols = conn.execute(text(
-                    """
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_name = :tbl AND column_name IN ('id','ID','Id')
-                    ORDER BY ordinal_position
-                    """
-                ), {"tbl": table_name}).fetchall()
-            id_col = cols[0][0] if cols else None
-            # Build vector nodes for rows
-            nodes = [Document(text=str(r)) for r in rows]
-            idx = VectorStoreIndex(nodes)
+            id_col = db_manager.get_id_column(table_name)
+            # Stream the table in key order and embed chunk by chunk (primary key kept in metadata)
+            idx = VectorStoreIndex([])
             idx.set_index_id("vector_index")
+            lex = BM25Index()
+            total_count, last_key = 0, None
+            for batch in db_manager.iter_row_batches(table_name, id_col):
+                nodes = row_serializer.batch_to_nodes(table_name, batch, id_column=id_col)
+                idx.insert_nodes(nodes)
+                lex.add_many((n.node_id, n.get_content()) for n in nodes)
+                total_count += len(batch)
+                last_key = batch.last_key
+            self._update_ann_index(table_name, idx)
             idx.storage_context.persist(str(idx_path))
+            lex.save(str(idx_path))
+            self.lexical_index_dict[table_name] = lex
 
             # Update tracker to reflect table
-            last_id = max(r[id_col] for r in rows) if id_col and rows else None
             self.index_tracker.update_last_indexed(
                 table_name,
-                last_id=last_id,
-                last_count=total_count
+                last_id=last_key if id_col else None,
+                last_count=total_count,
+                last_ctid=None if id_col else last_key,
             )
             self.vector_index_dict[table_name] = idx
-            logger.info(f"✅ Created full index for {table_name} with {len(nodes)} documents")
-            return len(nodes)
+            logger.info(f"✅ Created full index for {table_name} with {total_count} documents")
+            return total_count
         except Exception as e:
             logger.error(f"Error creating full index for {table_name}: {e}")
             return 0
 
-    
+
+    def _create_sharded_table_index(self, table_name: str) -> int:
+        """Build all partitions of a sharded table's row index (served by `python -m app.shards`)."""
+        try:
+            id_col = db_manager.get_id_column(table_name)
+            total_count, last_key = ShardBuilder(table_name).build()
+            self.index_tracker.update_last_indexed(
+                table_name,
+                last_id=last_key if id_col else None,
+                last_count=total_count,
+                last_ctid=None if id_col else last_key,
+            )
+            self.shard_index_dict[table_name] = ShardedRowIndex(table_name)
+            logger.info(f"✅ Created {config.ROW_SHARDS}-shard index for {table_name} with {total_count} documents")
+            return total_count
+        except Exception as e:
+            logger.error(f"Error creating sharded index for {table_name}: {e}")
+            return 0
+
     def _generate_table_summaries(self):
+        """
+        Load cached table summaries, keyed by table name and schema fingerprint.
+        Only tables that are new or whose columns changed are summarized by the
+        LLM, from 5 sample rows, so a warm start reads no table data.
+        """
         logger.info("Generating table summaries...")
-        dfs, table_info_list = db_manager.load_all_tables(limit=1000)
-        program = LLMTextCompletionProgram.from_defaults(
-            output_cls=TableInfo,
-            llm=llm_manager.get_llm(),
-            prompt_template_str=prompt_manager.get_table_info_prompt().template,
-        )
-        table_names = set()
-        for idx, (df, table_info) in enumerate(zip(dfs, table_info_list)):
-            existing = self._get_existing_table_info(idx)
-            if existing:
-                self.table_infos.append({
-                    'original_table_name': table_info['table_name'],
-                    'table_name': existing.table_name,
-                    'table_summary': existing.table_summary,
-                    'column_descriptions': existing.column_descriptions
-                })
-                logger.info(f"Loaded existing info for table: {existing.table_name}")
+        catalog = db_manager.get_table_fingerprints()
+        cached = {name: self._get_existing_table_info(name) for name in catalog}
+        if any(entry is None for entry in cached.values()):
+            cached.update(self._migrate_legacy_table_infos(catalog, cached))
+
+        program = None
+        table_names = {entry[0].table_name for entry in cached.values() if entry is not None}
+        for table_name, table_info in catalog.items():
+            entry = cached.get(table_name)
+            if entry is not None and entry[1] == table_info['fingerprint']:
+                info = entry[0]
+                logger.info(f"Loaded existing info for table: {info.table_name}")
             else:
-                table_structure = ", ".join(table_info['columns'])
-                sample_data = df.head(5).to_string()
-                attempts = 0
-                while attempts < 3:
-                    try:
-                        gen = program(
-                            table_name=table_info['table_name'],
-                            table_structure=table_structure,
-                            table_data=sample_data,
-                            exclude_table_name_list=str(list(table_names)),
-                        )
-                        if gen.table_name not in table_names:
-                            table_names.add(gen.table_name)
-                            break
-                        attempts += 1
-                        logger.warning(f"Duplicate table_name {gen.table_name}, retrying...")
-                    except Exception as e:
-                        logger.error(f"Error generating table summary: {e}")
-                        gen = TableInfo(
-                            table_name=table_info['table_name'],
-                            table_summary=f"Database table with {table_info['row_count']} rows",
-                            column_descriptions={}
-                        )
-                        break
-                self._save_table_info(idx, gen)
-                self.table_infos.append({
-                    'original_table_name': table_info['table_name'],
-                    'table_name': gen.table_name,
-                    'table_summary': gen.table_summary,
-                    'column_descriptions': gen.column_descriptions
-                })
-                logger.info(f"Generated summary for table: {gen.table_name}")
-
-    def _get_existing_table_info(self, idx: int) -> Optional[TableInfo]:
-        results = list(Path(config.TABLE_INFO_DIR).glob(f"{idx}_*"))
-        if not results:
-            return None
-        if len(results) == 1:
+                if entry is not None:
+                    logger.info(f"Columns of {table_name} changed, regenerating its summary")
+                    table_names.discard(entry[0].table_name)
+                if program is None:
+                    program = LLMTextCompletionProgram.from_defaults(
+                        output_cls=TableInfo,
+                        llm=llm_manager.get_llm(),
+                        prompt_template_str=prompt_manager.get_table_info_prompt().template,
+                    )
+                info = self._summarize_table(program, table_info, table_names)
+                self._save_table_info(table_name, table_info['fingerprint'], info)
+                logger.info(f"Generated summary for table: {info.table_name}")
+            self.table_infos.append({
+                'original_table_name': table_name,
+                'table_name': info.table_name,
+                'table_summary': info.table_summary,
+                'column_descriptions': info.column_descriptions
+            })
+
+    def _summarize_table(self, program, table_info: Dict, table_names: set) -> TableInfo:
+        """Ask the LLM for a unique descriptive name, summary and column descriptions."""
+        table_structure = ", ".join(table_info['columns'])
+        sample_data = db_manager.get_sample_data(table_info['table_name'], num_rows=5)
+        attempts = 0
+        while attempts < 3:
             try:
-                data = json.loads(results[0].read_text(encoding='utf-8'))
-                data.setdefault("column_descriptions", {})
-                return TableInfo.model_validate(data)
+                gen = program(
+                    table_name=table_info['table_name'],
+                    table_structure=table_structure,
+                    table_data=sample_data,
+                    exclude_table_name_list=str(list(table_names)),
+                )
+                if gen.table_name not in table_names:
+                    break
+                attempts += 1
+                logger.warning(f"Duplicate table_name {gen.table_name}, retrying...")
             except Exception as e:
-                logger.error(f"Error loading table info from {results[0]}: {e}")
-        else:
-            logger.warning(f"Multiple table info files for index {idx}: {results}")
-        return None
+                logger.error(f"Error generating table summary: {e}")
+                gen = TableInfo(
+                    table_name=table_info['table_name'],
+                    table_summary=f"Database table with about {table_info['row_count']} rows",
+                    column_descriptions={}
+                )
+                break
+        table_names.add(gen.table_name)
+        return gen
+
+    @staticmethod
+    def _table_info_path(table_name: str) -> Path:
+        return Path(config.TABLE_INFO_DIR) / f"{table_name}.json"
+
+    def _get_existing_table_info(self, table_name: str) -> Optional[Tuple[TableInfo, str]]:
+        """Cached summary of `table_name` and the schema fingerprint it was generated for."""
+        path = self._table_info_path(table_name)
+        if not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+            data.setdefault("column_descriptions", {})
+            return TableInfo.model_validate(data), data.get("fingerprint", "")
+        except Exception as e:
+            logger.error(f"Error loading table info from {path}: {e}")
+            return None
 
-    def _save_table_info(self, idx: int, info: TableInfo):
-        out = Path(config.TABLE_INFO_DIR) / f"{idx}_{info.table_name}.json"
+    def _save_table_info(self, table_name: str, fingerprint: str, info: TableInfo):
+        out = self._table_info_path(table_name)
+        data = dict(info.model_dump(), source_table=table_name, fingerprint=fingerprint)
         try:
-            out.write_text(json.dumps(info.model_dump(), ensure_ascii=False, indent=2), encoding='utf-8')
+            out.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
         except Exception as e:
             logger.error(f"Error saving table info to {out}: {e}")
 
+    def _migrate_legacy_table_infos(self, catalog: Dict[str, Dict],
+                                    cached: Dict[str, Optional[Tuple[TableInfo, str]]]) -> Dict[str, Tuple[TableInfo, str]]:
+        """
+        Adopt summaries saved as `<idx>_<name>.json` by earlier versions, where idx
+        was the table's position in the inspector's table list. A file is kept only
+        if its column descriptions match the table's columns; adopted files are
+        rewritten under the table name and moved to `legacy/`.
+        """
+        legacy_files = {}
+        for path in Path(config.TABLE_INFO_DIR).glob("*_*.json"):
+            idx, _, _ = path.stem.partition("_")
+            if idx.isdigit():
+                legacy_files.setdefault(int(idx), []).append(path)
+        if not legacy_files:
+            return {}
+
+        migrated = {}
+        legacy_dir = Path(config.TABLE_INFO_DIR) / "legacy"
+        for idx, table_name in enumerate(db_manager.get_table_names()):
+            paths = legacy_files.get(idx, [])
+            if table_name not in catalog or cached.get(table_name) is not None or len(paths) != 1:
+                continue
+            try:
+                data = json.loads(paths[0].read_text(encoding='utf-8'))
+                if "fingerprint" in data:
+                    continue  # current format for a table whose name starts with digits
+                data.setdefault("column_descriptions", {})
+                info = TableInfo.model_validate(data)
+            except Exception as e:
+                logger.error(f"Error loading legacy table info from {paths[0]}: {e}")
+                continue
+            # Fallback summaries carry the source table name; others must describe only its columns
+            if ((info.table_name in catalog and info.table_name != table_name)
+                    or not set(info.column_descriptions) <= set(catalog[table_name]['column_names'])):
+                logger.warning(f"Legacy table info {paths[0].name} does not match table {table_name}, ignoring it")
+                continue
+            fingerprint = catalog[table_name]['fingerprint']
+            self._save_table_info(table_name, fingerprint, info)
+            legacy_dir.mkdir(exist_ok=True)
+            paths[0].rename(legacy_dir / paths[0].name)
+            migrated[table_name] = (info, fingerprint)
+            logger.info(f"Migrated legacy table info {paths[0].name} to {table_name}.json")
+        return migrated
+
     def _create_vector_indices(self):
         logger.info("Creating vector indices for tables...")
         for tbl in self.sql_database.get_usable_table_names():
             logger.info(f"Indexing rows in table: {tbl}")
+            if tbl in sharded_tables():
+                if ShardBuilder(tbl).exists():
+                    self.shard_index_dict[tbl] = ShardedRowIndex(tbl)
+                else:
+                    self._create_sharded_table_index(tbl)
+                continue
             idx_path = Path(config.TABLE_INDEX_DIR) / tbl
             if not idx_path.exists():
                 self._create_full_table_index(tbl)
@@ -266,66 +372,188 @@ class ChatbotPipeline:
                     ctx = StorageContext.from_defaults(persist_dir=str(idx_path))
                     idx = load_index_from_storage(ctx, index_id="vector_index")
                     self.vector_index_dict[tbl] = idx
+                    if self._ann_index_lost(tbl, idx):
+                        self._create_full_table_index(tbl)
+                        continue
+                    self._load_lexical_index(tbl, idx)
+                    if self._load_ann_index(tbl) is not None:
+                        idx.vector_store.data.embedding_dict.clear()
                 except Exception as e:
                     logger.error(f"Error loading index for {tbl}: {e}")
                     self._create_full_table_index(tbl)
-        logger.info(f"Created vector indices for {len(self.vector_index_dict)} tables")
+        logger.info(f"Created vector indices for {len(self.vector_index_dict)} tables"
+                    f" ({len(self.shard_index_dict)} sharded)")
+
+    def _load_lexical_index(self, table_name: str, idx: VectorStoreIndex) -> BM25Index:
+        """Load the table's BM25 index, building it from the docstore if missing."""
+        idx_path = Path(config.TABLE_INDEX_DIR) / table_name
+        if BM25Index.exists(str(idx_path)):
+            lex = BM25Index.load(str(idx_path))
+        else:
+            logger.info(f"Building lexical index for {table_name} from docstore")
+            lex = BM25Index()
+            lex.add_many((node_id, node.get_content()) for node_id, node in idx.docstore.docs.items())
+            lex.save(str(idx_path))
+        self.lexical_index_dict[table_name] = lex
+        return lex
+
+    def _load_ann_index(self, table_name: str) -> Optional[IVFIndex]:
+        idx_path = Path(config.TABLE_INDEX_DIR) / table_name
+        if not IVFIndex.exists(str(idx_path)):
+            self.ann_index_dict.pop(table_name, None)
+            return None
+        ann = IVFIndex.load(str(idx_path))
+        self.ann_index_dict[table_name] = ann
+        return ann
+
+    def _ann_index_lost(self, table_name: str, idx: VectorStoreIndex) -> bool:
+        """True if the table's embeddings were handed to ANN files that are now gone (rebuild the table)."""
+        idx_path = Path(config.TABLE_INDEX_DIR) / table_name
+        if IVFIndex.exists(str(idx_path)) or len(idx.vector_store.data.embedding_dict) >= len(idx.docstore.docs):
+            return False
+        logger.warning(f"ANN index files of {table_name} are missing and the vector store lacks its embeddings, "
+                       f"rebuilding the table index")
+        return True
+
+    def _update_ann_index(self, table_name: str, idx: VectorStoreIndex, new_node_ids: Optional[List[str]] = None) -> None:
+        """
+        Keep the table's IVF index in step with its vector index; call before persisting `idx`.
+        Appends `new_node_ids` to an existing ANN index, or builds one from all
+        stored embeddings once the table reaches ANN_MIN_ROWS (or, with quantized
+        ROW_VECTOR_DTYPE, for every table as a single-list flat index).
+        Once a table has ANN files they own its embeddings, so the JSON vector
+        store is emptied of them.
+        """
+        quantized = config.ROW_VECTOR_DTYPE != "float32"
+        if config.ANN_MIN_ROWS <= 0 and not quantized:
+            return
+        idx_path = Path(config.TABLE_INDEX_DIR) / table_name
+        idx_path.mkdir(parents=True, exist_ok=True)
+        embedding_dict = idx.vector_store.data.embedding_dict
+        ann = self._load_ann_index(table_name) if new_node_ids is not None else None
+        if ann is not None:
+            ids = [i for i in new_node_ids if i in embedding_dict]
+            ann.add(ids, np.asarray([embedding_dict[i] for i in ids], dtype=np.float32))
+        else:
+            ids = list(embedding_dict)
+            large = config.ANN_MIN_ROWS > 0 and len(ids) >= config.ANN_MIN_ROWS
+            if not ids or not (large or quantized):
+                # Small float32 table: exact search; drop any ANN index left from a previous build
+                IVFIndex.remove(str(idx_path))
+                self.ann_index_dict.pop(table_name, None)
+                return
+            ann = IVFIndex(nlist=None if large else 1)
+            ann.build(ids, np.asarray([embedding_dict[i] for i in ids], dtype=np.float32))
+            logger.info(f"Built {ann.dtype} ANN index for {table_name}: {len(ann)} vectors, {ann.nlist} lists")
+        ann.save(str(idx_path))
+        self.ann_index_dict[table_name] = ann
+        embedding_dict.clear()
 
     # debug
-    def _debug_sql_results(self, sql_results) -> str:
-        print(f"\n--- DEBUG: RAW SQL RESULTS (FROM DATABASE) ---\n{sql_results}\n--- END DEBUG ---\n")
-        return sql_results 
+    def _debug_sql_results(self, sql_results):
+        """Trace the raw SQL results; their text is built only for stored traces, and truncated."""
+        def results() -> str:
+            parts, size = [], 0
+            for n in sql_results:
+                if size > config.TRACE_MAX_PAYLOAD_CHARS:
+                    break
+                parts.append(n.node.get_content())
+                size += len(parts[-1]) + 1
+            return "\n".join(parts)
+
+        tracer.event("sql_results", rows=sum(len(n.node.metadata.get("result", [])) for n in sql_results),
+                     results=results)
+        return sql_results
 
     def _log_sql_query(self, sql_query: str) -> str:
         """Log the raw SQL before execution."""
-        # print for debug
-        print(f"\n--- DEBUG: GENERATED SQL QUERY ---\n{sql_query}\n--- END DEBUG ---\n")
+        tracer.event("sql_query", sql=sql_query)
         logger.debug(f"→ running SQL:\n{sql_query}")
         return sql_query
 
-    def _parse_response_to_sql(self, response: ChatResponse) -> str:
+    def _text_to_sql(self, query_str: str, schema: str, use_templates: bool = True) -> Tuple[str, bool]:
+        """Fill a cached SQL template for the question, or ask the text2sql LLM. Returns (SQL, from template)."""
+        sql = sql_templates.match(query_str) if use_templates else None
+        if sql is not None:
+            logger.info("Using cached SQL template, skipping text2sql LLM call")
+            return sql, True
+        prompt = prompt_manager.get_text2sql_prompt().format(query_str=query_str, schema=schema)
+        response = llm_manager.chat([ChatMessage(role=MessageRole.USER, content=prompt)])
+        token_counter.record("text2sql", prompt, response)
+        return self._parse_response_to_sql(response), False
+
+    def _validate_sql(self, query_str: str, schema: str, sql_query: str) -> str:
+        """Check SQL against the schema catalog; repair it once via the LLM or fail fast."""
+        if not config.SQL_VALIDATION or self.sql_validator is None:
+            return sql_query
+        verdict, errors = self.sql_validator.check(sql_query)
+        if verdict == "unknown":
+            # The validator cannot parse this confidently; let the database judge it
+            metrics.incr("sql_validation.unknown")
+            logger.info(f"SQL validation inconclusive, running as generated: {errors}")
+            return sql_query
+        if not errors:
+            metrics.incr("sql_validation.ok")
+            return sql_query
+
+        metrics.incr("sql_validation.invalid")
+        logger.warning(f"Generated SQL failed validation: {errors}")
+        sql_templates.mark_failed(query_str)
+        for attempt in range(config.SQL_REPAIR_ATTEMPTS):
+            prompt = prompt_manager.get_sql_repair_prompt().format(
+                query_str=query_str, schema=schema, sql_query=sql_query, errors="\n".join(f"- {e}" for e in errors)
+            )
+            response = llm_manager.chat([ChatMessage(role=MessageRole.USER, content=prompt)])
+            sql_query = self._parse_response_to_sql(response)
+            errors = self.sql_validator.validate(sql_query)
+            if not errors:
+                metrics.incr("sql_validation.repaired")
+                logger.info(f"SQL repaired on attempt {attempt + 1}")
+                return sql_query
+            logger.warning(f"Repaired SQL still invalid (attempt {attempt + 1}): {errors}")
+
+        metrics.incr("sql_validation.rejected")
+        raise SQLValidationError(errors, sql_query)
+
+    def _format_answer(self, sql_query: str, sql_results) -> str:
+        """Template answer for simple result shapes; empty string means use the LLM."""
+        return answer_formatter.format(sql_query, sql_results, self.table_infos) or ""
+
+    def _synthesize_response(self, prompt: str, direct_answer: str = "",
+                             on_delta: Optional[Callable[[str], None]] = None) -> ChatResponse:
         """
-        Extract a clean SQL statement from the LLM's response, stripping out
-        markdown fences, any "assistant:" prefix, markers like SQLQuery/SQLResult,
-        and anything after the final semicolon (including trailing prose or "Answer:").
+        Answer synthesis through the pooled LLM client, unless a template answer
+        exists. With `on_delta` the answer is streamed and each text delta is
+        passed to it as it arrives.
         """
-        #  print for debug
-        print(f"\n--- DEBUG: LLM Response BEFORE SQL Parsing ---\n{response.message.content.strip()}\n--- END DEBUG ---\n")
-        
-        txt = response.message.content.strip()
-
-        # Drop leading "assistant:"
-        if txt.lower().startswith("assistant:"):
-            txt = txt[len("assistant:"):].strip()
-
-        # If there's a fenced sql block, grab its contents
-        fence = re.search(r"```(?:sql)?\s*([\s\S]*?)```", txt, re.IGNORECASE)
-        if fence:
-            txt = fence.group(1).strip()
+        if direct_answer:
+            logger.info(f"Answered from template, skipping synthesis LLM call "
+                        f"(bypass rate {metrics.rate('synthesis.bypass', 'synthesis.llm'):.0%})")
+            return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=direct_answer))
+        metrics.incr("synthesis.llm")
+        if on_delta is not None:
+            parts = []
+            for delta in llm_manager.stream_complete(prompt):
+                parts.append(delta)
+                on_delta(delta)
+            response = ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content="".join(parts)))
         else:
-            # Otherwise just remove stray backticks
-            txt = txt.replace("```", "").replace("`", "")
-
-        # Remove any SQLQuery: or SQLResult: sections
-        txt = re.sub(r"(?i)sqlquery:.*", "", txt)
-        txt = re.sub(r"(?i)sqlresult:.*", "", txt)
+            response = llm_manager.chat([ChatMessage(role=MessageRole.USER, content=prompt)])
+        token_counter.record("synthesis", prompt, response)
+        return response
 
-        # Truncate at the last semicolon
-        if ";" in txt:
-            txt = txt[: txt.rfind(";") + 1]
-
-        # Remove any trailing "Answer:" or similar explanation
-        txt = re.split(r"(?i)\banswer\s*:", txt)[0].strip()
-
-        # Finally drop any leading dialect label (sql:, postgresql:)
-        txt = re.sub(r"^(?:sql|postgresql)[:\s]*", "", txt, flags=re.IGNORECASE).strip()
-
-        # print for debug
-        print(f"\n--- DEBUG: PARSED SQL (After Cleaning) ---\n{txt}\n--- END DEBUG ---\n")
-        return txt
+    def _record_sql_template(self, query_str: str, sql_query: str, sql_results):
+        """Remember SQL that executed and returned rows as a reusable template."""
+        try:
+            if any(n.node.metadata.get("result") for n in sql_results):
+                sql_templates.record(query_str, sql_query)
+        except Exception as e:
+            logger.error(f"Error recording SQL template: {e}")
+        return sql_results
 
-    def _setup_query_pipeline(self):
-        logger.info("Setting up query pipeline...")
+    def _setup_query_components(self):
+        """Build the table retriever, SQL validator and SQL runner used by `answer`."""
+        logger.info("Setting up query components...")
         # Build schema contexts
         schemas = []
         for t in self.table_infos:
@@ -335,96 +563,106 @@ class ChatbotPipeline:
 
         node_map = SQLTableNodeMapping(self.sql_database)
         obj_index = ObjectIndex.from_objects(schemas, node_map, VectorStoreIndex)
-        table_retriever = obj_index.as_retriever(similarity_top_k=config.MAX_TABLE_RETRIEVAL)
-
-        sql_retriever = SQLRetriever(self.sql_database)
-        table_parser = FnComponent(fn=self._get_table_context_and_rows_str)
-        sql_parser  = FnComponent(fn=self._parse_response_to_sql)
-        log_sql     = FnComponent(fn=self._log_sql_query)
-
-        self.query_pipeline = QP(verbose=config.DEBUG) 
-        self.query_pipeline.add_modules({
-            "input": InputComponent(),
-            "table_retriever": table_retriever,
-            "table_output_parser": table_parser,
-            "text2sql_prompt": prompt_manager.get_text2sql_prompt(),
-            "text2sql_llm": llm_manager.get_llm(),
-            "sql_output_parser": sql_parser,
-            "log_sql": log_sql,
-            "sql_retriever": sql_retriever,
-            # debug_sql_results_printer module
-            "debug_sql_results_printer": FnComponent(fn=self._debug_sql_results), 
-            "response_synthesis_prompt": prompt_manager.get_response_synthesis_prompt(),
-            "response_synthesis_llm": llm_manager.get_llm(),
-        })
-
-        self.query_pipeline.add_link("input", "table_retriever")
-        self.query_pipeline.add_link("input", "table_output_parser", dest_key="query_str")
-        self.query_pipeline.add_link("table_retriever", "table_output_parser", dest_key="table_schema_objs")
-        self.query_pipeline.add_link("input", "text2sql_prompt", dest_key="query_str")
-        self.query_pipeline.add_link("table_output_parser", "text2sql_prompt", dest_key="schema")
-        self.query_pipeline.add_chain([
-            "text2sql_prompt",
-            "text2sql_llm",
-            "sql_output_parser",
-            "log_sql",
-            "sql_retriever",
-            # Added debug_sql_results_printer to the chain ---
-            "debug_sql_results_printer", 
-        ])
-        self.query_pipeline.add_link("sql_output_parser", "response_synthesis_prompt", dest_key="sql_query")
-        
-        # Changed link to use debug_sql_results_printer ---
-        self.query_pipeline.add_link("debug_sql_results_printer", "response_synthesis_prompt", dest_key="context_str")
-        
-        self.query_pipeline.add_link("input", "response_synthesis_prompt", dest_key="query_str")
-        self.query_pipeline.add_link("response_synthesis_prompt", "response_synthesis_llm")
-
-    def _get_table_context_and_rows_str(self, query_str: str, table_schema_objs: List[SQLTableSchema]) -> str:
-        parts = []
+        self.table_retriever = obj_index.as_retriever(similarity_top_k=config.MAX_TABLE_RETRIEVAL)
+
+        self._rebuild_sql_validator()
+        self.sql_retriever = SQLRetriever(self.sql_database)
+
+    def _rebuild_sql_validator(self) -> None:
+        # Built from the database's own catalog, whose version says which schema the validator knows
+        snapshot = db_manager.get_catalog()
+        self._validator_catalog_version = snapshot.version
+        self.sql_validator = SQLValidator(SchemaCatalog.from_snapshot(snapshot))
+
+    def _refresh_sql_validator(self, reload_catalog: bool = False) -> bool:
+        """Rebuild the SQL validator if the schema catalog changed since it was built."""
+        if db_manager.get_catalog(refresh=reload_catalog).version == self._validator_catalog_version:
+            return False
+        self._rebuild_sql_validator()
+        return True
+
+    def _retrieve_tables(self, query_str: str) -> List[SQLTableSchema]:
+        """Retrieve candidate tables using the request's shared question embedding."""
+        return self.table_retriever.retrieve(query_embeddings.query_bundle(query_str))
+
+    def embed_questions(self, questions: List[str]) -> Dict[str, List[float]]:
+        """Question embeddings in batched calls (cached ones reused), for batch runs."""
+        return query_embeddings.embed_many(questions)
+
+    def _dense_row_ids(self, table_name: str, query_str: str, top_k: int) -> List[str]:
+        """Node ids of the rows nearest to the question (IVF for large tables, exact otherwise)."""
+        ann = self.ann_index_dict.get(table_name)
+        if ann is not None:
+            return [node_id for node_id, _ in ann.search(query_embeddings.get(query_str), top_k)]
+        retr = self.vector_index_dict[table_name].as_retriever(similarity_top_k=top_k)
+        return [n.node.node_id for n in retr.retrieve(query_embeddings.query_bundle(query_str))]
+
+    def _retrieve_rows(self, table_name: str, query_str: str) -> List[str]:
+        """Example rows for a table via dense, lexical (BM25) or hybrid (RRF) retrieval."""
+        top_k = config.MAX_ROW_RETRIEVAL
+        if table_name in self.shard_index_dict:
+            mode = config.ROW_RETRIEVAL_MODE
+            embedding = query_embeddings.get(query_str) if mode != "lexical" else None
+            return self.shard_index_dict[table_name].search(query_str, embedding, top_k, mode)
+        idx = self.vector_index_dict[table_name]
+        lex = self.lexical_index_dict.get(table_name)
+        mode = config.ROW_RETRIEVAL_MODE if lex is not None else "dense"
+
+        if mode == "lexical":
+            ranked = [doc_id for doc_id, _ in lex.search(query_str, top_k)]
+        else:
+            depth = top_k if mode == "dense" else max(top_k, config.ROW_FUSION_CANDIDATES)
+            dense = self._dense_row_ids(table_name, query_str, depth)
+            if mode == "dense":
+                ranked = dense
+            else:
+                lexical = [doc_id for doc_id, _ in lex.search(query_str, depth)]
+                ranked = reciprocal_rank_fusion([dense, lexical])[:top_k]
+
+        rows = []
+        for node_id in ranked:
+            node = idx.docstore.get_node(node_id, raise_error=False)
+            if node is not None:
+                rows.append(str(node.get_content()))
+        return rows
+
+    def _table_context(self, schema: SQLTableSchema) -> TableContext:
+        """Question-independent part of a table's context: structure and descriptions."""
+        columns = [(c["name"], str(c["type"])) for c in self.sql_database.get_table_columns(schema.table_name)]
+
+        # Find the matching table info for detailed column descriptions
+        column_descriptions = {}
+        for t in self.table_infos:
+            if t['original_table_name'] == schema.table_name:
+                column_descriptions = t['column_descriptions'] or {}
+                break
+
+        return TableContext(schema.table_name, columns, schema.context_str or "", column_descriptions)
+
+    def _get_table_context_and_rows_str(self, query_str: str, table_schema_objs: List[SQLTableSchema],
+                                        table_contexts: Optional[Dict[str, TableContext]] = None) -> str:
+        """
+        Schema context plus question-specific example rows, trimmed to the text2sql
+        token budget; `table_contexts` caches the question-independent part across questions.
+        """
+        tables = []
         for schema in table_schema_objs:
-            # Get basic table info
-            info = self.sql_database.get_single_table_info(schema.table_name)
-        
-            # Add detailed table description with column information
-            if schema.context_str:
-                info += f"\n\nTable Description: {schema.context_str}"
-        
-            # Find the matching table info for detailed column descriptions
-            table_info = None
-            for t in self.table_infos:
-                if t['original_table_name'] == schema.table_name:
-                    table_info = t
-                    break
-        
-            # Add detailed column descriptions
-            if table_info and table_info['column_descriptions']:
-                info += "\n\nDetailed Column Descriptions:"
-                for col_name, col_desc in table_info['column_descriptions'].items():
-                    info += f"\n- {col_name}: {col_desc}"
-        
-            # Add sample rows with context about multi-column relationships
-            if schema.table_name in self.vector_index_dict:
+            if table_contexts is not None and schema.table_name in table_contexts:
+                cached = table_contexts[schema.table_name]
+            else:
+                cached = self._table_context(schema)
+                if table_contexts is not None:
+                    table_contexts[schema.table_name] = cached
+            table = TableContext(cached.name, cached.columns, cached.description, cached.column_descriptions)
+
+            if schema.table_name in self.vector_index_dict or schema.table_name in self.shard_index_dict:
                 try:
-                    retr = self.vector_index_dict[schema.table_name].as_retriever(
-                        similarity_top_k=config.MAX_ROW_RETRIEVAL
-                    )
-                    nodes = retr.retrieve(query_str)
-                    if nodes:
-                        info += "\n\nRelevant Example Rows (Note: Many records require multiple column conditions):"
-                        for i, node in enumerate(nodes):
-                            content = str(node.get_content())
-                            info += f"\nExample {i+1}: {content}"
-                    
-                        # Add guidance about multi-column filtering
-                        info += "\n\nIMPORTANT: When filtering this data, consider that records are often distinguished by combinations of columns like (period + scr_mn + scr_eng) or (period + code + scr_mn). A single column filter may not be sufficient to get the exact record you need."
-                        
+                    table.rows = self._retrieve_rows(schema.table_name, query_str)
                 except Exception as e:
                     logger.error(f"Error retrieving rows for {schema.table_name}: {e}")
-        
-            parts.append(info)
-    
-        return "\n\n" + "="*50 + "\n\n".join(parts)
+            tables.append(table)
+
+        return context_assembler.assemble(query_str, tables)
 
     def _parse_response_to_sql(self, response: ChatResponse) -> str:
         """
@@ -432,10 +670,7 @@ class ChatbotPipeline:
         markdown fences, any "assistant:" prefix, markers like SQLQuery/SQLResult,
         and anything after the final semicolon (including trailing prose or "Answer:").
         """
-        #  print for debug output ---
-        print(f"\n--- DEBUG: LLM Response BEFORE SQL Parsing ---\n{response.message.content.strip()}\n--- END DEBUG ---\n")
-
-        txt = response.message.content.strip()
+        raw = txt = response.message.content.strip()
 
         #  Drop leading "assistant:" if present
         if txt.lower().startswith("assistant:"):
@@ -463,7 +698,7 @@ class ChatbotPipeline:
         #drop any leading dialect label (sql:, postgresql:)
         txt = re.sub(r"^(?:sql|postgresql)[:\s]*", "", txt, flags=re.IGNORECASE).strip()
 
-        print(f"\n--- DEBUG: PARSED SQL (After Cleaning) ---\n{txt}\n--- END DEBUG ---\n")
+        tracer.event("sql_parse", response=raw, sql=txt)
         return txt
 
     def refresh_indices(self) -> Dict[str, int]:
@@ -476,9 +711,16 @@ class ChatbotPipeline:
     
         # Reload the tracker from disk
         self.index_tracker.load_tracker()
+
+        # Pick up schema changes; the validator checks SQL against the catalog
+        self._refresh_sql_validator(reload_catalog=True)
     
-        # Reload all vector indices from disk
+        # Reload all vector indices from disk (shard workers reload their own partitions)
         for table_name in self.sql_database.get_usable_table_names():
+            if table_name in sharded_tables():
+                if ShardBuilder(table_name).exists() and table_name not in self.shard_index_dict:
+                    self.shard_index_dict[table_name] = ShardedRowIndex(table_name)
+                continue
             idx_path = Path(config.TABLE_INDEX_DIR) / table_name
             if idx_path.exists():
                 try:
@@ -486,6 +728,9 @@ class ChatbotPipeline:
                     ctx = StorageContext.from_defaults(persist_dir=str(idx_path))
                     idx = load_index_from_storage(ctx, index_id="vector_index")
                     self.vector_index_dict[table_name] = idx
+                    self._load_lexical_index(table_name, idx)
+                    if self._load_ann_index(table_name) is not None:
+                        idx.vector_store.data.embedding_dict.clear()
                 
                     # Count documents (approximate)
                     try:
@@ -506,71 +751,188 @@ class ChatbotPipeline:
         logger.info(f"Index refresh complete. Refreshed {len(refreshed_counts)} tables")
         return refreshed_counts
 
-def get_index_status(self) -> Dict[str, Dict]:
-    """
-    Get status information about all indices.
-    Returns dict with table names and their indexing status.
-    """
-    status = {}
-    
-    for table_name in self.sql_database.get_usable_table_names():
+    def get_index_status(self) -> Dict[str, Dict]:
+        """
+        Get status information about all indices.
+        Returns dict with table names and their indexing status.
+        """
+        with workload("batch"):
+            return get_index_status(self.index_tracker, self.sql_database.get_usable_table_names())
+
+    def auto_refresh_if_needed(self) -> bool:
+        """
+        Check if indices need refreshing and refresh them if needed.
+        Returns True if refresh was performed.
+        """
+        # Schema changes (a new column, a renamed table) leave the tracker alone; the catalog
+        # snapshot is reloaded every CATALOG_TTL_S, so checking its version per request is cheap
+        self._refresh_sql_validator()
+
+        # Check if tracker file has been modified since we last loaded it
+        tracker_file = Path(self.index_tracker.tracker_file)
+        if not tracker_file.exists():
+            return False
+
+        # Get file modification time
+        file_mtime = tracker_file.stat().st_mtime
+
+        # Check if we have a stored mtime and if file is newer
+        if not hasattr(self, '_last_tracker_mtime'):
+            self._last_tracker_mtime = file_mtime
+            return False
+
+        if file_mtime > self._last_tracker_mtime:
+            logger.info("Tracker file updated externally, refreshing indices...")
+            self.refresh_indices()
+            self._last_tracker_mtime = file_mtime
+            return True
+
+        return False
+
+    def run_query(self, query_str: str) -> Dict:
+        """Answer one standalone question with auto-refresh (see `answer` for the result)."""
         try:
-            with db_manager.get_connection() as conn:
-                current_count = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).scalar()
-            
-            last_count = self.index_tracker.get_last_indexed_count(table_name)
-            last_id = self.index_tracker.get_last_indexed_id(table_name)
-            
-            idx_path = Path(config.TABLE_INDEX_DIR) / table_name
-            index_exists = idx_path.exists()
-            
-            status[table_name] = {
-                'current_db_count': current_count,
-                'last_indexed_count': last_count,
-                'last_indexed_id': last_id,
-                'index_exists': index_exists,
-                'needs_update': current_count > last_count,
-                'pending_rows': max(0, current_count - last_count)
-            }
+            # Check if indices need refreshing before running query
+            self.auto_refresh_if_needed()
+
+            with tracer.trace(question=query_str), query_embeddings.request_scope():
+                result, coalesced = self._answers_in_flight.do(
+                    (normalize_question(query_str), False), lambda: self.answer(query_str)
+                )
+                if coalesced:
+                    tracer.event("coalesced")
+                return result
+
         except Exception as e:
-            status[table_name] = {'error': str(e)}
-    
-    return status
-
-def auto_refresh_if_needed(self) -> bool:
-    """
-    Check if indices need refreshing and refresh them if needed.
-    Returns True if refresh was performed.
-    """
-    # Check if tracker file has been modified since we last loaded it
-    tracker_file = Path(self.index_tracker.tracker_file)
-    if not tracker_file.exists():
-        return False
-    
-    # Get file modification time
-    file_mtime = tracker_file.stat().st_mtime
-    
-    # Check if we have a stored mtime and if file is newer
-    if not hasattr(self, '_last_tracker_mtime'):
-        self._last_tracker_mtime = file_mtime
-        return False
-    
-    if file_mtime > self._last_tracker_mtime:
-        logger.info("Tracker file updated externally, refreshing indices...")
-        self.refresh_indices()
-        self._last_tracker_mtime = file_mtime
-        return True
-    
-    return False
+            logger.error(f"Error running query: {e}")
+            raise
 
-def run_query(self, query_str: str):
-    """Run a query through the complete pipeline with auto-refresh"""
-    try:
-        # Check if indices need refreshing before running query
-        self.auto_refresh_if_needed()
-        
-        return self.query_pipeline.run(input=query_str) 
+    def answer(self, query_str: str, table_schema_objs: Optional[List[SQLTableSchema]] = None,
+               table_contexts: Optional[Dict[str, TableContext]] = None, timings: Optional[Dict[str, float]] = None,
+               schema: Optional[str] = None, use_templates: bool = True, data_only: bool = False,
+               on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        Run the query stages for one question (retrieval, context, text2sql,
+        validation, SQL, synthesis), optionally with already retrieved tables and
+        cached schema context (used by batch runs and session follow-ups). Returns the answer text, the executed SQL, the tables
+        used, the schema context and whether SQL_MAX_RESULT_ROWS cut the SQL
+        result short. With `data_only` the validated SQL is returned
+        without running it or synthesizing an answer (the caller exports its rows).
+        `on_delta` receives the synthesized answer's text deltas as the LLM streams them.
+        """
+        timings = timings if timings is not None else {}
 
-    except Exception as e:
-        logger.error(f"Error running query: {e}")
-        raise
+        def timed(stage, fn, *args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                elapsed = time.perf_counter() - start
+                timings[f"{stage}_s"] = round(elapsed, 4)
+                tracer.event(stage, elapsed)
+
+        if table_schema_objs is None:
+            table_schema_objs = timed("retrieval", self._retrieve_tables, query_str)
+        tracer.event("tables", tables=[t.table_name for t in table_schema_objs])
+        if schema is None:
+            schema = timed("context", self._get_table_context_and_rows_str, query_str, table_schema_objs, table_contexts)
+        sql_query, from_template = timed("text2sql", self._text_to_sql, query_str, schema, use_templates)
+        sql_query = timed("validate", self._validate_sql, query_str, schema, self._log_sql_query(sql_query))
+        if data_only:
+            metrics.incr("synthesis.data_only")
+            return {
+                "response": prompt_manager.format_export_answer(),
+                "sql_query": sql_query,
+                "tables": [t.table_name for t in table_schema_objs],
+                "table_schema_objs": table_schema_objs,
+                "schema": schema,
+            }
+        sql_results, sql_metadata = timed("sql", self.sql_retriever.retrieve_with_metadata, sql_query)
+        if from_template and not any(n.node.metadata.get("result") for n in sql_results):
+            # A template filled with the wrong words still runs but finds nothing; an empty
+            # answer from it would be confidently wrong, so drop it and ask the LLM instead
+            metrics.incr("sql_template.empty")
+            logger.warning(f"SQL template returned no rows for {query_str!r}, regenerating SQL")
+            sql_templates.mark_failed(query_str)
+            sql_query, _ = timed("text2sql", self._text_to_sql, query_str, schema, False)
+            sql_query = timed("validate", self._validate_sql, query_str, schema, self._log_sql_query(sql_query))
+            sql_results, sql_metadata = timed("sql", self.sql_retriever.retrieve_with_metadata, sql_query)
+        sql_results = self._debug_sql_results(sql_results)
+        truncated = bool(sql_metadata.get("truncated"))
+        if truncated:
+            metrics.incr("sql.truncated")
+            tracer.event("truncated", max_rows=config.SQL_MAX_RESULT_ROWS)
+        if use_templates:
+            sql_results = self._record_sql_template(query_str, sql_query, sql_results)
+
+        def synthesize():
+            # Template answers would present a cut-off result as complete
+            direct_answer = "" if truncated else self._format_answer(sql_query, sql_results)
+            context_str = str(sql_results)
+            if truncated:
+                context_str += prompt_manager.format_truncation_note(config.SQL_MAX_RESULT_ROWS)
+            prompt = "" if direct_answer else prompt_manager.get_response_synthesis_prompt().format(
+                query_str=query_str, sql_query=sql_query, context_str=context_str
+            )
+            return self._synthesize_response(prompt, direct_answer, on_delta)
+
+        response = timed("synthesis", synthesize)
+        tracer.event("response", response=response.message.content)
+        return {
+            "response": response.message.content or "",
+            "sql_query": sql_query,
+            "tables": [t.table_name for t in table_schema_objs],
+            "table_schema_objs": table_schema_objs,
+            "schema": schema,
+            "truncated": truncated,
+        }
+
+    def run_session_query(self, query_str: str, session_id: Optional[str] = None, data_only: bool = False,
+                          on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        Answer a question within a conversation. Follow-ups reuse the session's
+        tables and schema context (no table or example-row retrieval) and see the
+        previous question and SQL; other questions start a new topic. `data_only`
+        stops after SQL generation and `on_delta` streams the synthesized answer
+        (see `answer`); a run coalesced onto another request's streams nothing.
+        """
+        self.auto_refresh_if_needed()
+        session = session_store.get(session_id)
+        with tracer.trace(question=query_str), session.lock, query_embeddings.request_scope():
+            # Tables retrieved to check a short question stay with it if it starts a new topic
+            retrieved: List[List[SQLTableSchema]] = []
+
+            def retrieve(question: str) -> List[SQLTableSchema]:
+                retrieved.append(self._retrieve_tables(question))
+                return retrieved[-1]
+
+            followup = session.is_followup(query_str, retrieve)
+            tracer.event("session", session_id=session.session_id, followup=followup)
+            if followup:
+                metrics.incr("session.followup")
+                logger.info(f"Follow-up in session {session.session_id}, reusing tables {[t.table_name for t in session.tables]}")
+                schema = session.schema + prompt_manager.format_followup_context(session.last_question, session.last_sql)
+                # Templates are keyed on standalone questions, so follow-ups bypass them
+                result = self.answer(query_str, session.tables, schema=schema, use_templates=False,
+                                     data_only=data_only, on_delta=on_delta)
+                session.remember(query_str, result["sql_query"])
+                coalesced = False
+            else:
+                # Standalone questions do not depend on the session, so identical ones in flight share a run
+                result, coalesced = self._answers_in_flight.do(
+                    (normalize_question(query_str), data_only),
+                    lambda: self.answer(query_str, retrieved[-1] if retrieved else None, data_only=data_only,
+                                        on_delta=on_delta),
+                )
+                if coalesced:
+                    tracer.event("coalesced")
+                session.remember(query_str, result["sql_query"], result["table_schema_objs"], result["schema"])
+        return {
+            "response": result["response"],
+            "sql_query": result["sql_query"],
+            "tables": result["tables"],
+            "session_id": session.session_id,
+            "followup": followup,
+            "coalesced": coalesced,
+            "truncated": result.get("truncated", False),
+        }
@@ -74,6 +74,47 @@ Available tables and columns with descriptions:
 Question: {query_str}
 SQLQuery: """
 
+# Appended once to the schema context when it contains example rows
+EXAMPLE_ROWS_GUIDANCE = "IMPORTANT: When filtering this data, consider that records are often distinguished by combinations of columns like (period + scr_mn + scr_eng) or (period + code + scr_mn). A single column filter may not be sufficient to get the exact record you need."
+
+# Appended to the schema context for follow-up questions in a session
+FOLLOWUP_CONTEXT_TEMPLATE = """
+
+This question continues the conversation. Keep the filters and columns of the previous query unless the new question changes them.
+Previous question: {last_question}
+Previous SQL: {last_sql}"""
+
+# Appended to the SQL results in the synthesis context when SQL_MAX_RESULT_ROWS cut them off
+TRUNCATED_RESULT_TEMPLATE = """
+
+NOTE: The query returned more than {max_rows} rows; only the first {max_rows} are shown above. Say in the answer that the result is partial and that the full data can be downloaded."""
+
+# Deterministic answer templates (used instead of response synthesis for simple results)
+ANSWER_EMPTY_TEMPLATE = "Уучлаарай, таны асуултад тохирох өгөгдөл олдсонгүй."
+ANSWER_SINGLE_VALUE_TEMPLATE = "{label}: {value}"
+ANSWER_SINGLE_VALUE_PERIOD_TEMPLATE = "{period} онд {label}: {value}"
+ANSWER_SERIES_TEMPLATE = "{label}:\n{lines}"
+ANSWER_SERIES_LINE_TEMPLATE = "- {period} он: {value}"
+ANSWER_EXPORT_TEMPLATE = "Хүссэн өгөгдлийг доорх холбоосоор CSV, JSON эсвэл Parquet файлаар татаж авна уу."
+
+# SQL repair prompt (one retry after static validation fails)
+SQL_REPAIR_PROMPT = """
+The following {dialect} query was generated for the question below, but it cannot run against the database.
+
+Question: {query_str}
+
+Query:
+{sql_query}
+
+Problems found:
+{errors}
+
+Rewrite the query so that it only uses the tables and columns listed here:
+{schema}
+
+Return only the corrected SQL query.
+SQLQuery: """
+
 class PromptManager:
     """Manages all prompt templates for the chatbot"""
     
@@ -93,6 +134,11 @@ class PromptManager:
         
         # Table info prompt
         self.table_info_prompt = PromptTemplate(TABLE_INFO_PROMPT)
+
+        # SQL repair prompt
+        self.sql_repair_prompt = PromptTemplate(SQL_REPAIR_PROMPT).partial_format(
+            dialect=self.dialect
+        )
     
     def get_text2sql_prompt(self) -> PromptTemplate:
         """Get the text-to-SQL prompt"""
@@ -105,7 +151,23 @@ class PromptManager:
     def get_table_info_prompt(self) -> PromptTemplate:
         """Get the table info generation prompt"""
         return self.table_info_prompt
+
+    def get_sql_repair_prompt(self) -> PromptTemplate:
+        """Get the SQL repair prompt"""
+        return self.sql_repair_prompt
     
+    def format_followup_context(self, last_question: str, last_sql: str) -> str:
+        """Format the previous turn for a follow-up question's schema context"""
+        return FOLLOWUP_CONTEXT_TEMPLATE.format(last_question=last_question, last_sql=last_sql)
+
+    def format_truncation_note(self, max_rows: int) -> str:
+        """Format the note added to the synthesis context of a truncated SQL result"""
+        return TRUNCATED_RESULT_TEMPLATE.format(max_rows=max_rows)
+
+    def format_export_answer(self) -> str:
+        """Answer text for data-mode questions, whose rows are downloaded instead"""
+        return ANSWER_EXPORT_TEMPLATE
+
     def format_table_info_prompt(self, table_name: str, table_structure: str, 
                                 table_data: str, exclude_list: list = None) -> str:
         """Format the table info prompt"""
@@ -0,0 +1,75 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+# Rows scored per chunk, bounds the temporary float32 copy of quantized data
+_SCORE_CHUNK = 16384
+
+
+class QuantizedVectors:
+    """
+    Row-major vector matrix stored as float32, float16 or int8.
+    int8 uses symmetric scalar quantization with one float32 scale per vector.
+    """
+
+    def __init__(self, dtype: str = "float32"):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported vector dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+        self.dtype = dtype
+        self.data = np.zeros((0, 0), dtype=dtype)
+        self.scales: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def _encode(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return vectors.astype(self.dtype), None
+
+    @classmethod
+    def from_float32(cls, vectors: np.ndarray, dtype: str = "float32") -> "QuantizedVectors":
+        qv = cls(dtype)
+        qv.data, qv.scales = qv._encode(vectors)
+        return qv
+
+    def append(self, vectors: np.ndarray) -> None:
+        data, scales = self._encode(vectors)
+        self.data = data if not len(self.data) else np.vstack([self.data, data])
+        if scales is not None:
+            self.scales = scales if self.scales is None else np.concatenate([self.scales, scales])
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dot products of `query` with the selected rows (all rows if None), as float32."""
+        query = np.asarray(query, dtype=np.float32)
+        if self.dtype == "float32":
+            data = self.data if rows is None else self.data[rows]
+            return data @ query
+        n = len(self.data) if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _SCORE_CHUNK):
+            sel = slice(start, start + _SCORE_CHUNK) if rows is None else rows[start:start + _SCORE_CHUNK]
+            out[start:start + _SCORE_CHUNK] = self.data[sel].astype(np.float32) @ query
+            if self.scales is not None:
+                out[start:start + _SCORE_CHUNK] *= self.scales[sel]
+        return out
+
+    def decode(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate float32 reconstruction of the selected rows."""
+        data = (self.data if rows is None else self.data[rows]).astype(np.float32)
+        if self.scales is not None:
+            data *= (self.scales if rows is None else self.scales[rows])[:, None]
+        return data
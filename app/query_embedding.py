@@ -0,0 +1,107 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from llama_index.core.schema import QueryBundle
+
+from .config import config
+from .llm import llm_manager
+
+logger = logging.getLogger(__name__)
+
+# Embeddings computed during the current request (question text -> vector)
+_request_embeddings: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar(
+    "request_embeddings", default=None
+)
+
+
+class QueryEmbeddingCache:
+    """Embeds each question once per request, backed by a small cross-request LRU."""
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size if max_size is not None else config.QUERY_EMBED_CACHE_SIZE
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def request_scope(self, preloaded: Optional[Dict[str, List[float]]] = None):
+        """Scope in which every retriever shares the same question embeddings."""
+        token = _request_embeddings.set(dict(preloaded or {}))
+        try:
+            yield
+        finally:
+            _request_embeddings.reset(token)
+
+    def _lookup(self, query_str: str) -> Optional[List[float]]:
+        scoped = _request_embeddings.get()
+        if scoped is not None and query_str in scoped:
+            self.hits += 1
+            return scoped[query_str]
+        with self._lock:
+            emb = self._lru.get(query_str)
+            if emb is not None:
+                self._lru.move_to_end(query_str)
+                self.hits += 1
+            return emb
+
+    def _store(self, query_str: str, embedding: List[float]) -> None:
+        scoped = _request_embeddings.get()
+        if scoped is not None:
+            scoped[query_str] = embedding
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._lru[query_str] = embedding
+            self._lru.move_to_end(query_str)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    def get(self, query_str: str) -> List[float]:
+        """Return the embedding for `query_str`, computing it at most once."""
+        emb = self._lookup(query_str)
+        if emb is None:
+            self.misses += 1
+            emb = llm_manager.get_embed_model().get_query_embedding(query_str)
+            logger.debug(f"Embedded question ({len(emb)} dims): {query_str[:80]}")
+        self._store(query_str, emb)
+        return emb
+
+    def embed_many(self, questions: List[str]) -> Dict[str, List[float]]:
+        """Embed many questions with batched embedding calls; cached ones are reused."""
+        out: Dict[str, List[float]] = {}
+        missing = []
+        for q in dict.fromkeys(questions):
+            emb = self._lookup(q)
+            if emb is None:
+                missing.append(q)
+            else:
+                out[q] = emb
+        if missing:
+            embed_model = llm_manager.get_embed_model()
+            self.misses += len(missing)
+            if getattr(embed_model, "query_instruction", None):
+                # Query and text embeddings differ for this model; keep per-question calls
+                embeddings = [embed_model.get_query_embedding(q) for q in missing]
+            else:
+                embeddings = embed_model.get_text_embedding_batch(missing)
+            for q, emb in zip(missing, embeddings):
+                out[q] = emb
+                self._store(q, emb)
+            logger.info(f"Embedded {len(missing)} questions in batches of {embed_model.embed_batch_size}")
+        return out
+
+    def query_bundle(self, query_str: str) -> QueryBundle:
+        """QueryBundle carrying the precomputed embedding, so retrievers skip embedding."""
+        return QueryBundle(query_str=query_str, embedding=self.get(query_str))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+
+query_embeddings = QueryEmbeddingCache()
@@ -0,0 +1,91 @@
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.schema import TextNode
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# Metadata keys kept on row nodes but never embedded or shown to the LLM
+ROW_METADATA_KEYS = ["table_name", "row_id"]
+
+
+class RowSerializer:
+    """Turns database rows into compact, stable text nodes for the row indices."""
+
+    def __init__(self, columns: Optional[List[str]] = None, max_value_chars: Optional[int] = None):
+        if columns is None:
+            columns = [c.strip() for c in config.ROW_TEXT_COLUMNS.split(",") if c.strip()]
+        self.columns = columns
+        self.max_value_chars = max_value_chars or config.ROW_TEXT_MAX_VALUE_CHARS
+
+    def format_value(self, value: Any) -> Optional[str]:
+        """Render a single cell; returns None for empty values."""
+        if value is None:
+            return None
+        if isinstance(value, Decimal):
+            txt = format(value, "f")
+            if "." in txt:
+                txt = txt.rstrip("0").rstrip(".")
+        elif isinstance(value, float):
+            txt = repr(value) if not value.is_integer() else str(int(value))
+        elif isinstance(value, (datetime, date)):
+            txt = value.isoformat()
+        elif isinstance(value, bytes):
+            return None
+        else:
+            txt = " ".join(str(value).split())
+        if not txt:
+            return None
+        if len(txt) > self.max_value_chars:
+            txt = txt[: self.max_value_chars] + "…"
+        return txt
+
+    def select_columns(self, row_columns: List[str], id_column: Optional[str] = None) -> List[str]:
+        """Columns used in the row text, in table order."""
+        cols = [c for c in row_columns if c != id_column]
+        if self.columns:
+            wanted = [c for c in cols if c in self.columns]
+            if wanted:
+                return wanted
+        return cols
+
+    def batch_to_nodes(self, table_name: str, batch, id_column: Optional[str] = None) -> List[TextNode]:
+        """
+        Nodes for a column-batched RowBatch, serialized without building row dicts
+        as compact `col=value | col=value` text (empty cells skipped). The
+        primary key lives in metadata only.
+        """
+        cols = self.select_columns(batch.columns, id_column)
+        positions = [(col, batch.columns.index(col)) for col in cols]
+        id_pos = batch.columns.index(id_column) if id_column in batch.columns else None
+        nodes = []
+        for row in batch.rows():
+            parts = []
+            for col, pos in positions:
+                val = self.format_value(row[pos])
+                if val is not None:
+                    parts.append(f"{col}={val}")
+            nodes.append(self._node(table_name, " | ".join(parts), row[id_pos] if id_pos is not None else None))
+        return nodes
+
+    @staticmethod
+    def _node(table_name: str, text: str, row_id: Any = None) -> TextNode:
+        metadata: Dict[str, Any] = {"table_name": table_name}
+        node_kwargs: Dict[str, Any] = {}
+        if row_id is not None:
+            metadata["row_id"] = row_id if isinstance(row_id, (int, str)) else str(row_id)
+            node_kwargs["id_"] = f"{table_name}:{row_id}"
+        return TextNode(
+            text=text,
+            metadata=metadata,
+            excluded_embed_metadata_keys=ROW_METADATA_KEYS,
+            excluded_llm_metadata_keys=ROW_METADATA_KEYS,
+            **node_kwargs,
+        )
+
+
+row_serializer = RowSerializer()
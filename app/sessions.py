@@ -0,0 +1,124 @@
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+from .config import config
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Openers that mark a question as continuing the previous one
+_FOLLOWUP_MARKERS = (
+    "тэгвэл", "тэгэхээр", "харин", "тэгээд", "мөн", "бас", "үүнийг", "үүний", "түүний", "энэ нь",
+    "and", "what about", "how about", "then",
+)
+_FOLLOWUP_RE = re.compile(rf"^\s*(?:{'|'.join(re.escape(m) for m in _FOLLOWUP_MARKERS)})\b", re.IGNORECASE)
+# Question words and particles that say nothing about the topic
+_FILLER_WORDS = frozenset((
+    "вэ", "бэ", "уу", "үү", "юу", "юү", "нь", "ба", "болон", "л", "даа", "дээ", "хэд", "хэдэн",
+    "ямар", "хэзээ", "хаана", "он", "оны", "онд", "сар", "сарын", "сард", "жил", "жилд",
+    "what", "which", "when", "how", "many", "much", "is", "are", "was", "were", "the", "a", "an",
+    "in", "of", "for", "year", "month",
+))
+_WORD_RE = re.compile(r"\w+")
+
+
+def content_words(question: str) -> List[str]:
+    """Words of `question` that name a topic: not fillers and not literals such as years or codes."""
+    return [
+        w for w in _WORD_RE.findall(question.lower())
+        if w not in _FILLER_WORDS and not any(c.isdigit() for c in w)
+    ]
+
+
+class ChatSession:
+    """Per-conversation state: tables and schema context selected for the topic, plus recent turns."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.tables: List[Any] = []
+        self.schema: str = ""
+        self.last_question: Optional[str] = None
+        self.last_sql: Optional[str] = None
+        self.turns = 0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def is_followup(self, question: str, retrieve_tables: Optional[Callable[[str], List[Any]]] = None) -> bool:
+        """
+        True if `question` should reuse this session's tables and context: it
+        opens with a follow-up marker, or it is short and either names nothing
+        but literals ("2022 онд?") or its best-matching table (from
+        `retrieve_tables`) is one the session already uses.
+        """
+        if not self.tables or not self.last_sql:
+            return False
+        if _FOLLOWUP_RE.match(question):
+            return True
+        if len(question.split()) > config.SESSION_FOLLOWUP_MAX_WORDS:
+            return False
+        if not content_words(question):
+            return True
+        if retrieve_tables is None:
+            return False
+        retrieved = retrieve_tables(question)
+        return bool(retrieved) and retrieved[0].table_name in {t.table_name for t in self.tables}
+
+    def remember(self, question: str, sql_query: str, tables: List[Any] = None, schema: str = None) -> None:
+        if tables is not None:
+            self.tables = tables
+            self.schema = schema or ""
+        self.last_question = question
+        self.last_sql = sql_query
+        self.turns += 1
+
+
+class SessionStore:
+    """Thread-safe LRU of chat sessions with idle expiry."""
+
+    def __init__(self, max_sessions: Optional[int] = None, ttl_s: Optional[float] = None):
+        self.max_sessions = max_sessions or config.SESSION_MAX
+        self.ttl_s = ttl_s or config.SESSION_TTL_S
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str] = None) -> ChatSession:
+        """Return the live session for `session_id`, or a new one (with a new id if none was given)."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(session_id or uuid.uuid4().hex)
+                self._sessions[session.session_id] = session
+                metrics.incr("session.new")
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    metrics.incr("session.evicted")
+            self._sessions.move_to_end(session.session_id)
+            session.updated_at = now
+            return session
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _expire(self, now: float) -> None:
+        # Oldest-first order: stop at the first session that is still fresh
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.updated_at < self.ttl_s:
+                break
+            self._sessions.pop(session_id)
+            metrics.incr("session.expired")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+session_store = SessionStore()
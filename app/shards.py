@@ -0,0 +1,519 @@
+"""
+Sharded row indices for tables too large for one process: the rows of each
+table in ROW_SHARDED_TABLES are hash-partitioned into ROW_SHARDS shards, each
+with its own vector (IVF) and BM25 index, served by a separate worker process.
+The chat processes scatter a question to every shard over HTTP and merge the
+per-shard top-k, so retrieval scales independently of the Flask workers.
+
+Shards are built by update_index (or on first pipeline start) in a single
+scan of the table. Incremental updates write each shard's new rows as a small
+segment next to it instead of rewriting the shard.
+Run the shard workers:
+    python -m app.shards [--table TABLE_NAME ...]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import shutil
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+from .ann import IVFIndex
+from .config import config
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .metrics import metrics
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+SHARD_ROWS_FILE = "rows.json"
+# Rows added by incremental updates: shard_<n>/segment_<k>/, each a small RowShard
+SHARD_SEGMENT_PREFIX = "segment_"
+
+
+def sharded_tables() -> List[str]:
+    return [t.strip() for t in config.ROW_SHARDED_TABLES.split(",") if t.strip()]
+
+
+def shard_of(key: str, shards: int) -> int:
+    """Stable shard number of a row (same in every process and run)."""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shards
+
+
+def shard_dir(table_name: str, shard: int) -> Path:
+    return Path(config.TABLE_INDEX_DIR) / table_name / f"shard_{shard}"
+
+
+def shard_endpoint(table_name: str, shard: int) -> str:
+    """Address of a shard worker: one port per (table, shard) from ROW_SHARD_BASE_PORT."""
+    port = config.ROW_SHARD_BASE_PORT + sharded_tables().index(table_name) * config.ROW_SHARDS + shard
+    return f"http://{config.ROW_SHARD_HOST}:{port}"
+
+
+class RowShard:
+    """
+    One partition of a table's rows: texts, vector index and BM25 index, plus
+    the segments appended by incremental updates (searched alongside it).
+    """
+
+    def __init__(self, texts: Optional[Dict[str, str]] = None, ann: Optional[IVFIndex] = None,
+                 lexical: Optional[BM25Index] = None, segments: Optional[List["RowShard"]] = None):
+        self.texts = texts or {}
+        self.ann = ann or IVFIndex(nlist=1)
+        self.lexical = lexical or BM25Index()
+        self.segments = segments or []
+        self.loaded_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.texts) + sum(len(seg) for seg in self.segments)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], vectors: np.ndarray) -> None:
+        self.texts.update(zip(ids, texts))
+        if not len(self.ann):
+            # Shards below ANN_MIN_ROWS are searched exactly (a single list)
+            self.ann = IVFIndex(nlist=None if len(ids) >= config.ANN_MIN_ROWS > 0 else 1)
+        self.ann.add(list(ids), vectors)
+        self.lexical.add_many(zip(ids, texts))
+
+    def search(self, query_str: str, embedding: Optional[Sequence[float]], top_k: int, mode: str) -> Dict[str, Any]:
+        dense = self.ann.search(embedding, top_k) if embedding is not None and mode != "lexical" else []
+        lexical = self.lexical.search(query_str, top_k) if mode != "dense" else []
+        texts = self.texts
+        if self.segments:
+            texts = dict(texts)
+            for seg in self.segments:
+                hits = seg.search(query_str, embedding, top_k, mode)
+                dense = _best(dense + hits["dense"], top_k)
+                lexical = _best(lexical + hits["lexical"], top_k)
+                texts.update(seg.texts)
+        hits = {doc_id for doc_id, _ in dense} | {doc_id for doc_id, _ in lexical}
+        return {
+            "dense": dense,
+            "lexical": lexical,
+            "texts": {doc_id: texts[doc_id] for doc_id in hits if doc_id in texts},
+            "rows": len(self),
+        }
+
+    def save(self, persist_dir: Path) -> None:
+        """Write the shard itself (segments are written by `add_segment`)."""
+        persist_dir.mkdir(parents=True, exist_ok=True)
+        if len(self.ann):
+            self.ann.save(str(persist_dir))
+        self.lexical.save(str(persist_dir))
+        tmp = persist_dir / f"{SHARD_ROWS_FILE}.tmp"
+        tmp.write_text(json.dumps(self.texts, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(persist_dir / SHARD_ROWS_FILE)
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> "RowShard":
+        shard = cls._load_part(persist_dir)
+        shard.segments = [cls._load_part(path) for path in cls.segment_dirs(persist_dir)]
+        return shard
+
+    @classmethod
+    def _load_part(cls, persist_dir: Path) -> "RowShard":
+        texts = json.loads((persist_dir / SHARD_ROWS_FILE).read_text(encoding="utf-8"))
+        ann = IVFIndex.load(str(persist_dir)) if IVFIndex.exists(str(persist_dir)) else None
+        return cls(texts, ann, BM25Index.load(str(persist_dir)))
+
+    @staticmethod
+    def exists(persist_dir: Path) -> bool:
+        return (persist_dir / SHARD_ROWS_FILE).exists()
+
+    # ─── Segments ───────────────────────────────────────────────────────────
+    @staticmethod
+    def segment_dirs(persist_dir: Path) -> List[Path]:
+        """Complete segments of a shard, oldest first."""
+        if not persist_dir.exists():
+            return []
+        return sorted(p for p in persist_dir.glob(f"{SHARD_SEGMENT_PREFIX}*") if RowShard.exists(p))
+
+    @classmethod
+    def add_segment(cls, persist_dir: Path, ids: Sequence[str], texts: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        Append rows to a shard on disk as a new segment; the shard and its
+        other segments are not read or rewritten. Past ROW_SHARD_MAX_SEGMENTS
+        the segments (never the shard itself) are merged into one.
+        """
+        segments = cls.segment_dirs(persist_dir)
+        seg = cls()
+        seg.add(ids, texts, vectors)
+        seg.save(cls._next_segment_dir(persist_dir, segments))
+        if len(segments) + 1 > config.ROW_SHARD_MAX_SEGMENTS:
+            cls._merge_segments(persist_dir)
+
+    @staticmethod
+    def _next_segment_dir(persist_dir: Path, segments: List[Path]) -> Path:
+        last = int(segments[-1].name[len(SHARD_SEGMENT_PREFIX):]) if segments else 0
+        return persist_dir / f"{SHARD_SEGMENT_PREFIX}{last + 1:06d}"
+
+    @classmethod
+    def _merge_segments(cls, persist_dir: Path) -> None:
+        segments = cls.segment_dirs(persist_dir)
+        merged = cls()
+        ids: List[str] = []
+        texts: List[str] = []
+        vectors = []
+        for path in segments:
+            seg = cls._load_part(path)
+            ids.extend(seg.ann.ids)
+            texts.extend(seg.texts[doc_id] for doc_id in seg.ann.ids)
+            vectors.append(np.asarray(seg.ann.full, dtype=np.float32))
+        merged.add(ids, texts, np.concatenate(vectors))
+        # Written under a new name before the old segments go, so a reload never misses rows
+        merged.save(cls._next_segment_dir(persist_dir, segments))
+        for path in segments:
+            shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Merged {len(segments)} segments of {persist_dir} ({len(ids)} rows)")
+
+    @classmethod
+    def drop_segments(cls, persist_dir: Path) -> None:
+        for path in persist_dir.glob(f"{SHARD_SEGMENT_PREFIX}*"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _best(hits: List[Tuple[str, float]], top_k: int) -> List[Tuple[str, float]]:
+    """Highest-scoring `top_k` hits, one per id (a row may sit in a segment being merged)."""
+    best: Dict[str, float] = {}
+    for doc_id, score in hits:
+        if score > best.get(doc_id, float("-inf")):
+            best[doc_id] = score
+    return sorted(best.items(), key=lambda h: -h[1])[:top_k]
+
+
+# ─── Building (update_index / pipeline) ─────────────────────────────────────
+class ShardBuilder:
+    """Builds and appends to the shards of one table from the database."""
+
+    def __init__(self, table_name: str, shards: Optional[int] = None):
+        self.table_name = table_name
+        self.shards = shards or config.ROW_SHARDS
+
+    def _partition(self, batch, id_column: Optional[str]) -> Dict[int, Tuple[List[str], List[str]]]:
+        from .rows import row_serializer
+
+        parts: Dict[int, Tuple[List[str], List[str]]] = {}
+        for node in row_serializer.batch_to_nodes(self.table_name, batch, id_column):
+            text = node.get_content()
+            # Rows without a primary key get random node ids, so they are placed by content
+            shard = shard_of(node.node_id if id_column else text, self.shards)
+            ids, texts = parts.setdefault(shard, ([], []))
+            ids.append(node.node_id)
+            texts.append(text)
+        return parts
+
+    def _embed_parts(self, parts: Dict[int, Tuple[List[str], List[str]]]) -> Dict[int, np.ndarray]:
+        """Embed all partitions of a batch in one call and split the vectors back per shard."""
+        order = sorted(parts)
+        vectors = self._embed([text for shard in order for text in parts[shard][1]])
+        out, start = {}, 0
+        for shard in order:
+            end = start + len(parts[shard][1])
+            out[shard] = vectors[start:end]
+            start = end
+        return out
+
+    @staticmethod
+    def _embed(texts: List[str]) -> np.ndarray:
+        from .llm import llm_manager
+        return np.asarray(llm_manager.get_embed_model().get_text_embedding_batch(texts), dtype=np.float32)
+
+    def _spill_dir(self) -> Path:
+        return Path(config.TABLE_INDEX_DIR) / self.table_name / "build_spill"
+
+    def build(self) -> Tuple[int, Any]:
+        """
+        Rebuild every shard from one scan of the table. Each batch is embedded
+        once and its rows and vectors are appended to per-shard spill files;
+        the shards are then built one at a time from those files, so at most
+        one partition is in memory. Returns (rows indexed, last key).
+        """
+        from .db import db_manager
+
+        id_column = db_manager.get_id_column(self.table_name)
+        spill = self._spill_dir()
+        shutil.rmtree(spill, ignore_errors=True)
+        spill.mkdir(parents=True)
+        start = time.perf_counter()
+        last_key = None
+        rows_files = [open(spill / f"shard_{s}.jsonl", "w", encoding="utf-8") for s in range(self.shards)]
+        vector_files = [open(spill / f"shard_{s}.f32", "wb") for s in range(self.shards)]
+        try:
+            for batch in db_manager.iter_row_batches(self.table_name, id_column):
+                parts = self._partition(batch, id_column)
+                for shard, vectors in self._embed_parts(parts).items():
+                    ids, texts = parts[shard]
+                    rows_files[shard].writelines(json.dumps([i, t], ensure_ascii=False) + "\n"
+                                                 for i, t in zip(ids, texts))
+                    vectors.tofile(vector_files[shard])
+                last_key = batch.last_key
+        finally:
+            for f in rows_files + vector_files:
+                f.close()
+        logger.info(f"Scanned and embedded {self.table_name} in {time.perf_counter() - start:.1f}s")
+
+        total = 0
+        try:
+            for shard in range(self.shards):
+                start = time.perf_counter()
+                part = RowShard()
+                with open(spill / f"shard_{shard}.jsonl", encoding="utf-8") as f:
+                    rows = [json.loads(line) for line in f]
+                if rows:
+                    vectors = np.fromfile(spill / f"shard_{shard}.f32", dtype=np.float32).reshape(len(rows), -1)
+                    # Added at once so IVF centroids are trained on the whole partition
+                    part.add([r[0] for r in rows], [r[1] for r in rows], vectors)
+                path = shard_dir(self.table_name, shard)
+                part.save(path)
+                # The rebuilt shard already holds the rows of any earlier segments
+                RowShard.drop_segments(path)
+                total += len(part)
+                logger.info(f"Built shard {shard}/{self.shards} of {self.table_name}: {len(part)} rows "
+                            f"in {time.perf_counter() - start:.1f}s")
+        finally:
+            shutil.rmtree(spill, ignore_errors=True)
+        self._notify_reload()
+        return total, last_key
+
+    def update(self, after: Any, limit: Optional[int] = None) -> Tuple[int, Any]:
+        """Append rows with key > `after` to their shards as new segments. Returns (rows added, last key)."""
+        from .db import db_manager
+
+        id_column = db_manager.get_id_column(self.table_name)
+        pending: Dict[int, Tuple[List[str], List[str]]] = {}
+        last_key = after
+        for batch in db_manager.iter_row_batches(self.table_name, id_column or "ctid", after=after, limit=limit):
+            for shard, (ids, texts) in self._partition(batch, id_column).items():
+                pending.setdefault(shard, ([], []))
+                pending[shard][0].extend(ids)
+                pending[shard][1].extend(texts)
+            last_key = batch.last_key
+        added = 0
+        for shard, vectors in (self._embed_parts(pending).items() if pending else ()):
+            ids, texts = pending[shard]
+            path = shard_dir(self.table_name, shard)
+            if not RowShard.exists(path):
+                RowShard().save(path)
+            RowShard.add_segment(path, ids, texts, vectors)
+            added += len(ids)
+        if added:
+            self._notify_reload()
+        return added, last_key
+
+    def exists(self) -> bool:
+        return all(RowShard.exists(shard_dir(self.table_name, s)) for s in range(self.shards))
+
+    def _notify_reload(self) -> None:
+        """Ask running workers to pick up the new files (workers that are down load them at start)."""
+        for shard in range(self.shards):
+            try:
+                httpx.post(f"{shard_endpoint(self.table_name, shard)}/reload", timeout=config.ROW_SHARD_TIMEOUT)
+            except httpx.HTTPError:
+                logger.debug(f"Shard {shard} of {self.table_name} not running, skipped reload")
+
+
+# ─── Scatter-gather client (chat processes) ─────────────────────────────────
+class ShardedRowIndex:
+    """
+    Searches all shards of a table concurrently and merges their top-k.
+    Shards that fail or time out are skipped (results degrade, requests do
+    not fail); per-shard latency and errors go to metrics and `health()`.
+    """
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, table_name: str, shards: Optional[int] = None):
+        self.table_name = table_name
+        self.shards = shards or config.ROW_SHARDS
+        self.endpoints = [shard_endpoint(table_name, s) for s in range(self.shards)]
+        self._client = httpx.Client(timeout=config.ROW_SHARD_TIMEOUT,
+                                    limits=httpx.Limits(max_keepalive_connections=self.shards * 4))
+        self._status: List[Dict[str, Any]] = [{"ok": None, "latency_ms": None, "error": None, "rows": None}
+                                              for _ in range(self.shards)]
+
+    @classmethod
+    def _pool(cls) -> ThreadPoolExecutor:
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(max_workers=max(4, config.ROW_SHARDS * 2),
+                                                       thread_name_prefix="row-shard")
+        return cls._executor
+
+    def _query(self, shard: int, payload: Dict) -> Optional[Dict]:
+        start = time.perf_counter()
+        status = self._status[shard]
+        try:
+            response = self._client.post(f"{self.endpoints[shard]}/search", json=payload)
+            response.raise_for_status()
+            result = response.json()
+            status.update(ok=True, error=None, rows=result.get("rows"))
+            return result
+        except Exception as e:
+            metrics.incr(f"row_shards.{self.table_name}.{shard}.error")
+            status.update(ok=False, error=f"{type(e).__name__}: {e}")
+            logger.warning(f"Row shard {shard} of {self.table_name} failed: {status['error']}")
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            status["latency_ms"] = round(elapsed * 1000, 2)
+            metrics.observe(f"row_shards.{self.table_name}.{shard}", elapsed)
+
+    def search(self, query_str: str, embedding: Optional[Sequence[float]], top_k: int, mode: str) -> List[str]:
+        """Texts of the best `top_k` rows over all shards (same modes as in-process retrieval)."""
+        depth = top_k if mode != "hybrid" else max(top_k, config.ROW_FUSION_CANDIDATES)
+        payload = {"query": query_str, "embedding": list(embedding) if embedding is not None else None,
+                   "k": depth, "mode": mode}
+        start = time.perf_counter()
+        results = list(self._pool().map(lambda s: self._query(s, payload), range(self.shards)))
+        ok = [r for r in results if r is not None]
+        tracer.event("row_shards", time.perf_counter() - start, table=self.table_name,
+                     shards=self.shards, failed=self.shards - len(ok))
+
+        texts: Dict[str, str] = {}
+        dense, lexical = [], []
+        for r in ok:
+            texts.update(r["texts"])
+            dense.extend(r["dense"])
+            lexical.extend(r["lexical"])
+        # Cosine scores are comparable across shards; BM25 statistics are per shard but
+        # hash partitioning keeps them close, so both lists are merged by score
+        dense_ids = [doc_id for doc_id, _ in sorted(dense, key=lambda h: -h[1])[:depth]]
+        lexical_ids = [doc_id for doc_id, _ in sorted(lexical, key=lambda h: -h[1])[:depth]]
+        if mode == "dense":
+            ranked = dense_ids
+        elif mode == "lexical":
+            ranked = lexical_ids
+        else:
+            ranked = reciprocal_rank_fusion([dense_ids, lexical_ids])
+        return [texts[doc_id] for doc_id in ranked[:top_k] if doc_id in texts]
+
+    def health(self) -> List[Dict[str, Any]]:
+        """Live health check of every shard plus the outcome of its last query."""
+        def check(shard: int) -> Dict[str, Any]:
+            start = time.perf_counter()
+            info = {"shard": shard, "endpoint": self.endpoints[shard], "last_query": dict(self._status[shard])}
+            try:
+                response = self._client.get(f"{self.endpoints[shard]}/health")
+                response.raise_for_status()
+                info.update(response.json(), ok=True)
+            except Exception as e:
+                info.update(ok=False, error=f"{type(e).__name__}: {e}")
+            info["ping_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            return info
+        return list(self._pool().map(check, range(self.shards)))
+
+
+# ─── Worker process ─────────────────────────────────────────────────────────
+class _ShardHandler(BaseHTTPRequestHandler):
+    server: "_ShardServer"
+
+    def _send(self, status: int, body: Dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send(404, {"error": "not found"})
+        shard = self.server.shard
+        self._send(200, {"table": self.server.table_name, "shard": self.server.shard_number,
+                         "rows": len(shard), "segments": len(shard.segments), "loaded_at": shard.loaded_at})
+
+    def do_POST(self):
+        if self.path == "/reload":
+            self.server.reload()
+            return self._send(200, {"rows": len(self.server.shard)})
+        if self.path != "/search":
+            return self._send(404, {"error": "not found"})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            result = self.server.shard.search(payload.get("query", ""), payload.get("embedding"),
+                                              int(payload.get("k", config.MAX_ROW_RETRIEVAL)),
+                                              payload.get("mode", "hybrid"))
+        except Exception as e:
+            logger.error(f"Shard search failed: {e}")
+            return self._send(500, {"error": str(e)})
+        self._send(200, result)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class _ShardServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, table_name: str, shard_number: int):
+        self.table_name = table_name
+        self.shard_number = shard_number
+        self.shard = RowShard()
+        self.reload()
+        port = int(shard_endpoint(table_name, shard_number).rsplit(":", 1)[1])
+        super().__init__((config.ROW_SHARD_HOST, port), _ShardHandler)
+
+    def reload(self) -> None:
+        path = shard_dir(self.table_name, self.shard_number)
+        if RowShard.exists(path):
+            # Searches in flight keep the old shard; new ones see the reloaded one
+            self.shard = RowShard.load(path)
+            logger.info(f"Loaded shard {self.shard_number} of {self.table_name}: {len(self.shard)} rows "
+                        f"({len(self.shard.segments)} segments)")
+        else:
+            logger.warning(f"Shard {self.shard_number} of {self.table_name} not built yet ({path})")
+
+
+def serve(table_name: str, shard_number: int) -> None:
+    logging.basicConfig(level=config.LOG_LEVEL)
+    server = _ShardServer(table_name, shard_number)
+    logger.info(f"Serving shard {shard_number} of {table_name} on {shard_endpoint(table_name, shard_number)}")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the row index shard workers")
+    parser.add_argument("--table", nargs="*", help="Serve only these tables (default: ROW_SHARDED_TABLES)")
+    args = parser.parse_args()
+    logging.basicConfig(level=config.LOG_LEVEL)
+    tables = args.table or sharded_tables()
+    unknown = set(tables) - set(sharded_tables())
+    if not tables or unknown:
+        parser.error(f"tables must be listed in ROW_SHARDED_TABLES (unknown: {sorted(unknown)})")
+
+    workers = [
+        multiprocessing.Process(target=serve, args=(table, shard), name=f"shard-{table}-{shard}")
+        for table in tables for shard in range(config.ROW_SHARDS)
+    ]
+    for w in workers:
+        w.start()
+    logger.info(f"Started {len(workers)} shard workers for {tables}")
+    # Stop the workers with the supervisor, also on SIGTERM
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for w in workers:
+            w.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for w in workers:
+            w.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from llama_index.core import SQLDatabase
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.engine import Engine
+
+from .catalog import CatalogSnapshot
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase that answers table and column questions from the shared
+    catalog snapshot instead of reflecting every table with the inspector.
+    """
+
+    def __init__(self, engine: Engine, catalog: Callable[[], CatalogSnapshot], max_string_length: int = 300):
+        # SQLDatabase.__init__ reflects all tables; only set what the query paths use
+        self._engine = engine
+        self._schema = None
+        self._catalog = catalog
+        self._include_tables = set()
+        self._ignore_tables = set()
+        self._sample_rows_in_table_info = 3
+        self._indexes_in_table_info = False
+        self._custom_table_info = None
+        self._max_string_length = max_string_length
+        self._metadata = MetaData()
+        self._inspector_obj = None
+
+    @property
+    def _inspector(self):
+        # Only needed by SQLDatabase methods not overridden here
+        if self._inspector_obj is None:
+            self._inspector_obj = inspect(self._engine)
+        return self._inspector_obj
+
+    @property
+    def _all_tables(self) -> set:
+        return set(self._catalog().tables)
+
+    @property
+    def _usable_tables(self) -> set:
+        return self._all_tables
+
+    def get_usable_table_names(self) -> List[str]:
+        return self._catalog().table_names()
+
+    def get_table_columns(self, table_name: str) -> List[Dict]:
+        table = self._catalog().get(table_name)
+        return list(table.columns) if table is not None else []
+
+    def get_single_table_info(self, table_name: str) -> str:
+        table = self._catalog().get(table_name)
+        if table is None:
+            raise ValueError(f"Table {table_name} not found in the catalog")
+        columns = ", ".join(
+            f"{c['name']} ({c['type']}): '{c['comment']}'" if c.get("comment") else f"{c['name']} ({c['type']})"
+            for c in table.columns
+        )
+        info = f"Table '{table_name}' has columns: {columns}, "
+        if table.comment:
+            info += f"with comment: ({table.comment}) "
+        if table.foreign_keys:
+            info += " and foreign keys: " + ", ".join(
+                f"{fk['constrained_columns']} -> {fk['referred_table']}.{fk['referred_columns']}"
+                for fk in table.foreign_keys
+            )
+        return info + "."
+
+    def run_sql(self, command: str) -> Tuple[str, Dict]:
+        """
+        Same contract as SQLDatabase.run_sql, but rows are streamed through a
+        server-side cursor and at most SQL_MAX_RESULT_ROWS are kept. The
+        metadata's "truncated" is True when the query returned more rows.
+        """
+        with self._engine.begin() as connection:
+            try:
+                cursor = connection.execution_options(stream_results=True, max_row_buffer=config.DB_FETCH_SIZE) \
+                    .execute(text(command))
+            except (ProgrammingError, OperationalError) as exc:
+                raise NotImplementedError(f"Statement {command!r} is invalid SQL.\nError: {exc.orig}") from exc
+            if not cursor.returns_rows:
+                return "", {}
+            max_rows = config.SQL_MAX_RESULT_ROWS
+            rows = []
+            truncated = False
+            for part in cursor.partitions(config.DB_FETCH_SIZE):
+                rows.extend(tuple(self.truncate_word(v, length=self._max_string_length) for v in row) for row in part)
+                # One row past the cap tells a truncated result from one of exactly max_rows
+                if max_rows and len(rows) > max_rows:
+                    logger.warning(f"SQL result truncated to {max_rows} rows")
+                    rows = rows[:max_rows]
+                    truncated = True
+                    break
+            return str(rows), {"result": rows, "col_keys": list(cursor.keys()), "truncated": truncated}
@@ -0,0 +1,264 @@
+import difflib
+import json
+import logging
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .config import config
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = r"\d+(?:\.\d+)?"
+_NUMBER_RE = re.compile(rf"^{_NUMBER}$")
+# SQL literals: single-quoted strings (with '' escapes) or bare numbers outside identifiers
+_SQL_LITERAL_RE = re.compile(rf"'(?:[^']|'')*'|(?<![\w.\"]){_NUMBER}(?![\w.\"])")
+_SLOT_MARK = "\x00{}\x00"
+_SLOT_SPLIT_RE = re.compile(r"\x00(\d+)\x00")
+_WORD_RE = re.compile(r"\w+|#")
+# Words that may differ between a question and a near-matching template; every
+# other word is content (a subject, measure, place...) and must be identical
+_STOPWORDS = frozenset((
+    "вэ", "бэ", "уу", "үү", "юу", "юү", "нь", "ба", "болон", "л", "даа", "дээ", "билээ", "бол",
+    "a", "an", "the", "is", "are", "was", "were", "please", "me", "tell", "show",
+))
+
+
+def normalize_question(question: str, casefold: bool = True) -> str:
+    """Drop sentence punctuation, collapse whitespace and (by default) casefold."""
+    q = question.replace("ё", "е").replace("Ё", "Е")
+    if casefold:
+        q = q.casefold()
+    q = re.sub(r"[?!;:\"“”«»]+", " ", q)
+    q = re.sub(r"\.(?!\d)", " ", q)
+    return " ".join(q.split())
+
+
+class SQLTemplateCache:
+    """
+    Learns parameterized (question pattern -> SQL) templates from successful
+    text2sql runs and fills them locally for new questions of the same shape.
+    Slots are the SQL literals (years, codes, quoted labels) that also appear
+    verbatim in the question; a text slot only matches as many words as the
+    value it was recorded with.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or Path(config.TABLE_INDEX_DIR) / "sql_templates.json")
+        self._lock = threading.Lock()
+        self.templates: Dict[str, Dict] = {}
+        self._compiled: Dict[str, re.Pattern] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.templates = {t["pattern"]: t for t in data}
+            logger.info(f"Loaded {len(self.templates)} SQL templates from {self.path}")
+        except FileNotFoundError:
+            self.templates = {}
+        except Exception as e:
+            logger.error(f"Error loading SQL templates from {self.path}: {e}")
+            self.templates = {}
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(list(self.templates.values()), ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp.replace(self.path)
+        except Exception as e:
+            logger.error(f"Error saving SQL templates to {self.path}: {e}")
+
+    # ─── Abstraction ────────────────────────────────────────────────────────
+    @staticmethod
+    def abstract(question: str, sql: str) -> Optional[Tuple[str, List[str], str, List[int]]]:
+        """
+        Turn a (question, SQL) pair into (question pattern, slot kinds, SQL
+        template, words per slot). Returns None when the SQL already contains
+        slot markers.
+        """
+        if "{{slot" in sql:
+            return None
+        # Literals must appear verbatim (same case) in the question to become slots
+        q_raw = normalize_question(question, casefold=False)
+        q = q_raw.casefold()
+        used: List[Tuple[int, int, str]] = []  # question spans claimed by a literal value
+        sql_parts: List[str] = []
+        pos = 0
+        for m in _SQL_LITERAL_RE.finditer(sql):
+            lit = m.group(0)
+            if lit.startswith("'"):
+                inner = lit[1:-1].replace("''", "'")
+                core = inner.strip("%")
+                prefix, suffix = inner[: len(inner) - len(inner.lstrip("%"))], inner[len(inner.rstrip("%")):]
+            else:
+                core, prefix, suffix = lit, "", ""
+            key = normalize_question(core, casefold=False)
+            if not key:
+                continue
+            span = next((s for s in used if s[2] == key), None)
+            if span is None:
+                found = re.search(rf"(?<!\w){re.escape(key)}(?!\w)", q_raw)
+                if not found or any(found.start() < e and s < found.end() for s, e, _ in used):
+                    continue
+                span = (found.start(), found.end(), key)
+                used.append(span)
+            marker = f"{{{{slot:{span[0]}}}}}"
+            replacement = f"'{prefix}{marker}{suffix}'" if lit.startswith("'") else marker
+            sql_parts.append(sql[pos:m.start()] + replacement)
+            pos = m.end()
+        sql_parts.append(sql[pos:])
+        sql_template = "".join(sql_parts)
+
+        # Number slots by their order in the question
+        used.sort()
+        pattern_parts, kinds, words, last = [], [], [], 0
+        for i, (start, end, key) in enumerate(used):
+            pattern_parts.append(q[last:start] + _SLOT_MARK.format(i))
+            kinds.append("number" if _NUMBER_RE.match(key) else "text")
+            words.append(len(key.split()))
+            sql_template = sql_template.replace(f"{{{{slot:{start}}}}}", f"{{{{slot{i}}}}}")
+            last = end
+        pattern_parts.append(q[last:])
+        return "".join(pattern_parts), kinds, sql_template, words
+
+    # ─── Record / match ─────────────────────────────────────────────────────
+    def record(self, question: str, sql: str) -> None:
+        """Remember a question/SQL pair that executed successfully."""
+        if not config.SQL_TEMPLATE_CACHE:
+            return
+        abstracted = self.abstract(question, sql)
+        if abstracted is None:
+            return
+        pattern, kinds, sql_template, words = abstracted
+        with self._lock:
+            if pattern in self.templates:
+                return
+            self.templates[pattern] = {
+                "pattern": pattern,
+                "slots": kinds,
+                "slot_words": words,
+                "sql": sql_template,
+                "hits": 0,
+                "example": question,
+                "created": datetime.now().isoformat(),
+            }
+            if len(self.templates) > config.SQL_TEMPLATE_MAX:
+                coldest = min(self.templates.values(), key=lambda t: (t["hits"], t["created"]))
+                self.templates.pop(coldest["pattern"], None)
+                self._compiled.pop(coldest["pattern"], None)
+            self._save()
+        logger.info(f"Recorded SQL template with {len(kinds)} slot(s): {pattern.replace(chr(0), '|')}")
+
+    def _regex(self, template: Dict) -> re.Pattern:
+        rx = self._compiled.get(template["pattern"])
+        if rx is None:
+            parts = _SLOT_SPLIT_RE.split(template["pattern"])
+            # Templates saved before slot widths were recorded take one-word text values
+            widths = template.get("slot_words") or [1] * len(template["slots"])
+            out = []
+            for i, part in enumerate(parts):
+                if i % 2 == 0:
+                    out.append(re.escape(part))
+                elif template["slots"][int(part)] == "number":
+                    out.append(f"({_NUMBER})")
+                else:
+                    # Exactly as many words as the recorded value, so extra words cannot be absorbed
+                    n = widths[int(part)]
+                    out.append(rf"(\S+(?: \S+){{{n - 1}}})" if n > 1 else r"(\S+)")
+            rx = re.compile("".join(out), re.IGNORECASE)
+            self._compiled[template["pattern"]] = rx
+        return rx
+
+    @staticmethod
+    def _fill(template: Dict, values: List[str]) -> Optional[str]:
+        sql = template["sql"]
+        for i, (kind, value) in enumerate(zip(template["slots"], values)):
+            if kind == "number" and not _NUMBER_RE.match(value):
+                return None
+            if kind == "text" and (len(value) > 100 or "\x00" in value):
+                return None
+            sql = sql.replace(f"{{{{slot{i}}}}}", value.replace("'", "''"))
+        return sql
+
+    def match(self, question: str) -> Optional[str]:
+        """Return filled-in SQL for a question matching a known template, else None."""
+        if not config.SQL_TEMPLATE_CACHE:
+            return None
+        q = normalize_question(question, casefold=False)
+        with self._lock:
+            templates = list(self.templates.values())
+
+        candidates = []
+        for t in templates:
+            m = self._regex(t).fullmatch(q)
+            if m:
+                candidates.append((t, list(m.groups())))
+        if not candidates and config.SQL_TEMPLATE_MIN_SIMILARITY < 1.0:
+            candidates = self._near_matches(q, templates)
+
+        # Prefer templates with fewer free-text slots, then the most used ones
+        candidates.sort(key=lambda c: (c[0]["slots"].count("text"), -c[0]["hits"]))
+        for template, values in candidates:
+            sql = self._fill(template, values)
+            if sql is not None:
+                with self._lock:
+                    template["hits"] += 1
+                metrics.incr("sql_template.hit")
+                logger.info(f"SQL template hit (rate {metrics.rate('sql_template.hit', 'sql_template.miss'):.0%}): "
+                            f"{template['example']!r} -> {values}")
+                return sql
+            metrics.incr("sql_template.fallback")
+            logger.info(f"SQL template matched but could not be filled with {values}, falling back")
+        metrics.incr("sql_template.miss")
+        return None
+
+    @staticmethod
+    def _content_words(text: str) -> List[str]:
+        return [w for w in _WORD_RE.findall(text) if w not in _STOPWORDS]
+
+    @classmethod
+    def _near_matches(cls, q: str, templates: List[Dict]) -> List[Tuple[Dict, List[str]]]:
+        """
+        Number-only templates whose wording differs from the question only in
+        stopwords and punctuation. A different content word (e.g. imports vs
+        exports) is never a match, however similar the rest of the string is.
+        """
+        numbers = re.findall(_NUMBER, q)
+        masked = re.sub(_NUMBER, "#", q.casefold())
+        words = cls._content_words(masked)
+        out = []
+        for t in templates:
+            if "text" in t["slots"] or len(t["slots"]) != len(numbers):
+                continue
+            skeleton = _SLOT_SPLIT_RE.sub("#", t["pattern"])
+            # Every number in the question must map to a slot
+            if re.search(_NUMBER, skeleton):
+                continue
+            if cls._content_words(skeleton) != words:
+                continue
+            ratio = difflib.SequenceMatcher(None, skeleton, masked).ratio()
+            if ratio >= config.SQL_TEMPLATE_MIN_SIMILARITY:
+                out.append((t, numbers))
+        return out
+
+    def mark_failed(self, question: str) -> None:
+        """Drop templates that produced SQL which failed for `question`."""
+        q = normalize_question(question, casefold=False)
+        with self._lock:
+            bad = [p for p, t in self.templates.items() if self._regex(t).fullmatch(q)]
+            for p in bad:
+                self.templates.pop(p, None)
+                self._compiled.pop(p, None)
+            if bad:
+                self._save()
+        if bad:
+            metrics.incr("sql_template.fallback")
+            logger.warning(f"Dropped {len(bad)} SQL template(s) that failed for: {question!r}")
+
+
+sql_templates = SQLTemplateCache()
@@ -0,0 +1,293 @@
+import difflib
+import logging
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Words that can appear bare in a query without being column references
+_SQL_WORDS = {
+    "select", "from", "where", "and", "or", "not", "in", "is", "null", "as", "on", "join",
+    "inner", "left", "right", "full", "outer", "cross", "natural", "using", "group", "by",
+    "order", "having", "limit", "offset", "fetch", "first", "next", "rows", "row", "only",
+    "asc", "desc", "nulls", "last", "distinct", "all", "any", "some", "exists", "between",
+    "like", "ilike", "similar", "to", "escape", "case", "when", "then", "else", "end",
+    "union", "intersect", "except", "with", "recursive", "true", "false", "unknown",
+    "interval", "date", "time", "timestamp", "timestamptz", "with", "without", "zone",
+    "at", "cast", "current_date", "current_time", "current_timestamp", "localtime",
+    "localtimestamp", "current_user", "session_user", "user", "lateral", "filter", "over",
+    "partition", "window", "range", "groups", "unbounded", "preceding", "following",
+    "current", "within", "for", "of", "year", "month", "day", "hour", "minute", "second",
+    "integer", "int", "bigint", "smallint", "numeric", "decimal", "real", "double",
+    "precision", "float", "text", "varchar", "char", "character", "varying", "boolean",
+    "bool", "values", "default", "collate", "ties", "percent", "array", "both", "leading",
+    "trailing", "placing", "symmetric",
+    # EXTRACT/date_part fields
+    "epoch", "quarter", "week", "dow", "isodow", "doy", "isoyear", "decade", "century",
+    "millennium", "milliseconds", "microseconds", "julian", "timezone", "timezone_hour",
+    "timezone_minute",
+}
+_WRITE_WORDS = {"insert", "update", "delete", "drop", "alter", "create", "truncate", "grant",
+                "revoke", "copy", "vacuum", "merge", "call", "do", "comment", "reindex", "cluster"}
+# Keywords after which an identifier is not a table alias
+_CLAUSE_WORDS = {"where", "on", "using", "join", "inner", "left", "right", "full", "cross",
+                 "natural", "group", "order", "having", "limit", "offset", "union", "intersect",
+                 "except", "fetch", "window", "lateral", "outer", "for"}
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>(?:[eE])?'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")+")
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<ident>[^\W\d]\w*)
+  | (?P<param>\$\d+|:\w+)
+  | (?P<op>::|<=|>=|<>|!=|\|\||[-+*/%<>=~!^&|#@.,;()\[\]])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+class SQLValidationError(Exception):
+    """Generated SQL references tables/columns that do not exist or is not a single SELECT."""
+
+    def __init__(self, errors: List[str], sql: str):
+        self.errors = errors
+        self.sql = sql
+        super().__init__("; ".join(errors))
+
+
+class SchemaCatalog:
+    """In-memory table -> columns map used to validate generated SQL."""
+
+    def __init__(self, tables: Dict[str, Iterable[str]]):
+        self.tables: Dict[str, Set[str]] = {t: set(cols) for t, cols in tables.items()}
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> "SchemaCatalog":
+        """Tables and columns of a database CatalogSnapshot (see catalog.py)."""
+        tables = {name: table.column_names for name, table in snapshot.tables.items()}
+        logger.info(f"Built schema catalog for {len(tables)} tables (version {snapshot.version})")
+        return cls(tables)
+
+
+def scan(sql: str) -> Iterator[Tuple[str, str, int]]:
+    """Yield (kind, text, offset) for each token of `sql`, skipping whitespace and comments."""
+    pos = 0
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if not m:
+            # Not a token the validator knows; check() reports the statement as unknown
+            yield "other", sql[pos], pos
+            pos += 1
+            continue
+        if m.lastgroup not in ("ws", "comment"):
+            yield m.lastgroup, m.group(0), pos
+        pos = m.end()
+
+
+def _tokenize(sql: str) -> List[Tuple[str, str]]:
+    return [(kind, value) for kind, value, _ in scan(sql)]
+
+
+def _ident(tok: Tuple[str, str]) -> Optional[str]:
+    """Resolve an identifier token the way PostgreSQL does (unquoted names fold to lowercase)."""
+    kind, value = tok
+    if kind == "qident":
+        return value[1:-1].replace('""', '"')
+    if kind == "ident":
+        return value.lower()
+    return None
+
+
+class SQLValidator:
+    """Cheap static checks of generated SQL against a SchemaCatalog (no DB round trip)."""
+
+    def __init__(self, catalog: SchemaCatalog):
+        self.catalog = catalog
+
+    def _suggest(self, name: str, options: Iterable[str]) -> str:
+        close = difflib.get_close_matches(name, list(options), n=3, cutoff=0.6)
+        return f" (did you mean: {', '.join(close)}?)" if close else ""
+
+    def validate(self, sql: str) -> List[str]:
+        """Return a list of problems; empty if the SQL looks executable (or the validator is unsure)."""
+        verdict, problems = self.check(sql)
+        return problems if verdict == "invalid" else []
+
+    def check(self, sql: str) -> Tuple[str, List[str]]:
+        """
+        Return ("valid" | "invalid" | "unknown", problems). "unknown" means the
+        statement uses syntax the tokenizer does not model; such SQL is left for
+        the database to judge rather than rejected.
+        """
+        tokens = _tokenize(sql.strip())
+        while tokens and tokens[-1] == ("op", ";"):
+            tokens.pop()
+        if not tokens:
+            return "invalid", ["empty SQL statement"]
+        if ("op", ";") in tokens:
+            return "invalid", ["only a single SQL statement is allowed"]
+        words = [v.lower() for k, v in tokens if k == "ident"]
+        first = tokens[0][1].lower()
+        if first not in ("select", "with") and tokens[0] != ("op", "("):
+            return "invalid", [f"only SELECT queries are allowed, got '{tokens[0][1]}'"]
+        writes = _WRITE_WORDS.intersection(words)
+        if writes:
+            return "invalid", [f"only read-only queries are allowed, found {', '.join(sorted(writes))}"]
+
+        errors: List[str] = []
+        doubts = [f"unrecognized character {v!r}" for k, v in tokens if k == "other"]
+        ctes = self._cte_names(tokens)
+        aliases, referenced, opaque = self._table_refs(tokens, ctes, errors)
+        output_aliases = self._output_aliases(tokens)
+
+        referenced_columns: Set[str] = set()
+        for t in referenced:
+            referenced_columns |= self.catalog.tables.get(t, set())
+
+        for i, tok in enumerate(tokens):
+            name = _ident(tok)
+            if name is None:
+                continue
+            prev = tokens[i - 1] if i else None
+            nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+            if nxt == ("op", "("):
+                continue  # function call / CTE definition
+            if prev == ("op", "::"):
+                continue  # type cast
+            if nxt == ("op", "."):
+                continue  # qualifier, checked with the column below
+            if prev == ("op", "."):
+                qual = _ident(tokens[i - 2]) if i >= 2 else None
+                table = aliases.get(qual)
+                if table in self.catalog.tables and name not in self.catalog.tables[table]:
+                    errors.append(f"column \"{name}\" does not exist in table \"{table}\""
+                                  f"{self._suggest(name, self.catalog.tables[table])}")
+                elif qual not in aliases and qual not in ctes and not opaque:
+                    errors.append(f"unknown table or alias \"{qual}\"")
+                continue
+            if tok[0] == "ident" and name in _SQL_WORDS:
+                continue
+            if prev == ("op", "(") and i >= 2 and _ident(tokens[i - 2]) == "extract":
+                continue  # EXTRACT(field FROM ...)
+            if name in aliases or name in ctes or name in output_aliases:
+                continue
+            if opaque or not referenced:
+                continue  # columns may come from a subquery/CTE we do not model
+            if name not in referenced_columns:
+                problem = (f"column \"{name}\" does not exist in {', '.join(sorted(referenced))}"
+                           f"{self._suggest(name, referenced_columns)}")
+                # An unknown bare word written in capitals is most likely a keyword we do not list
+                if tok[0] == "ident" and tok[1].isupper() and len(tok[1]) > 1:
+                    doubts.append(problem)
+                else:
+                    errors.append(problem)
+        # De-duplicate while keeping order
+        if errors:
+            return "invalid", list(dict.fromkeys(errors))
+        if doubts:
+            return "unknown", list(dict.fromkeys(doubts))
+        return "valid", []
+
+    @staticmethod
+    def _output_aliases(tokens: List[Tuple[str, str]]) -> Set[str]:
+        """Names introduced with AS, or written right after an expression (`expr alias`)."""
+        names = set()
+        for i in range(1, len(tokens)):
+            name = _ident(tokens[i])
+            if name is None or (tokens[i][0] == "ident" and name in _SQL_WORDS):
+                continue
+            prev = tokens[i - 1]
+            nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+            if nxt in (("op", "("), ("op", ".")):
+                continue
+            if prev[0] == "ident" and prev[1].lower() == "as":
+                names.add(name)
+            elif prev[0] in ("qident", "string", "number") or prev == ("op", ")") or (
+                prev[0] == "ident" and prev[1].lower() not in _SQL_WORDS
+            ):
+                names.add(name)
+        return names
+
+    @staticmethod
+    def _cte_names(tokens: List[Tuple[str, str]]) -> Set[str]:
+        names = set()
+        for i, tok in enumerate(tokens[:-2]):
+            if tok[0] in ("ident", "qident") and tokens[i + 1][1].lower() == "as" and tokens[i + 2] == ("op", "("):
+                if i and (tokens[i - 1][1].lower() in ("with", "recursive") or tokens[i - 1] == ("op", ",")):
+                    names.add(_ident(tok))
+        return names
+
+    @staticmethod
+    def _function_call_depths(tokens: List[Tuple[str, str]]) -> List[bool]:
+        """Per token: True if it sits directly inside a function call's parentheses."""
+        stack: List[bool] = []
+        out = []
+        for i, tok in enumerate(tokens):
+            if tok == ("op", "("):
+                prev = tokens[i - 1] if i else None
+                is_call = bool(prev and prev[0] == "ident" and prev[1].lower() not in _SQL_WORDS | _CLAUSE_WORDS)
+                out.append(bool(stack and stack[-1]))
+                stack.append(is_call)
+                continue
+            if tok == ("op", ")") and stack:
+                stack.pop()
+            out.append(bool(stack and stack[-1]))
+        return out
+
+    @staticmethod
+    def _is_distinct_from(tokens: List[Tuple[str, str]], i: int) -> bool:
+        """True for the FROM of `a IS [NOT] DISTINCT FROM b`, which is a comparison, not a table clause."""
+        if i < 2 or _ident(tokens[i - 1]) != "distinct" or tokens[i - 1][0] != "ident":
+            return False
+        return tokens[i - 2][0] == "ident" and tokens[i - 2][1].lower() in ("is", "not")
+
+    def _table_refs(self, tokens, ctes: Set[str], errors: List[str]):
+        """Collect alias -> table map from FROM/JOIN clauses; flags subqueries as opaque."""
+        aliases: Dict[str, str] = {}
+        referenced: Set[str] = set()
+        opaque = bool(ctes)
+        # FROM inside extract(...)/substring(...)/trim(...) is not a table clause
+        in_call = self._function_call_depths(tokens)
+        i = 0
+        while i < len(tokens):
+            word = tokens[i][1].lower() if tokens[i][0] == "ident" else None
+            if word not in ("from", "join") or in_call[i] or self._is_distinct_from(tokens, i):
+                i += 1
+                continue
+            i += 1
+            while i < len(tokens):
+                if tokens[i] == ("op", "("):
+                    opaque = True  # subquery / function in FROM
+                    break
+                name = _ident(tokens[i])
+                if name is None:
+                    break
+                # schema-qualified name: keep the last part, remember the schema as a known qualifier
+                while i + 2 < len(tokens) and tokens[i + 1] == ("op", ".") and _ident(tokens[i + 2]):
+                    aliases.setdefault(name, None)
+                    i += 2
+                    name = _ident(tokens[i])
+                if name in ctes:
+                    pass
+                elif name in self.catalog.tables:
+                    referenced.add(name)
+                else:
+                    errors.append(f"table \"{name}\" does not exist"
+                                  f"{self._suggest(name, self.catalog.tables)}")
+                aliases[name] = name
+                i += 1
+                if i < len(tokens) and tokens[i][0] == "ident" and tokens[i][1].lower() == "as":
+                    i += 1
+                if i < len(tokens):
+                    alias = _ident(tokens[i])
+                    if alias and not (tokens[i][0] == "ident" and alias in _CLAUSE_WORDS | _SQL_WORDS):
+                        aliases[alias] = name
+                        i += 1
+                if i < len(tokens) and tokens[i] == ("op", ","):
+                    i += 1
+                    continue
+                break
+        return aliases, referenced, opaque
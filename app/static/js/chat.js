@@ -7,9 +7,13 @@ class ChatApp {
         this.typingIndicator = document.getElementById('typingIndicator');
         this.connectionStatus = document.getElementById('connectionStatus');
         this.statusText = document.getElementById('statusText');
+        // Checked: answer with download links for the query result only (data mode)
+        this.dataModeToggle = document.getElementById('dataModeToggle');
         
         this.isLoading = false;
         this.messageHistory = [];
+        // Server-side conversation id, assigned by the first /api/chat response
+        this.sessionId = null;
         
         this.initializeEventListeners();
         this.checkConnection();
@@ -87,8 +91,15 @@ class ChatApp {
             // Hide typing indicator
             this.hideTypingIndicator();
             
+            if (response.session_id) {
+                this.sessionId = response.session_id;
+            }
+
             if (response.status === 'success') {
-                this.addMessage(response.response, 'bot');
+                const messageDiv = this.addMessage(response.response, 'bot');
+                if (response.export) {
+                    this.addExportLinks(messageDiv, response.export);
+                }
             } else {
                 this.addMessage(response.response || 'Sorry, I encountered an error.', 'bot', true);
             }
@@ -109,7 +120,11 @@ class ChatApp {
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ message: message }),
+            body: JSON.stringify({
+                message: message,
+                session_id: this.sessionId,
+                mode: this.dataModeToggle && this.dataModeToggle.checked ? 'data' : 'answer',
+            }),
         });
 
         if (!response.ok) {
@@ -148,6 +163,24 @@ class ChatApp {
             timestamp: new Date(),
             isError: isError
         });
+
+        return messageDiv;
+    }
+
+    addExportLinks(messageDiv, links) {
+        // Download the answer's query result as a file (streamed by /api/export)
+        const container = document.createElement('div');
+        container.className = 'export-links';
+        container.innerHTML = '<i class="fas fa-download"></i> Татах: ';
+        for (const [format, url] of Object.entries(links)) {
+            const link = document.createElement('a');
+            link.href = url;
+            link.textContent = format.toUpperCase();
+            link.setAttribute('download', '');
+            container.appendChild(link);
+        }
+        messageDiv.querySelector('.message-time').before(container);
+        this.scrollToBottom();
     }
 
     escapeHtml(text) {
@@ -0,0 +1,98 @@
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+from .config import config
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _load_tokenizer() -> Callable[[str], list]:
+    """
+    Tokenizer used for prompt budgeting:
+    - CONTEXT_TOKENIZER: a Hugging Face tokenizer name/path (e.g. the Ollama model's), if transformers is installed
+    - OpenAI backend: tiktoken encoding of the completion model
+    - otherwise llama_index's default tiktoken tokenizer as an approximation
+    """
+    if config.CONTEXT_TOKENIZER:
+        try:
+            from transformers import AutoTokenizer
+
+            tok = AutoTokenizer.from_pretrained(config.CONTEXT_TOKENIZER)
+            logger.info(f"Counting prompt tokens with {config.CONTEXT_TOKENIZER}")
+            return lambda text: tok.encode(text, add_special_tokens=False)
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {config.CONTEXT_TOKENIZER!r} ({e}), falling back to tiktoken")
+    try:
+        import tiktoken
+
+        if config.LLM_BACKEND == "openai":
+            try:
+                return tiktoken.encoding_for_model(config.OPENAI_COMPLETION_MODEL).encode
+            except KeyError:
+                pass
+        from llama_index.core.utils import get_tokenizer
+
+        return get_tokenizer()
+    except ImportError:
+        logger.warning("tiktoken not installed, estimating prompt tokens from length")
+        return lambda text: [None] * (len(text) // 3 + 1)
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens for context budgeting. When the tokenizer is only an
+    approximation of the backend's, the estimate is calibrated against the
+    prompt token counts the backend reports.
+    """
+
+    def __init__(self):
+        self._tokenize: Optional[Callable[[str], list]] = None
+        self._lock = threading.Lock()
+        self.scale = 1.0
+
+    def raw_count(self, text: str) -> int:
+        if self._tokenize is None:
+            with self._lock:
+                if self._tokenize is None:
+                    self._tokenize = _load_tokenizer()
+        return len(self._tokenize(text))
+
+    def count(self, text: str) -> int:
+        """Estimated backend tokens for `text`."""
+        return int(round(self.raw_count(text) * self.scale))
+
+    def calibrate(self, raw_estimate: int, actual: int) -> None:
+        """Blend in the backend's reported count for a prompt we estimated at `raw_estimate`."""
+        if raw_estimate <= 0 or actual <= 0:
+            return
+        with self._lock:
+            self.scale = 0.9 * self.scale + 0.1 * (actual / raw_estimate)
+
+    def record(self, stage: str, prompt: str, response: Any) -> Optional[int]:
+        """Record the prompt token count of an LLM call (reported by the backend if available)."""
+        raw_estimate = self.raw_count(prompt)
+        actual = prompt_tokens_from_response(response)
+        if actual is not None:
+            self.calibrate(raw_estimate, actual)
+        tokens = actual if actual is not None else int(round(raw_estimate * self.scale))
+        metrics.record(f"{stage}.prompt_tokens", tokens)
+        logger.info(f"{stage} prompt: {tokens} tokens ({'reported' if actual is not None else 'estimated'})")
+        return tokens
+
+
+def prompt_tokens_from_response(response: Any) -> Optional[int]:
+    """Prompt token count reported by Ollama (usage/prompt_eval_count) or OpenAI (usage.prompt_tokens)."""
+    raw = getattr(response, "raw", None)
+    if raw is None:
+        return None
+    if isinstance(raw, dict):
+        usage = raw.get("usage") or {}
+        value = usage.get("prompt_tokens") if isinstance(usage, dict) else None
+        return value if value is not None else raw.get("prompt_eval_count")
+    usage = getattr(raw, "usage", None)
+    return getattr(usage, "prompt_tokens", None)
+
+
+token_counter = TokenCounter()
@@ -0,0 +1,206 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import config
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Trace records go to their own logger so they never pass through the app's log handlers
+trace_logger = logging.getLogger("app.trace")
+trace_logger.propagate = False
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+
+def _truncate(value: Any) -> Any:
+    """Cap a payload at TRACE_MAX_PAYLOAD_CHARS, keeping numbers and booleans as they are."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)) and all(isinstance(v, (str, int, float)) for v in value):
+        return [_truncate(v) for v in value[:50]]
+    text = value if isinstance(value, str) else str(value)
+    limit = config.TRACE_MAX_PAYLOAD_CHARS
+    if len(text) > limit:
+        return text[:limit] + f"… [{len(text) - limit} more chars]"
+    return text
+
+
+class Trace:
+    """Stage-by-stage record of one request."""
+
+    def __init__(self, request_id: str, question: str = "", sampled: bool = True):
+        self.request_id = request_id
+        self.question = question
+        self.sampled = sampled
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.duration_s: Optional[float] = None
+
+    def add(self, stage: str, duration_s: Optional[float] = None, **fields) -> None:
+        if len(self.events) >= config.TRACE_MAX_EVENTS:
+            self.dropped += 1
+            return
+        event = {"stage": stage, "t": round(time.perf_counter() - self._start, 4)}
+        if duration_s is not None:
+            event["duration_s"] = round(duration_s, 4)
+        # Callables are payloads too costly to build for traces that are never stored
+        event.update((k, v if callable(v) else _truncate(v)) for k, v in fields.items())
+        self.events.append(event)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.duration_s = round(time.perf_counter() - self._start, 4)
+        self.status = "error" if error is not None else "ok"
+        if error is not None:
+            self.error = _truncate(f"{type(error).__name__}: {error}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "question": _truncate(self.question),
+            "started_at": self.started_at,
+            "duration_s": self.duration_s,
+            "status": self.status,
+            "error": self.error,
+            "events": [{k: _truncate(v()) if callable(v) else v for k, v in e.items()} for e in self.events],
+            "dropped_events": self.dropped,
+        }
+
+
+class Tracer:
+    """
+    Per-request structured traces. Traces are kept in a bounded in-memory
+    buffer for lookup by request id and written as JSON lines through a
+    QueueHandler, so request threads never block on log I/O. Only sampled
+    requests (TRACE_SAMPLE_RATE) and failed requests are kept.
+    """
+
+    def __init__(self):
+        self._traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+    @contextmanager
+    def trace(self, request_id: Optional[str] = None, question: str = "", force: bool = False) -> Iterator[Trace]:
+        """Trace the enclosed request (`force` keeps it regardless of sampling); nested calls join the active trace."""
+        active = _current.get()
+        if active is not None:
+            yield active
+            return
+        sampled = config.TRACE_ENABLED and (force or random.random() < config.TRACE_SAMPLE_RATE)
+        current = Trace(request_id or uuid.uuid4().hex, question, sampled)
+        token = _current.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.finish(e)
+            raise
+        else:
+            current.finish()
+        finally:
+            _current.reset(token)
+            if config.TRACE_ENABLED and (current.sampled or current.status == "error"):
+                self._store(current)
+
+    @staticmethod
+    def current() -> Optional[Trace]:
+        return _current.get()
+
+    @staticmethod
+    def event(stage: str, duration_s: Optional[float] = None, **fields) -> None:
+        """
+        Add a stage event to the active trace (no-op outside a trace). A field
+        may be a zero-argument callable, called only if the trace is stored.
+        """
+        current = _current.get()
+        if current is not None:
+            current.add(stage, duration_s, **fields)
+
+    @contextmanager
+    def span(self, stage: str, **fields) -> Iterator[None]:
+        """Time the enclosed block as a stage of the active trace."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.event(stage, time.perf_counter() - start, **fields)
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._traces.get(request_id)
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Summaries of the most recent traces, newest first."""
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [
+            {k: t[k] for k in ("request_id", "question", "started_at", "duration_s", "status")}
+            for t in reversed(traces)
+        ]
+
+    def _store(self, current: Trace) -> None:
+        record = current.to_dict()
+        with self._lock:
+            self._traces[current.request_id] = record
+            self._traces.move_to_end(current.request_id)
+            while len(self._traces) > config.TRACE_BUFFER_SIZE:
+                self._traces.popitem(last=False)
+        self._ensure_listener()
+        # Serialized on the listener thread by _JSONFormatter
+        trace_logger.info(record)
+
+    def _ensure_listener(self) -> None:
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            if config.TRACE_LOG_PATH:
+                target: logging.Handler = logging.FileHandler(config.TRACE_LOG_PATH, encoding="utf-8")
+            else:
+                target = logging.StreamHandler(sys.stderr)
+            target.setFormatter(_JSONFormatter())
+            log_queue: "queue.Queue" = queue.Queue(maxsize=config.TRACE_QUEUE_SIZE)
+            trace_logger.addHandler(_DroppingQueueHandler(log_queue))
+            trace_logger.setLevel(logging.INFO)
+            self._listener = logging.handlers.QueueListener(log_queue, target)
+            self._listener.start()
+            atexit.register(self._listener.stop)
+
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the writer falls behind."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process, so the trace dict is passed through unformatted
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("trace.dropped")
+
+
+tracer = Tracer()
@@ -14,9 +14,9 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict
 
-from app.pipeline import ChatbotPipeline
-from app.db import db_manager
+from app.db import db_manager, workload
 from app.config import config
+from app.index_tracker import IndexTracker, get_index_status
 
 
 def setup_logging():
@@ -31,7 +31,7 @@ def setup_logging():
     )
 
 
-def check_new_data_available(pipeline: ChatbotPipeline) -> Dict[str, int]:
+def check_new_data_available(index_tracker: IndexTracker) -> Dict[str, int]:
     """Check how many new rows are available for each table"""
     from sqlalchemy import text
     new_data: Dict[str, int] = {}
@@ -42,7 +42,7 @@ def check_new_data_available(pipeline: ChatbotPipeline) -> Dict[str, int]:
                 result = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"'))
                 current_count = result.fetchone()[0]
 
-            last_count = pipeline.index_tracker.get_last_indexed_count(table_name)
+            last_count = index_tracker.get_last_indexed_count(table_name)
             diff = max(0, current_count - last_count)
             if diff > 0:
                 new_data[table_name] = diff
@@ -69,12 +69,10 @@ def main():
     logger = logging.getLogger(__name__)
     logger.info("Starting index update process...")
 
-    # Initialize pipeline (load existing indices)
-    pipeline = ChatbotPipeline()
-
+    # --status and --dry-run only read the tracker and the database
     if args.status:
         logger.info("Current indexing status:")
-        status = pipeline.get_index_status()
+        status = get_index_status(IndexTracker())
         for table, info in status.items():
             if 'error' in info:
                 logger.error(f"  {table}: ERROR - {info['error']}")
@@ -82,11 +80,17 @@ def main():
                 logger.info(f"  {table}: {info['current_db_count']} total rows, "
                            f"{info['last_indexed_count']} indexed, "
                            f"{info['pending_rows']} pending")
+                vec = info.get('vectors')
+                if vec:
+                    recall = ", ".join(f"{k}={v:.3f}" for k, v in vec.items() if k.startswith('recall@'))
+                    logger.info(f"    vectors: {vec['vectors']} x {vec['dtype']} ({vec['nlist']} lists), "
+                               f"{vec['memory_bytes'] / 2**20:.1f} MiB in memory "
+                               f"(float32: {vec['float32_bytes'] / 2**20:.1f} MiB), {recall}")
         return
 
     if args.dry_run:
         logger.info("Dry run: checking for new data...")
-        new_data = check_new_data_available(pipeline)
+        new_data = check_new_data_available(IndexTracker())
         if not new_data:
             logger.info("No new data found.")
         else:
@@ -95,6 +99,10 @@ def main():
                 logger.info(f"  {tbl}: {cnt} new rows")
         return
 
+    # Initialize pipeline (load existing indices)
+    from app.pipeline import ChatbotPipeline
+    pipeline = ChatbotPipeline()
+
     if args.force_full:
         logger.warning("FORCE FULL REINDEX requested!")
         resp = input("Rebuild all indices from scratch? (y/N): ")
@@ -126,7 +134,7 @@ def main():
         start_time = time.time()
         if args.table:
             tbl = args.table
-            if tbl not in pipeline.vector_index_dict:
+            if tbl not in pipeline.vector_index_dict and tbl not in pipeline.shard_index_dict:
                 logger.error(f"Table '{tbl}' not found in indices.")
                 sys.exit(1)
             added = pipeline._update_table_index(tbl)
@@ -141,4 +149,6 @@ def main():
         logger.info(f"Update completed in {elapsed:.2f} seconds")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # Indexing scans and row counts use the batch connection pool
+    with workload("batch"):
+        main()
\ No newline at end of file
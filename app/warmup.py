@@ -0,0 +1,270 @@
+"""
+Warm-up before the web service reports ready: the models are loaded and kept
+resident, database connections opened, index memory faulted in, and the most
+frequent recent questions replayed through the pipeline so their embeddings,
+SQL templates, completions and database pages are cached.
+
+GET /ready reports the progress and the measured latencies of each step.
+"""
+
+import atexit
+import json
+import logging
+import statistics
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .config import config
+from .metrics import metrics
+from .sql_templates import normalize_question
+
+logger = logging.getLogger(__name__)
+
+STEPS = ("database", "models", "indices", "replay")
+
+# The question log is written at most this often (and when warm-up reads it)
+_SAVE_INTERVAL_S = 30.0
+
+
+class QuestionLog:
+    """Persisted counts of the standalone questions answered through the chat API, for warm-up replay."""
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = Path(path or Path(config.TABLE_INDEX_DIR) / "question_log.json")
+        self.max_entries = max_entries or config.QUESTION_LOG_MAX
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.entries = {normalize_question(e["question"]): e for e in data}
+            logger.info(f"Loaded {len(self.entries)} logged questions from {self.path}")
+        except FileNotFoundError:
+            self.entries = {}
+        except Exception as e:
+            logger.error(f"Error loading question log from {self.path}: {e}")
+            self.entries = {}
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(list(self.entries.values()), ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp.replace(self.path)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error saving question log to {self.path}: {e}")
+
+    def record(self, question: str) -> None:
+        """Count one answered question (the latest wording of each normalized question is kept)."""
+        key = normalize_question(question)
+        if not key:
+            return
+        with self._lock:
+            entry = self.entries.setdefault(key, {"question": question, "count": 0})
+            entry["question"] = question
+            entry["count"] += 1
+            entry["last_seen"] = time.time()
+            if len(self.entries) > self.max_entries:
+                stalest = min(self.entries, key=lambda k: self.entries[k]["last_seen"])
+                self.entries.pop(stalest)
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= _SAVE_INTERVAL_S:
+                self._save()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def top(self, n: int, days: Optional[float] = None) -> List[str]:
+        """The `n` most asked questions seen within the last `days`, most asked (then most recent) first."""
+        since = time.time() - (config.WARMUP_REPLAY_DAYS if days is None else days) * 86400
+        with self._lock:
+            recent = [e for e in self.entries.values() if e.get("last_seen", 0) >= since]
+        recent.sort(key=lambda e: (e["count"], e["last_seen"]), reverse=True)
+        return [e["question"] for e in recent[:n]]
+
+
+def _stage_summary(samples: Dict[str, List[float]]) -> Dict[str, Dict]:
+    return {
+        stage: {"count": len(values), "median_s": round(statistics.median(values), 4), "max_s": round(max(values), 4)}
+        for stage, values in samples.items()
+    }
+
+
+class WarmUp:
+    """
+    Runs the warm-up steps for a pipeline in a background thread and tracks
+    their progress. `ready` turns true when the first warm-up finishes (failed
+    steps are reported, not retried) and stays true across pipeline reloads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._run_id = 0
+        self._keepalive: Optional[threading.Thread] = None
+        self.ready = False
+        self.state = "pending"
+        self.steps: Dict[str, Dict] = {}
+        self.replay: Dict = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self, pipeline) -> None:
+        """Warm up `pipeline` in the background (a run still going for an older pipeline stops)."""
+        with self._lock:
+            self._run_id += 1
+            run_id = self._run_id
+            self.state = "running"
+            # Each run fills its own dicts, so a stopping older run cannot touch the new progress
+            self.steps = steps = {step: {"state": "pending"} for step in STEPS}
+            self.replay = replay = {"questions": 0, "done": 0, "failed": 0, "timed_out": False, "stages": {}}
+            self.started_at = time.time()
+            self.finished_at = None
+        # The stub pipeline has no models, connections or indices to warm
+        if not config.WARMUP_ENABLED or config.PIPELINE_BACKEND == "stub":
+            self._finish(run_id, "skipped")
+            return
+        threading.Thread(target=self._run, args=(run_id, steps, replay, pipeline), name="warmup", daemon=True).start()
+
+    def _current(self, run_id: int) -> bool:
+        return run_id == self._run_id
+
+    def _finish(self, run_id: int, state: str) -> None:
+        with self._lock:
+            if not self._current(run_id):
+                return
+            self.state = state
+            self.finished_at = time.time()
+            self.ready = True
+        if state != "skipped":
+            states = {step: s["state"] for step, s in self.steps.items()}
+            logger.info(f"Warm-up {state} in {self.finished_at - self.started_at:.1f}s: {states}")
+
+    def _step(self, run_id: int, step: Dict, name: str, fn: Callable, *args) -> None:
+        if not self._current(run_id):
+            return
+        step["state"] = "running"
+        start = time.perf_counter()
+        try:
+            step.update(state="done", detail=fn(*args))
+        except Exception as e:
+            logger.warning(f"Warm-up step '{name}' failed: {e}")
+            step.update(state="failed", error=f"{type(e).__name__}: {e}")
+        finally:
+            elapsed = time.perf_counter() - start
+            step["seconds"] = round(elapsed, 4)
+            metrics.observe(f"warmup.{name}", elapsed)
+
+    def _run(self, run_id: int, steps: Dict[str, Dict], replay: Dict, pipeline) -> None:
+        deadline = time.monotonic() + config.WARMUP_TIMEOUT_S
+        self._step(run_id, steps["database"], "database", self._warm_database)
+        self._step(run_id, steps["models"], "models", self._warm_models)
+        self._step(run_id, steps["indices"], "indices", self._warm_indices, pipeline)
+        self._step(run_id, steps["replay"], "replay", self._replay, run_id, replay, pipeline, deadline)
+        failed = any(s["state"] == "failed" for s in steps.values())
+        self._finish(run_id, "degraded" if failed else "done")
+        self._start_keepalive()
+
+    # ─── Steps ──────────────────────────────────────────────────────────────
+    @staticmethod
+    def _warm_database() -> Dict:
+        from .db import db_manager
+
+        connections = db_manager.warm_pool("interactive")
+        return {"connections": connections, "tables": len(db_manager.get_catalog().tables)}
+
+    @staticmethod
+    def _warm_models() -> Dict:
+        from .llm import llm_manager
+
+        return {"models": llm_manager.keep_warm()}
+
+    @staticmethod
+    def _warm_indices(pipeline) -> Dict:
+        touched = 0
+        for ann in pipeline.ann_index_dict.values():
+            touched += ann.prefetch()
+        for lex in pipeline.lexical_index_dict.values():
+            lex.prefetch()
+        shards = {table: index.health() for table, index in pipeline.shard_index_dict.items()}
+        return {
+            "ann_tables": len(pipeline.ann_index_dict),
+            "ann_bytes": touched,
+            "lexical_tables": len(pipeline.lexical_index_dict),
+            "shards_up": {t: sum(1 for s in h if s.get("ok")) for t, h in shards.items()},
+        }
+
+    def _replay(self, run_id: int, replay: Dict, pipeline, deadline: float) -> Dict:
+        from .query_embedding import query_embeddings
+
+        question_log.flush()
+        questions = question_log.top(config.WARMUP_REPLAY_QUESTIONS)
+        replay["questions"] = len(questions)
+        samples: Dict[str, List[float]] = {}
+        for question in questions:
+            if not self._current(run_id):
+                break
+            if time.monotonic() >= deadline:
+                replay["timed_out"] = True
+                logger.warning(f"Warm-up replay stopped after WARMUP_TIMEOUT_S={config.WARMUP_TIMEOUT_S}s")
+                break
+            timings: Dict[str, float] = {}
+            start = time.perf_counter()
+            try:
+                with query_embeddings.request_scope():
+                    pipeline.answer(question, timings=timings)
+                replay["done"] += 1
+            except Exception as e:
+                logger.info(f"Warm-up replay of {question!r} failed: {e}")
+                replay["failed"] += 1
+            timings["total_s"] = time.perf_counter() - start
+            for stage, seconds in timings.items():
+                samples.setdefault(stage[:-2], []).append(seconds)
+            replay["stages"] = _stage_summary(samples)
+        return {k: v for k, v in replay.items() if k != "stages"}
+
+    # ─── Keep-alive ─────────────────────────────────────────────────────────
+    def _start_keepalive(self) -> None:
+        """Re-pin the models periodically so an idle service does not unload them."""
+        if not config.WARMUP_KEEPALIVE_INTERVAL_S or self._keepalive is not None:
+            return
+        self._keepalive = threading.Thread(target=self._keepalive_loop, name="model-keepalive", daemon=True)
+        self._keepalive.start()
+
+    @staticmethod
+    def _keepalive_loop() -> None:
+        from .llm import llm_manager
+
+        while True:
+            time.sleep(config.WARMUP_KEEPALIVE_INTERVAL_S)
+            try:
+                llm_manager.keep_warm()
+                metrics.incr("warmup.keepalive")
+            except Exception as e:
+                metrics.incr("warmup.keepalive_error")
+                logger.warning(f"Model keep-alive failed: {e}")
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "steps": self.steps,
+            "replay": self.replay,
+        }
+
+
+question_log = QuestionLog()
+# Counts recorded since the last periodic save
+atexit.register(question_log.flush)
+warmup = WarmUp()
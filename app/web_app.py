@@ -1,10 +1,21 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from sqlalchemy import exc as sa_exc
 import logging
 import os
-from .pipeline import ChatbotPipeline 
 from .config import config
+from .sql_validator import SQLValidationError
+from .metrics import metrics
+from .db import db_manager
+from .batch import BatchRunner, parse_questions, to_jsonl
+from .tracing import tracer
+from .export import FORMATS, export_store, open_page, parquet_available, render
+from .warmup import question_log, warmup
 import re
+import hmac
+import json
+import queue
 import threading
+import uuid
 
 # Configure logging
 logging.basicConfig(level=config.LOG_LEVEL)
@@ -16,22 +27,34 @@ app = Flask(__name__)
 # Global variable to hold the pipeline instance
 pipeline_instance = None
 pipeline_lock = threading.Lock() # Use a lock for thread safety during reload
+pipeline_initializing = False
 
 def initialize_pipeline():
     """Function to initialize or reinitialize the chatbot pipeline."""
-    global pipeline_instance
+    global pipeline_instance, pipeline_initializing
     with pipeline_lock:
+        pipeline_initializing = True
         try:
-            logger.info("Initializing chatbot pipeline...")
+            # Imported here so the web server starts without loading llama_index
+            if config.PIPELINE_BACKEND == "stub":
+                from .loadtest import StubPipeline as ChatbotPipeline
+            else:
+                from .pipeline import ChatbotPipeline
+            logger.info(f"Initializing {config.PIPELINE_BACKEND} chatbot pipeline...")
             pipeline_instance = ChatbotPipeline()
             logger.info("ChatbotPipeline initialized successfully")
+            # /ready flips once the models, caches and indices are warm
+            warmup.start(pipeline_instance)
             return True
         except Exception as e:
             logger.error(f"Failed to initialize ChatbotPipeline: {e}")
             pipeline_instance = None
             return False
+        finally:
+            pipeline_initializing = False
 
-initialize_pipeline()
+# Build the pipeline in the background so /health answers immediately
+threading.Thread(target=initialize_pipeline, name="pipeline-init", daemon=True).start()
 
 
 @app.route('/')
@@ -44,11 +67,17 @@ def chat():
     """Handle chat messages from the frontend"""
     global pipeline_instance 
     if not pipeline_instance:
+        if pipeline_initializing:
+            return jsonify({
+                'error': 'Chatbot pipeline is still initializing',
+                'response': 'Sorry, the chatbot is starting up. Please try again shortly.'
+            }), 503
         return jsonify({
             'error': 'Chatbot pipeline not initialized',
             'response': 'Sorry, the chatbot is currently unavailable.'
         }), 500
     
+    request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
     try:
         data = request.get_json()
         question = data.get('message', '').strip()
@@ -59,25 +88,165 @@ def chat():
                 'response': 'Please enter a question.'
             }), 400
         
-        logger.info(f"Processing question: {question}")
-        
-        # Use the global pipeline instance to get the response
-        result = pipeline_instance.query_pipeline.run(input=question)
-        cleaned = re.sub(r'^assistant:\s*', '', str(result), flags=re.IGNORECASE).strip()
-        logger.info(f"Generated response: {cleaned}")
-        
-        return jsonify({
-            'response': cleaned,
-            'status': 'success'
-        })
-        
+        # "data" (opt-in, never guessed from the wording) returns download links for the SQL's
+        # rows instead of a synthesized answer; normal answers carry the same links
+        mode = data.get('mode') or 'answer'
+        if mode not in ('answer', 'data'):
+            return jsonify({
+                'error': f"Unknown mode '{mode}'",
+                'response': "mode must be 'answer' or 'data'."
+            }), 400
+        logger.info(f"Processing question ({mode}): {question}")
+        force_trace = request.headers.get('X-Trace') == '1'
+        # "stream" sends the synthesized answer as NDJSON {"delta": ...} lines while the LLM
+        # generates it, then one line with the usual response fields and "done": true
+        if data.get('stream'):
+            return Response(
+                stream_with_context(_stream_chat(question, data.get('session_id'), mode, request_id, force_trace)),
+                mimetype='application/x-ndjson'
+            )
+        return jsonify(_answer_chat(question, data.get('session_id'), mode, request_id, force_trace))
+
+    except Exception as e:
+        body, status = _chat_error(e, request_id)
+        return jsonify(body), status
+
+def _answer_chat(question, session_id, mode, request_id, force_trace, on_delta=None) -> dict:
+    """Run one chat question through the pipeline and build the success response."""
+    # Use the global pipeline instance to get the response; follow-ups reuse the session's context
+    with tracer.trace(request_id, question, force=force_trace):
+        result = pipeline_instance.run_session_query(question, session_id, data_only=mode == 'data',
+                                                     on_delta=on_delta)
+    cleaned = re.sub(r'^assistant:\s*', '', result['response'], flags=re.IGNORECASE).strip()
+    logger.info(f"Generated response: {cleaned}")
+    # Standalone questions are replayed at the next warm-up; follow-ups depend on their session
+    if mode == 'answer' and not result['followup']:
+        question_log.record(question)
+
+    return {
+        'response': cleaned,
+        'session_id': result['session_id'],
+        'request_id': request_id,
+        'mode': mode,
+        'coalesced': result.get('coalesced', False),
+        'truncated': result.get('truncated', False),
+        'export': _export_links(export_store.add(result['sql_query'], question)) if result.get('sql_query') else None,
+        'status': 'success'
+    }
+
+def _chat_error(e: Exception, request_id: str):
+    """Response body and HTTP status for a failed chat question."""
+    if isinstance(e, SQLValidationError):
+        logger.warning(f"Rejected invalid SQL for question: {e}")
+        return {
+            'status': 'error',
+            'error_type': 'invalid_sql',
+            'error': str(e),
+            'errors': e.errors,
+            'sql_query': e.sql,
+            'request_id': request_id,
+            'response': 'Уучлаарай, энэ асуултад тохирох өгөгдлийн сангийн хүсэлт үүсгэж чадсангүй. Асуултаа өөрөөр томъёолж үзнэ үү.'
+        }, 200
+    error_msg = f"Error processing question: {str(e)}"
+    logger.error(error_msg)
+    return {
+        'error': error_msg,
+        'request_id': request_id,
+        'response': 'Sorry, I encountered an error while processing your question.'
+    }, 500
+
+def _stream_chat(question, session_id, mode, request_id, force_trace):
+    """
+    Yield NDJSON lines for a streamed chat answer. The pipeline runs in a worker
+    thread and hands each synthesis delta over a queue; template answers,
+    data-mode and coalesced runs stream no deltas and arrive whole in the final line.
+    """
+    lines = queue.Queue()
+
+    def run():
+        try:
+            body = _answer_chat(question, session_id, mode, request_id, force_trace,
+                                on_delta=lambda delta: lines.put({'delta': delta}))
+        except Exception as e:
+            body, _ = _chat_error(e, request_id)
+        lines.put({**body, 'done': True})
+
+    threading.Thread(target=run, name=f"chat-{request_id[:8]}", daemon=True).start()
+    while True:
+        line = lines.get()
+        yield json.dumps(line, ensure_ascii=False) + '\n'
+        if line.get('done'):
+            return
+
+def _export_links(export_id: str) -> dict:
+    formats = [f for f in FORMATS if f != 'parquet' or parquet_available()]
+    return {fmt: f'/api/export/{export_id}?format={fmt}' for fmt in formats}
+
+@app.route('/api/export/<export_id>')
+def export_data(export_id):
+    """
+    Stream the rows of a chat answer's SQL as a CSV, JSON or Parquet download,
+    straight from the database cursor. One page of at most EXPORT_PAGE_ROWS
+    rows per request (?offset=, ?limit=); JSON reports the next page's offset.
+    Pages follow a total row order (see export.paginate), so they do not overlap
+    while the underlying data is unchanged.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in FORMATS:
+        return jsonify({'error': f'Unknown format {fmt!r}, expected one of {list(FORMATS)}'}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Parquet export requires pyarrow'}), 400
+    export = export_store.get(export_id)
+    if export is None:
+        return jsonify({'error': f'No export {export_id} (expired or unknown)'}), 404
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', config.EXPORT_PAGE_ROWS, type=int), 1), config.EXPORT_PAGE_ROWS)
+
+    try:
+        batches = open_page(export['sql_query'], offset, limit)
+    except sa_exc.TimeoutError:
+        logger.warning(f"Export {export_id} rejected: all export connections are busy")
+        return jsonify({'error': 'Too many exports in progress, try again shortly'}), 503, {'Retry-After': '5'}
     except Exception as e:
-        error_msg = f"Error processing question: {str(e)}"
-        logger.error(error_msg)
+        logger.error(f"Export {export_id} failed: {e}")
+        return jsonify({'error': f'Export failed: {e}'}), 500
+
+    filename = f"export_{export_id[:8]}{f'_{offset}' if offset else ''}.{fmt}"
+    return Response(
+        stream_with_context(render(fmt, batches, offset, limit)),
+        mimetype=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """
+    Answer many questions in one request. Accepts JSONL (one question or
+    {"id", "question"} object per line) or JSON {"questions": [...]}, and
+    streams one JSON result per line as questions complete.
+    """
+    global pipeline_instance
+    if not pipeline_instance:
         return jsonify({
-            'error': error_msg,
-            'response': 'Sorry, I encountered an error while processing your question.'
-        }), 500
+            'error': 'Chatbot pipeline not initialized',
+            'response': 'Sorry, the chatbot is currently unavailable.'
+        }), 503 if pipeline_initializing else 500
+
+    try:
+        if request.is_json:
+            questions = (request.get_json() or {}).get('questions', [])
+            lines = [q if isinstance(q, str) else json.dumps(q, ensure_ascii=False) for q in questions]
+        else:
+            lines = request.get_data(as_text=True).splitlines()
+        items = parse_questions(lines)
+        if len(items) > config.BATCH_MAX_QUESTIONS:
+            raise ValueError(f"Batch has {len(items)} questions, limit is {config.BATCH_MAX_QUESTIONS}")
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+
+    logger.info(f"Processing batch of {len(items)} questions")
+    results = to_jsonl(BatchRunner(pipeline_instance).run(items))
+    return Response(stream_with_context(results), mimetype='application/x-ndjson')
 
 @app.route('/api/reload_pipeline', methods=['POST'])
 def reload_pipeline():
@@ -100,9 +269,69 @@ def health():
     global pipeline_instance
     return jsonify({
         'status': 'healthy',
-        'pipeline_ready': pipeline_instance is not None
+        'pipeline_ready': pipeline_instance is not None,
+        'pipeline_initializing': pipeline_initializing,
+        'warm': warmup.ready
     })
 
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once the pipeline is built and warmed up, 503 with the progress before"""
+    status = warmup.status()
+    status['pipeline_ready'] = pipeline_instance is not None
+    status['pipeline_initializing'] = pipeline_initializing
+    is_ready = status['pipeline_ready'] and status['ready']
+    return jsonify(status), 200 if is_ready else 503
+
+@app.route('/api/metrics')
+def get_metrics():
+    """In-process counters and timings (cache hit rates, validation, ...)"""
+    snapshot = metrics.snapshot()
+    # Only report pools once the database is in use; this endpoint must not connect
+    if db_manager.initialized:
+        snapshot['db_pools'] = db_manager.pool_stats()
+    return jsonify(snapshot)
+
+def _admin_denied():
+    """Error response for an admin request, or None if it may proceed"""
+    if not config.ADMIN_TOKEN:
+        if config.ADMIN_OPEN:
+            return None
+        # No token configured: the admin endpoints do not exist
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), config.ADMIN_TOKEN):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+@app.route('/api/admin/traces')
+def list_traces():
+    """Most recent kept request traces (sampled or failed)"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    return jsonify({'traces': tracer.recent(request.args.get('limit', 50, type=int))})
+
+@app.route('/api/admin/traces/<request_id>')
+def get_trace(request_id):
+    """Full stage-by-stage trace of one request"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    trace = tracer.get(request_id)
+    if trace is None:
+        return jsonify({'error': f'No trace for request {request_id} (not sampled or expired)'}), 404
+    return jsonify(trace)
+
+@app.route('/api/admin/shards')
+def shard_health():
+    """Health, row counts and latency of each row index shard worker"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if not pipeline_instance:
+        return jsonify({'error': 'Chatbot pipeline not initialized'}), 503
+    return jsonify({table: index.health() for table, index in pipeline_instance.shard_index_dict.items()})
+
 if __name__ == '__main__':
     app.run(
         host='127.0.0.1',
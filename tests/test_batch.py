@@ -0,0 +1,50 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from app.batch import BatchRunner
+
+
+class FakePipeline:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.answered = []
+        self._lock = threading.Lock()
+
+    def auto_refresh_if_needed(self):
+        return False
+
+    def embed_questions(self, questions):
+        return {q: [0.0] for q in questions}
+
+    def _retrieve_tables(self, question):
+        if question == "broken":
+            raise RuntimeError("retrieval failed")
+        return [SimpleNamespace(table_name="t")]
+
+    def answer(self, question, tables, table_contexts, timings):
+        time.sleep(self.delay)
+        with self._lock:
+            self.answered.append(question)
+        return {"response": f"answer to {question}", "sql_query": "SELECT 1", "tables": ["t"]}
+
+
+def items(*questions):
+    return [{"id": i, "question": q} for i, q in enumerate(questions)]
+
+
+def test_retrieval_failure_is_that_question_error_result():
+    results = list(BatchRunner(FakePipeline(), concurrency=2).run(items("a", "broken", "b")))
+    by_id = {r["id"]: r for r in results}
+    assert len(results) == 3
+    assert by_id[1]["status"] == "error" and "retrieval failed" in by_id[1]["error"]
+    assert by_id[0]["status"] == by_id[2]["status"] == "success"
+
+
+def test_closing_the_stream_cancels_questions_not_started():
+    pipeline = FakePipeline(delay=0.05)
+    results = BatchRunner(pipeline, concurrency=2).run(items(*(f"q{i}" for i in range(20))))
+    next(results)
+    results.close()
+    time.sleep(0.2)
+    assert len(pipeline.answered) <= 4
@@ -0,0 +1,22 @@
+from app.export import paginate
+
+
+def test_unordered_query_is_paged_in_whole_row_order():
+    assert paginate("SELECT a, b FROM t;", 20, 10) == (
+        "SELECT * FROM (SELECT a, b FROM t) AS export_page ORDER BY export_page::text LIMIT 11 OFFSET 20"
+    )
+
+
+def test_order_by_gets_every_output_column_as_tiebreak_before_limit():
+    sql = paginate("SELECT a, b * 2 FROM t ORDER BY b DESC LIMIT 5", 0, 10)
+    assert sql == "SELECT * FROM (SELECT a, b * 2 FROM t ORDER BY b DESC, 1, 2 LIMIT 5) AS export_page LIMIT 11 OFFSET 0"
+
+
+def test_nested_order_by_is_not_the_query_order():
+    sql = paginate("SELECT a, row_number() OVER (ORDER BY a) FROM (SELECT a FROM t ORDER BY a) s", 0, 10)
+    assert "ORDER BY export_page::text" in sql
+
+
+def test_select_star_keeps_its_own_order():
+    sql = paginate("SELECT * FROM t ORDER BY a", 0, 10)
+    assert sql == "SELECT * FROM (SELECT * FROM t ORDER BY a) AS export_page LIMIT 11 OFFSET 0"
@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Any
+
+import pytest
+from llama_index.core.llms import (
+    ChatMessage,
+    ChatResponse,
+    CompletionResponse,
+    CustomLLM,
+    LLMMetadata,
+    MessageRole,
+)
+
+from app.llm import LLMManager
+from app.llm_cache import CachedLLM, CompletionCache
+from app.pipeline import ChatbotPipeline
+
+
+class FakeLLM(CustomLLM):
+    down: bool = False
+    calls: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake")
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        raise NotImplementedError
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        raise NotImplementedError
+
+    async def achat(self, messages, **kwargs: Any) -> ChatResponse:
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("backend down")
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content="yes"))
+
+    async def astream_chat(self, messages, **kwargs: Any):
+        async def gen():
+            text = ""
+            for delta in ("Streamed", " answer"):
+                text += delta
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), delta=delta)
+        return gen()
+
+
+@pytest.fixture
+def manager(tmp_path):
+    m = LLMManager.__new__(LLMManager)
+    m._loop = None
+    m._loop_lock = threading.Lock()
+    m.fake = FakeLLM()
+    m.llm = CachedLLM(m.fake, CompletionCache(str(tmp_path / "cache.sqlite"), 2**20))
+    return m
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_healthcheck_bypasses_the_completion_cache(manager):
+    # Prime the cache with the healthcheck prompt through a normal call
+    assert manager.complete("Hello, are you there?", retries=0) == "yes"
+    wait_for(lambda: manager.llm.cache.stats()["entries"] == 1)
+    assert manager.is_available()
+    assert manager.fake.calls == 2
+
+    manager.fake.down = True
+    # A normal call is still served from the cache, the healthcheck is not
+    assert manager.complete("Hello, are you there?", retries=0) == "yes"
+    assert not manager.is_available()
+
+
+def test_synthesis_streams_deltas_through_the_pooled_client(manager, monkeypatch):
+    monkeypatch.setattr("app.pipeline.llm_manager", manager)
+    deltas = []
+    response = ChatbotPipeline._synthesize_response(None, "prompt", on_delta=deltas.append)
+    assert deltas == ["Streamed", " answer"]
+    assert response.message.content == "Streamed answer"
+
+
+def test_cache_io_stays_off_the_llm_event_loop(manager, monkeypatch):
+    cache = manager.llm.cache
+    threads = []
+    get, put = cache.get, cache.put
+    monkeypatch.setattr(cache, "get", lambda key: threads.append(threading.current_thread().name) or get(key))
+    monkeypatch.setattr(cache, "put", lambda key, text: threads.append(threading.current_thread().name) or put(key, text))
+
+    assert manager.complete("question", retries=0) == "yes"
+    wait_for(lambda: len(threads) == 2)
+    assert manager.complete("question", retries=0) == "yes"
+    assert manager.fake.calls == 1
+    assert len(threads) == 3 and "llm-io" not in threads
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.sessions import ChatSession, content_words
+
+
+def tables(*names):
+    return [SimpleNamespace(table_name=n) for n in names]
+
+
+@pytest.fixture
+def session():
+    s = ChatSession("s1")
+    s.remember("2023 онд экспортын нийт дүн хэд вэ?", "SELECT SUM(value) FROM exports WHERE year = 2023",
+               tables("exports"), "schema")
+    return s
+
+
+def test_content_words_drop_fillers_and_literals():
+    assert content_words("2022 онд хэд вэ?") == []
+    assert content_words("What about HS 0101?") == ["about", "hs"]
+    assert content_words("Банкны тоо?") == ["банкны", "тоо"]
+
+
+def test_new_session_has_no_followups():
+    assert not ChatSession("s").is_followup("2022 онд?")
+
+
+@pytest.mark.parametrize("question", ["2022 онд?", "2021 он", "Тэгвэл импорт нь хэд вэ?", "what about 2020"])
+def test_literals_only_or_marker_is_followup(session, question):
+    assert session.is_followup(question)
+
+
+def test_short_question_on_a_new_topic_is_not_followup(session):
+    assert not session.is_followup("Банкны тоо?")
+    assert not session.is_followup("Банкны тоо?", lambda q: tables("banks", "exports"))
+
+
+def test_short_question_on_the_session_table_is_followup(session):
+    assert session.is_followup("Экспортын дүн?", lambda q: tables("exports", "banks"))
+
+
+def test_long_question_is_standalone(session):
+    retrieve = lambda q: pytest.fail("long questions are not checked against retrieval")
+    assert not session.is_followup("2023 онд Монгол улсын импортын нийт дүн хэд байсан бэ?", retrieve)
@@ -0,0 +1,90 @@
+import pytest
+
+from app.config import config
+from app.sql_templates import SQLTemplateCache
+
+EXPORTS_Q = "2023 онд Монгол улсын экспортын нийт дүн хэд байсан бэ?"
+EXPORTS_SQL = "SELECT SUM(value) FROM exports WHERE year = 2023"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SQL_TEMPLATE_CACHE", True)
+    monkeypatch.setattr(config, "SQL_TEMPLATE_MIN_SIMILARITY", 1.0)
+    return SQLTemplateCache(str(tmp_path / "sql_templates.json"))
+
+
+def test_abstract_turns_question_literals_into_slots():
+    pattern, kinds, sql, words = SQLTemplateCache.abstract(
+        "Population of Дорнод in 2020", "SELECT v FROM pop WHERE aimag = 'Дорнод' AND year = 2020 LIMIT 10"
+    )
+    assert kinds == ["text", "number"]
+    assert words == [1, 1]
+    assert pattern == "population of \x000\x00 in \x001\x00"
+    # 10 does not appear in the question, so it stays a literal
+    assert sql == "SELECT v FROM pop WHERE aimag = '{{slot0}}' AND year = {{slot1}} LIMIT 10"
+
+
+def test_abstract_skips_sql_with_slot_markers():
+    assert SQLTemplateCache.abstract("q 1", "SELECT '{{slot0}}'") is None
+
+
+def test_match_fills_exact_pattern(cache):
+    cache.record(EXPORTS_Q, EXPORTS_SQL)
+    assert cache.match("2019 онд Монгол улсын экспортын нийт дүн хэд байсан бэ?") == (
+        "SELECT SUM(value) FROM exports WHERE year = 2019"
+    )
+
+
+def test_text_slot_does_not_absorb_extra_words(cache):
+    cache.record("Population of Дорнод in 2020", "SELECT v FROM pop WHERE aimag = 'Дорнод' AND year = 2020")
+    assert cache.match("Population of Сүхбаатар in 2021") == (
+        "SELECT v FROM pop WHERE aimag = 'Сүхбаатар' AND year = 2021"
+    )
+    assert cache.match("Population of men in Дорнод in 2020") is None
+
+
+def test_text_slot_keeps_its_recorded_word_count(cache):
+    cache.record("Population of Говь-Алтай аймаг in 2020",
+                 "SELECT v FROM pop WHERE aimag = 'Говь-Алтай аймаг' AND year = 2020")
+    assert cache.match("Population of Дорнод аймаг in 2021") == (
+        "SELECT v FROM pop WHERE aimag = 'Дорнод аймаг' AND year = 2021"
+    )
+    assert cache.match("Population of Дорнод in 2021") is None
+
+
+def test_match_rejects_other_text(cache):
+    cache.record(EXPORTS_Q, EXPORTS_SQL)
+    assert cache.match("Монгол улсын экспортын нийт дүн") is None
+
+
+@pytest.mark.parametrize("similarity", [1.0, 0.95, 0.5])
+def test_match_never_swaps_the_subject(cache, monkeypatch, similarity):
+    monkeypatch.setattr(config, "SQL_TEMPLATE_MIN_SIMILARITY", similarity)
+    cache.record(EXPORTS_Q, EXPORTS_SQL)
+    assert cache.match("2020 онд Монгол улсын импортын нийт дүн хэд байсан бэ?") is None
+
+
+def test_near_match_is_off_by_default(cache):
+    cache.record(EXPORTS_Q, EXPORTS_SQL)
+    assert cache.match("2020 онд Монгол улсын экспортын нийт дүн хэд байсан вэ?") is None
+
+
+def test_near_match_allows_stopword_and_punctuation_changes(cache, monkeypatch):
+    monkeypatch.setattr(config, "SQL_TEMPLATE_MIN_SIMILARITY", 0.9)
+    cache.record(EXPORTS_Q, EXPORTS_SQL)
+    assert cache.match("2020 онд Монгол улсын экспортын нийт дүн, хэд байсан вэ?") == (
+        "SELECT SUM(value) FROM exports WHERE year = 2020"
+    )
+
+
+def test_near_matches_compares_content_words(cache, monkeypatch):
+    monkeypatch.setattr(config, "SQL_TEMPLATE_MIN_SIMILARITY", 0.9)
+    cache.record(EXPORTS_Q, EXPORTS_SQL)
+    templates = list(cache.templates.values())
+    near = SQLTemplateCache._near_matches
+    assert near("2021 онд монгол улсын экспортын нийт дүн хэд байсан вэ", templates)[0][1] == ["2021"]
+    assert near("2021 онд монгол улсын импортын нийт дүн хэд байсан вэ", templates) == []
+    assert near("2021 онд монгол улсын экспортын дүн хэд байсан вэ", templates) == []
+    # Numbers must all map to slots
+    assert near("2021 онд 5 монгол улсын экспортын нийт дүн хэд байсан вэ", templates) == []
@@ -0,0 +1,64 @@
+import pytest
+
+from app.sql_validator import SchemaCatalog, SQLValidator
+
+CATALOG = SchemaCatalog({
+    "trade": ["period", "code", "value", "year", "a", "b"],
+    "banks": ["bank_id", "name", "code"],
+})
+
+
+@pytest.fixture
+def validator():
+    return SQLValidator(CATALOG)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT SUM(value) FROM trade WHERE year = 2023",
+    "SELECT t.value, b.name FROM trade t JOIN banks AS b ON b.code = t.code",
+    "SELECT EXTRACT(EPOCH FROM period) FROM trade",
+    "SELECT EXTRACT(QUARTER FROM period) AS q, SUM(value) FROM trade GROUP BY q",
+    "SELECT extract(dow from period) FROM trade",
+    "SELECT date_part('isodow', period) FROM trade",
+    "SELECT value FROM trade WHERE code = ANY(ARRAY[1, 2])",
+    "SELECT value FROM trade WHERE a IS DISTINCT FROM b",
+    "SELECT value FROM trade WHERE a IS NOT DISTINCT FROM b",
+    "SELECT TRIM(BOTH ' ' FROM code) FROM trade",
+    "SELECT TRIM(LEADING '0' FROM code) FROM banks",
+    "SELECT SUBSTRING(code FROM 1 FOR 2) FROM trade",
+    "SELECT value::numeric FROM trade;",
+    "WITH y AS (SELECT year, SUM(value) AS total FROM trade GROUP BY year) SELECT total FROM y",
+    "SELECT COUNT(*) FROM (SELECT DISTINCT code FROM banks) s",
+])
+def test_valid_sql(validator, sql):
+    assert validator.check(sql) == ("valid", [])
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("", "empty SQL statement"),
+    ("SELECT 1; SELECT 2", "single SQL statement"),
+    ("DELETE FROM trade", "only SELECT queries"),
+    ("WITH x AS (DELETE FROM trade RETURNING *) SELECT * FROM x", "read-only"),
+    ("SELECT value FROM imports", 'table "imports" does not exist'),
+    ("SELECT valeu FROM trade", 'column "valeu" does not exist in trade (did you mean: value?)'),
+    ("SELECT t.nme FROM banks t", 'column "nme" does not exist in table "banks"'),
+    ("SELECT x.value FROM trade t", 'unknown table or alias "x"'),
+    ("SELECT value FROM trade WHERE a IS DISTINCT FROM missing", 'column "missing" does not exist'),
+])
+def test_invalid_sql(validator, sql, expected):
+    verdict, problems = validator.check(sql)
+    assert verdict == "invalid"
+    assert any(expected in p for p in problems), problems
+    assert validator.validate(sql) == problems
+
+
+@pytest.mark.parametrize("sql", [
+    # A capitalised bare word we do not list is more likely a keyword than a column
+    "SELECT value FROM trade WHERE period > NOW() - INTERVAL '1 day' AND code IS NOT UNKNOWNWORD",
+    # Characters outside the tokenizer's grammar
+    "SELECT value FROM trade WHERE code ? 'x'",
+])
+def test_unsure_sql_is_unknown_not_invalid(validator, sql):
+    verdict, problems = validator.check(sql)
+    assert verdict == "unknown" and problems
+    assert validator.validate(sql) == []
@@ -0,0 +1,23 @@
+from app.config import config
+from app.tracing import tracer
+
+
+def test_callable_payload_is_built_only_for_stored_traces(monkeypatch):
+    monkeypatch.setattr(config, "TRACE_ENABLED", True)
+    monkeypatch.setattr(config, "TRACE_MAX_PAYLOAD_CHARS", 10)
+    calls = []
+
+    def payload():
+        calls.append(1)
+        return "x" * 100
+
+    monkeypatch.setattr(config, "TRACE_SAMPLE_RATE", 0.0)
+    with tracer.trace("unsampled"):
+        tracer.event("sql_results", results=payload)
+    assert calls == [] and tracer.get("unsampled") is None
+
+    with tracer.trace("forced", force=True):
+        tracer.event("sql_results", results=payload)
+    event = tracer.get("forced")["events"][0]
+    assert calls == [1]
+    assert event["results"].startswith("x" * 10 + "…")
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from app import web_app
+from app.config import config
+from app.loadtest import StubPipeline
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(config, "STUB_LLM_MS", 0)
+    monkeypatch.setattr(config, "STUB_DB_MS", 0)
+    monkeypatch.setattr(web_app, "pipeline_instance", StubPipeline())
+    monkeypatch.setattr(web_app.question_log, "record", lambda question: None)
+    return web_app.app.test_client()
+
+
+def test_streamed_chat_sends_deltas_then_the_full_answer(client):
+    resp = client.post("/api/chat", json={"message": "hello there", "stream": True})
+    assert resp.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+    *deltas, final = lines
+    assert len(deltas) > 1
+    assert final["done"] and final["status"] == "success"
+    assert "".join(d["delta"] for d in deltas) == final["response"] == "Stub answer to: hello there"
+
+
+def test_streamed_data_mode_arrives_in_the_final_line(client):
+    resp = client.post("/api/chat", json={"message": "hello there", "mode": "data", "stream": True})
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert len(lines) == 1 and lines[0]["done"] and lines[0]["export"]
+
+
+def test_unstreamed_chat_is_one_json_response(client):
+    resp = client.post("/api/chat", json={"message": "hello there"})
+    assert resp.get_json()["response"] == "Stub answer to: hello there"